@@ -12,9 +12,13 @@ import numpy
 import tempfile
 import abc
 from warnings import warn
+import warnings
 import shutil
 import collections
 import pysb.pathfinder as pf
+import pysb.cache
+from concurrent.futures import ProcessPoolExecutor
+import json
 import tokenize
 from pysb.logging import get_logger, EXTENDED_DEBUG
 
@@ -27,6 +31,10 @@ try:
 except ImportError:
     pass
 
+#: Version of the network cache entry format; see :func:`_save_network`
+_NETWORK_CACHE_FORMAT = 2
+_NETWORK_CACHE_NAMESPACE = 'network'
+
 # Alias basestring under Python 3 for forwards compatibility
 try:
     basestring
@@ -205,7 +213,7 @@ class BngBaseInterface(object):
         return self.read_simulation_results_multi([self.base_filename])[0]
 
     @staticmethod
-    def read_simulation_results_multi(base_filenames):
+    def read_simulation_results_multi(base_filenames, num_processors=1):
         """
         Read the results of multiple BNG simulations
 
@@ -214,6 +222,8 @@ class BngBaseInterface(object):
         base_filenames: list of str
             A list of filename stems to read simulation results in from,
             including the full path but not including any file extension.
+        num_processors: int
+            Number of processes to read files with (default: 1)
 
         Returns
         -------
@@ -222,46 +232,101 @@ class BngBaseInterface(object):
             species/observables/expressions on X axis depending on
             simulation type)
         """
-        list_of_yfulls = []
-        for base_filename in base_filenames:
-            names = ['time']
-
-            # Read concentrations data
-            try:
-                cdat_arr = numpy.loadtxt(base_filename + '.cdat', skiprows=1, ndmin=2)
-                # -1 for time column
-                names += ['__s%d' % i for i in range(cdat_arr.shape[1] - 1)]
-            except IOError:
-                cdat_arr = None
-
-            # Read groups data
-            try:
-                with open(base_filename + '.gdat', 'r') as f:
-                    # Exclude \# and time column
-                    names += f.readline().split()[2:]
-                    # Exclude first column (time)
-                    gdat_arr = numpy.loadtxt(f, ndmin=2)
-                    if cdat_arr is None:
-                        cdat_arr = numpy.ndarray((len(gdat_arr), 0))
-                    else:
-                        gdat_arr = gdat_arr[:, 1:]
-            except IOError:
-                if cdat_arr is None:
-                    raise BngInterfaceError('Need at least one of .cdat file or '
-                                            '.gdat file to read simulation '
-                                            'results')
-                gdat_arr = numpy.ndarray((len(cdat_arr), 0))
+        if num_processors == 1 or len(base_filenames) < 2:
+            return [_read_simulation_result(base_filename)
+                    for base_filename in base_filenames]
+        with ProcessPoolExecutor(num_processors) as executor:
+            return list(executor.map(
+                _read_simulation_result, base_filenames,
+                chunksize=max(1, len(base_filenames) // (4 * num_processors))
+            ))
+
+
+def _read_simulation_result(base_filename):
+    """
+    Read the .cdat and/or .gdat results of a BNG simulation
+
+    See :func:`BngFileInterface.read_simulation_results_multi`.
+    """
+    names = ['time']
+
+    # Read concentrations data
+    try:
+        cdat_arr = _read_bng_data_file(base_filename + '.cdat')[1]
+        # -1 for time column
+        names += ['__s%d' % i for i in range(cdat_arr.shape[1] - 1)]
+    except IOError:
+        cdat_arr = None
+
+    # Read groups data
+    try:
+        gdat_names, gdat_arr = _read_bng_data_file(base_filename + '.gdat')
+        # Exclude time column
+        names += gdat_names[1:]
+        if cdat_arr is None:
+            cdat_arr = numpy.ndarray((len(gdat_arr), 0))
+        else:
+            gdat_arr = gdat_arr[:, 1:]
+    except IOError:
+        if cdat_arr is None:
+            raise BngInterfaceError('Need at least one of .cdat file or '
+                                    '.gdat file to read simulation '
+                                    'results')
+        gdat_arr = numpy.ndarray((len(cdat_arr), 0))
+
+    yfull_dtype = list(zip(names, itertools.repeat(float)))
+    yfull = numpy.ndarray(len(cdat_arr), yfull_dtype)
+
+    yfull_view = yfull.view(float).reshape(len(yfull), -1)
+    yfull_view[:, :cdat_arr.shape[1]] = cdat_arr
+    yfull_view[:, cdat_arr.shape[1]:] = gdat_arr
 
-            yfull_dtype = list(zip(names, itertools.repeat(float)))
-            yfull = numpy.ndarray(len(cdat_arr), yfull_dtype)
+    return yfull
 
-            yfull_view = yfull.view(float).reshape(len(yfull), -1)
-            yfull_view[:, :cdat_arr.shape[1]] = cdat_arr
-            yfull_view[:, cdat_arr.shape[1]:] = gdat_arr
 
-            list_of_yfulls.append(yfull)
+# Row end marker for _read_bng_data_file
+_ROW_END = '-1.2345678987654321e300'
 
-        return list_of_yfulls
+
+def _read_bng_data_file(filename):
+    """
+    Read a BNG .cdat or .gdat file
+
+    The numeric data is parsed by a single call to :func:`numpy.fromstring`,
+    which is several times faster than :func:`numpy.loadtxt` on large
+    files. Files which cannot be parsed that way (e.g. with rows of
+    differing lengths, or containing the row end marker value) are passed
+    to :func:`numpy.loadtxt` instead, for its error reporting.
+
+    Returns
+    -------
+    tuple of (list of str, numpy.ndarray)
+        Column names from the header line (excluding the leading ``#``),
+        and the data as a 2D (time points x columns) array
+    """
+    with open(filename, 'r') as f:
+        names = f.readline().split()[1:]
+        data = f.read()
+    data = data.strip()
+    if not data:
+        return names, numpy.ndarray((0, len(names)))
+    n_rows = data.count('\n') + 1
+    n_columns = len(data.split('\n', 1)[0].split())
+    # Mark the end of each row with an unlikely value, so that rows of
+    # differing lengths are detected without splitting the data into lines
+    # (files which contain the value are read by loadtxt)
+    marked = data.replace('\n', ' %s\n' % _ROW_END) + ' ' + _ROW_END
+    with warnings.catch_warnings():
+        # Parsing errors are checked below, via the number of values read
+        warnings.simplefilter('ignore', DeprecationWarning)
+        arr = numpy.fromstring(marked, sep=' ')
+    width = n_columns + 1
+    row_ends = arr == float(_ROW_END)
+    if arr.size != n_rows * width or \
+            numpy.count_nonzero(row_ends) != n_rows or \
+            not numpy.all(row_ends[n_columns::width]):
+        return names, numpy.loadtxt(StringIO(data), ndmin=2)
+    return names, arr.reshape(n_rows, width)[:, :n_columns]
 
 
 class BngConsole(BngBaseInterface):
@@ -697,7 +762,8 @@ def load_equations(model, netfile):
         _parse_netfile(model, f)
 
 
-def generate_equations(model, cleanup=True, verbose=False, **kwargs):
+def generate_equations(model, cleanup=True, verbose=False, cache=True,
+                       **kwargs):
     """
     Generate math expressions for reaction rates and species in a model.
 
@@ -721,6 +787,16 @@ def generate_equations(model, cleanup=True, verbose=False, **kwargs):
         constants from Python's logging module for interpretation of integer
         values. False is equal to the PySB default level (currently WARNING),
         True is equal to DEBUG.
+    cache : bool, optional
+        If True (default), look the network up in the ``network`` namespace
+        of :mod:`pysb.cache` before running BioNetGen, and store newly
+        generated networks there. Entries are keyed on the BNGL model
+        definition (which includes the model's monomers, parameters,
+        initials and rules), the network generation arguments and the
+        BioNetGen installation, so they are shared between processes.
+    **kwargs
+        Additional arguments to BioNetGen's generate_network action, such
+        as `max_iter`.
 
     """
     # only need to do this once
@@ -728,9 +804,88 @@ def generate_equations(model, cleanup=True, verbose=False, **kwargs):
     #   or, use a separate "math model" object to contain ODEs
     if model.reactions:
         return
-    lines = iter(generate_network(model, cleanup=cleanup,
-                                  verbose=verbose, **kwargs).split('\n'))
-    _parse_netfile(model, lines)
+    logger = get_logger(__name__, model=model, log_level=verbose)
+    key = None
+    if cache:
+        try:
+            key = _network_cache_key(model, kwargs)
+            path = pysb.cache.lookup(_NETWORK_CACHE_NAMESPACE, key)
+        except (IOError, OSError) as e:
+            logger.warning('Network cache unavailable: %s', e)
+            key = path = None
+        if path is not None:
+            logger.debug('Using cached reaction network %s', key)
+            _load_network(model, path)
+            return
+    netfile = generate_network(model, cleanup=cleanup, verbose=verbose,
+                               **kwargs)
+    _parse_netfile(model, iter(netfile.split('\n')))
+    if key is not None:
+        try:
+            _save_network(model, key, netfile)
+        except (IOError, OSError) as e:
+            logger.warning('Could not cache reaction network: %s', e)
+
+
+def _network_cache_key(model, generate_network_kwargs):
+    """
+    Cache key for the network generated from a model's BNGL definition
+
+    Parameter values are part of the key: BioNetGen evaluates some of them
+    numerically when writing the network, e.g. compartment volume ratios in
+    reaction rates and derived constant parameters.
+    """
+    bng_path = pf.get_path('bng')
+    return pysb.cache.cache_key(
+        _NETWORK_CACHE_FORMAT, BngGenerator(model).get_content(),
+        sorted(generate_network_kwargs.items()),
+        bng_path, os.path.getmtime(bng_path))
+
+
+def _save_network(model, key, netfile):
+    """
+    Store a parsed network in the cache
+
+    An entry consists of the .net file with its (large) reactions section
+    removed, the ReactionNetwork arrays in compressed numpy format and the
+    network's rate factor and rule tables as JSON.
+    """
+    network = model.reaction_network
+    build_dir = pysb.cache.build_dir(_NETWORK_CACHE_NAMESPACE)
+    try:
+        with open(os.path.join(build_dir, 'network.net'), 'w') as f:
+            in_reactions = False
+            for line in netfile.split('\n'):
+                if 'end reactions' in line:
+                    in_reactions = False
+                if not in_reactions:
+                    f.write(line + '\n')
+                if 'begin reactions' in line:
+                    in_reactions = True
+        numpy.savez_compressed(os.path.join(build_dir, 'network.npz'),
+                               **network.to_arrays())
+        rate_factors = [f.name if isinstance(f, pysb.core.Component)
+                        else repr(float(f)) for f in network.rate_factors]
+        with open(os.path.join(build_dir, 'network.json'), 'w') as f:
+            json.dump({'rate_factors': rate_factors,
+                       'rules': network.rules}, f)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    pysb.cache.publish(_NETWORK_CACHE_NAMESPACE, key, build_dir)
+
+
+def _load_network(model, path):
+    """Load a network stored by :func:`_save_network` into a model"""
+    with open(os.path.join(path, 'network.net'), 'r') as f:
+        _parse_netfile(model, f)
+    with open(os.path.join(path, 'network.json'), 'r') as f:
+        tables = json.load(f)
+    with numpy.load(os.path.join(path, 'network.npz')) as arrays:
+        model.reaction_network = pysb.core.ReactionNetwork.from_arrays(
+            arrays,
+            [_rate_factor(model, t) for t in tables['rate_factors']],
+            tables['rules'])
 
 
 def _parse_netfile(model, lines):
@@ -738,10 +893,11 @@ def _parse_netfile(model, lines):
     try:
         while 'begin parameters' not in next(lines):
             pass
+        par_names = model.components.keys()
         while True:
             line = next(lines)
             if 'end parameters' in line: break
-            _parse_parameter(model, line)
+            _parse_parameter(model, line, par_names)
 
         while 'begin species' not in next(lines):
             pass
@@ -753,19 +909,12 @@ def _parse_netfile(model, lines):
 
         while 'begin reactions' not in next(lines):
             pass
-
-        reaction_cache = {}
-        while True:
-            line = next(lines)
+        reaction_parser = _NetReactionParser(model)
+        for line in lines:
             if 'end reactions' in line: break
-            _parse_reaction(model, line, reaction_cache=reaction_cache)
-        # fix up reactions whose reverse version we saw first
-        for r in model.reactions_bidirectional:
-            if all(r['reverse']):
-                r['reactants'], r['products'] = r['products'], r['reactants']
-                r['rate'] *= -1
-            # now the 'reverse' value is no longer needed
-            del r['reverse']
+            reaction_parser.parse(line)
+        reaction_parser.network.finalize()
+        model.reaction_network = reaction_parser.network
 
         while 'begin groups' not in next(lines):
             pass
@@ -778,9 +927,8 @@ def _parse_netfile(model, lines):
         pass
 
 
-def _parse_parameter(model, line):
+def _parse_parameter(model, line, par_names):
     _, pname, pval, _, ptype = line.strip().split()
-    par_names = model.components.keys()
     if pname not in par_names:
         if ptype == 'Constant' and pname not in model._derived_parameters.keys():
             p = pysb.core.Parameter(pname, pval, _export=False)
@@ -846,56 +994,66 @@ def _parse_species(model, line):
     model.species.append(cp)
 
 
-def _parse_reaction(model, line, reaction_cache):
-    """Parse a 'reaction' line from a BNGL net file."""
-    (number, reactants, products, rate, rule) = line.strip().split(' ', 4)
-    # the -1 is to switch from one-based to zero-based indexing
-    reactants = tuple(int(r) - 1 for r in reactants.split(',') if r != '0')
-    products = tuple(int(p) - 1 for p in products.split(',') if p != '0')
-    rate = rate.rsplit('*')
-    (rule_list, unit_conversion) = re.match(
-        r'#([\w,\(\)]+)(?: unit_conversion=(.*))?\s*$',
-        rule).groups()
-    rule_list = rule_list.split(',')  # BNG lists all rules that generate a rxn
-    # Support new (BNG 2.2.6-stable or greater) and old BNG naming convention
-    # for reverse rules
-    rule_name, is_reverse = zip(*[re.subn('^_reverse_|\(reverse\)$', '', r)
-                                  for r in rule_list])
-    is_reverse = tuple(bool(i) for i in is_reverse)
-    r_names = ['__s%d' % r for r in reactants]
-    rate_param = [model.parameters.get(r) or model.expressions.get(r) or
-                  model._derived_parameters.get(r) or
-                  model._derived_expressions.get(r) or float(r) for r in rate]
-    combined_rate = sympy.Mul(*[sympy.S(t) for t in r_names + rate_param])
-    reaction = {
-        'reactants': reactants,
-        'products': products,
-        'rate': combined_rate,
-        'rule': rule_name,
-        'reverse': is_reverse,
-        }
-    model.reactions.append(reaction)
-    # bidirectional reactions
-    key = (reactants, products)
-    key_reverse = (products, reactants)
-    if key in reaction_cache:
-        reaction_bd = reaction_cache.get(key)
-        reaction_bd['rate'] += combined_rate
-        reaction_bd['rule'] += tuple(r for r in rule_name if r not in
-                                     reaction_bd['rule'])
-    elif key_reverse in reaction_cache:
-        reaction_bd = reaction_cache.get(key_reverse)
-        reaction_bd['reversible'] = True
-        reaction_bd['rate'] -= combined_rate
-        reaction_bd['rule'] += tuple(r for r in rule_name if r not in
-                                     reaction_bd['rule'])
-    else:
-        # make a copy of the reaction dict
-        reaction_bd = dict(reaction)
-        # default to false until we find a matching reverse reaction
-        reaction_bd['reversible'] = False
-        reaction_cache[key] = reaction_bd
-        model.reactions_bidirectional.append(reaction_bd)
+class _NetReactionParser(object):
+    """
+    Streaming parser for the reactions section of a BNG .net file
+
+    Reactions are stored in a compact :class:`pysb.core.ReactionNetwork`,
+    without building any SymPy expressions. Each distinct rate string, rule
+    string and reactant/product list is only parsed once.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.network = pysb.core.ReactionNetwork()
+        self._rates = {}
+        self._rules = {}
+        self._species_lists = {}
+
+    def parse(self, line):
+        """Parse a 'reaction' line from a BNGL net file."""
+        (_, reactants, products, rate, rule) = line.split(None, 4)
+        try:
+            rate_factors = self._rates[rate]
+        except KeyError:
+            rate_factors = self._rates[rate] = [
+                _rate_factor(self.model, t) for t in rate.split('*')]
+        try:
+            rule_name, is_reverse = self._rules[rule]
+        except KeyError:
+            rule_name, is_reverse = self._rules[rule] = self._parse_rule(rule)
+        self.network.add_reaction(self._species_list(reactants),
+                                  self._species_list(products),
+                                  rate_factors, rule_name, is_reverse)
+
+    def _species_list(self, text):
+        try:
+            return self._species_lists[text]
+        except KeyError:
+            # the -1 is to switch from one-based to zero-based indexing
+            species = tuple(int(s) - 1 for s in text.split(',') if s != '0')
+            self._species_lists[text] = species
+            return species
+
+    @staticmethod
+    def _parse_rule(rule):
+        (rule_list, unit_conversion) = re.match(
+            r'#([\w,\(\)]+)(?: unit_conversion=(.*))?\s*$',
+            rule).groups()
+        # BNG lists all rules that generate a rxn
+        rule_list = rule_list.split(',')
+        # Support new (BNG 2.2.6-stable or greater) and old BNG naming
+        # convention for reverse rules
+        rule_name, is_reverse = zip(*[re.subn('^_reverse_|\(reverse\)$', '', r)
+                                      for r in rule_list])
+        return tuple(rule_name), tuple(bool(i) for i in is_reverse)
+
+
+def _rate_factor(model, token):
+    """Look up a component or number in a .net file reaction rate"""
+    return model.parameters.get(token) or \
+        model.expressions.get(token) or \
+        model._derived_parameters.get(token) or \
+        model._derived_expressions.get(token) or float(token)
 
 
 def _parse_group(model, line):
@@ -0,0 +1,273 @@
+"""
+Persistent on-disk cache for expensive, reproducible build artefacts
+
+The cache is a directory tree shared between processes (and hosts, if the
+directory lives on a shared filesystem). It is split into namespaces (e.g.
+``cython`` for compiled ODE kernels), each of which contains one
+subdirectory per entry, named after a content hash of everything which
+determines the entry's contents (see :func:`cache_key`).
+
+Entries are built in a private temporary directory and published with an
+atomic rename, so concurrent builders never observe a partially written
+entry. Each namespace is kept below a maximum size by evicting the least
+recently used entries.
+
+The cache location defaults to ``$XDG_CACHE_HOME/pysb`` (usually
+``~/.cache/pysb``) and can be overridden with the ``PYSB_CACHE_DIR``
+environment variable or by calling :func:`set_cache_dir`. The maximum size
+per namespace can be set with the ``PYSB_CACHE_MAX_SIZE`` environment
+variable (in bytes) or by calling :func:`set_max_size`.
+"""
+
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import tempfile
+import time
+
+#: Default maximum size of each cache namespace, in bytes (1 GiB)
+DEFAULT_MAX_SIZE = 2 ** 30
+
+_cache_config = {}
+
+
+def get_cache_dir(namespace=None):
+    """
+    Gets the currently active cache directory
+
+    Parameters
+    ----------
+    namespace: str, optional
+        If supplied, return the subdirectory for this namespace within the
+        cache directory, creating it if necessary.
+
+    Returns
+    -------
+    The path to the cache directory (or namespace subdirectory). If not
+    previously set with :func:`set_cache_dir`, the ``PYSB_CACHE_DIR``
+    environment variable is used if set, or ``$XDG_CACHE_HOME/pysb``
+    otherwise.
+    """
+    try:
+        cache_dir = _cache_config['dir']
+    except KeyError:
+        cache_dir = os.environ.get('PYSB_CACHE_DIR')
+        if not cache_dir:
+            cache_dir = os.path.join(
+                os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'),
+                'pysb')
+    if namespace is not None:
+        cache_dir = os.path.join(cache_dir, namespace)
+        _makedirs(cache_dir)
+    return cache_dir
+
+
+def set_cache_dir(path):
+    """
+    Sets the cache directory
+
+    Parameters
+    ----------
+    path: str or None
+        Directory to use for the cache. It will be created if it does not
+        exist. Set to None to revert to the default location.
+    """
+    if path is None:
+        _cache_config.pop('dir', None)
+    else:
+        _cache_config['dir'] = os.path.abspath(path)
+
+
+def get_max_size():
+    """
+    Gets the maximum size of each cache namespace, in bytes
+
+    Returns
+    -------
+    The value set by :func:`set_max_size`, or failing that the
+    ``PYSB_CACHE_MAX_SIZE`` environment variable, or
+    :data:`DEFAULT_MAX_SIZE`.
+    """
+    try:
+        return _cache_config['max_size']
+    except KeyError:
+        return int(os.environ.get('PYSB_CACHE_MAX_SIZE', DEFAULT_MAX_SIZE))
+
+
+def set_max_size(max_size):
+    """
+    Sets the maximum size of each cache namespace
+
+    Parameters
+    ----------
+    max_size: int or None
+        Maximum size in bytes. Least recently used entries are evicted when
+        a new entry takes a namespace above this size. Set to None to revert
+        to the default.
+    """
+    if max_size is None:
+        _cache_config.pop('max_size', None)
+    else:
+        _cache_config['max_size'] = int(max_size)
+
+
+def cache_key(*parts):
+    """
+    Build a content-addressed key from the supplied parts
+
+    The parts are converted to strings with :func:`repr`, so they should
+    have a deterministic representation (e.g. strings, numbers, and sorted
+    tuples rather than dicts or sets). The Python implementation and version
+    are always included in the key.
+
+    Returns
+    -------
+    str
+        A hex digest suitable for use as a file name
+    """
+    h = hashlib.sha1()
+    for part in (sys.version, sys.platform) + parts:
+        h.update(repr(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def lookup(namespace, key):
+    """
+    Look up an entry in the cache
+
+    Parameters
+    ----------
+    namespace: str
+        Cache namespace
+    key: str
+        Entry key, usually generated by :func:`cache_key`
+
+    Returns
+    -------
+    The path to the entry's directory, or None if the entry is not cached.
+    A successful lookup marks the entry as recently used.
+    """
+    path = os.path.join(get_cache_dir(namespace), key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        # Read-only cache; treat as a hit regardless
+        pass
+    return path
+
+
+def build_dir(namespace):
+    """
+    Create a private temporary directory in which to build a new entry
+
+    The directory is on the same filesystem as the cache, so that it can be
+    atomically moved into place with :func:`publish`.
+    """
+    return tempfile.mkdtemp(prefix='.tmp-', dir=get_cache_dir(namespace))
+
+
+def publish(namespace, key, path):
+    """
+    Move a fully built entry into the cache
+
+    Parameters
+    ----------
+    namespace: str
+        Cache namespace
+    key: str
+        Entry key, usually generated by :func:`cache_key`
+    path: str
+        Directory containing the entry, usually created by :func:`build_dir`
+
+    Returns
+    -------
+    The path of the published entry. If another process published the same
+    entry first, that entry is kept and ``path`` is discarded.
+    """
+    final_path = os.path.join(get_cache_dir(namespace), key)
+    try:
+        os.rename(path, final_path)
+    except OSError:
+        if not os.path.isdir(final_path):
+            raise
+        shutil.rmtree(path, ignore_errors=True)
+    evict(namespace, keep=key)
+    return final_path
+
+
+def evict(namespace, max_size=None, keep=None):
+    """
+    Remove least recently used entries until the namespace fits in max_size
+
+    Parameters
+    ----------
+    namespace: str
+        Cache namespace
+    max_size: int, optional
+        Maximum total size in bytes. Defaults to :func:`get_max_size`.
+    keep: str, optional
+        Key of an entry which should never be evicted (e.g. one that has
+        just been published)
+    """
+    if max_size is None:
+        max_size = get_max_size()
+    cache_dir = get_cache_dir(namespace)
+    entries = []
+    total_size = 0
+    for key in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        if key.startswith('.tmp-'):
+            # Abandoned builds older than a day are removed unconditionally
+            if mtime < time.time() - 86400:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        size = _dir_size(path)
+        total_size += size
+        if key != keep:
+            entries.append((mtime, size, path))
+    entries.sort()
+    while total_size > max_size and entries:
+        _, size, path = entries.pop(0)
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+
+def clear(namespace=None):
+    """
+    Remove all entries from a cache namespace, or the whole cache
+
+    Parameters
+    ----------
+    namespace: str, optional
+        Namespace to clear. If None, the whole cache directory is removed.
+    """
+    shutil.rmtree(get_cache_dir(namespace), ignore_errors=True)
+
+
+def _dir_size(path):
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
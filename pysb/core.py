@@ -5,6 +5,7 @@ import warnings
 import inspect
 import re
 import collections
+import array
 import weakref
 import copy
 import itertools
@@ -455,6 +456,51 @@ class MultiState(object):
             repr(s) for s in self))
 
 
+class _PatternCache(object):
+    """
+    Least-recently-used cache of representations built from patterns
+
+    Graphs of patterns (see :func:`ComplexPattern._as_graph`) and other
+    derived representations can take far more memory than the patterns
+    themselves, so rather than being stored on each pattern for its whole
+    lifetime, they are kept here. Once there are more than `maxsize`
+    entries, the least recently used are evicted (and rebuilt if needed
+    again). Entries are also dropped when their pattern is garbage collected.
+    A `maxsize` of zero disables caching.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def get(self, pattern, kind, factory):
+        """
+        Return the representation `kind` of pattern, built by factory(pattern)
+        if it is not in the cache
+        """
+        key = (id(pattern), kind)
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0]() is pattern:
+            self._entries[key] = entry
+            return entry[1]
+        value = factory(pattern)
+        if self.maxsize > 0:
+            ref = weakref.ref(pattern,
+                              lambda _, key=key: self._entries.pop(key, None))
+            self._entries[key] = (ref, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_pattern_cache = _PatternCache(maxsize=10000)
+
+
 class MonomerPattern(object):
 
     """
@@ -519,7 +565,6 @@ class MonomerPattern(object):
         self.monomer = monomer
         self.site_conditions = site_conditions
         self.compartment = compartment
-        self._graph = None
         self._tag = None
 
     def is_concrete(self):
@@ -586,10 +631,8 @@ class MonomerPattern(object):
 
         See :func:`ComplexPattern._as_graph` for implementation details
         """
-        if self._graph is None:
-            self._graph = as_complex_pattern(self)._as_graph()
-
-        return self._graph
+        return _pattern_cache.get(
+            self, 'graph', lambda mp: as_complex_pattern(mp)._build_graph())
 
     def __call__(self, conditions=None, **kwargs):
         """Build a new MonomerPattern with updated site conditions. Can be used
@@ -717,7 +760,7 @@ class ComplexPattern(object):
         self.monomer_patterns = monomer_patterns
         self.compartment = compartment
         self.match_once = match_once
-        self._graph = None
+        self._canonical_key = None
         self._tag = None
 
     def is_concrete(self):
@@ -773,20 +816,30 @@ class ComplexPattern(object):
         nodes, but this is not used when checking graph isomorphism (instead,
         node to node object equality is checked).
 
-        The `WILD` keyword should match any bond except the special "no
-        bond" node - as special private `WildTester` function is used for
-        this purpose.
+        Site nodes which are bound (to a partner site, or to anything using
+        the `ANY` keyword or a dangling bond) have a `bound` attribute set
+        to True. When matching a pattern, a bound pattern site only matches a
+        bound site. A `WILD` site has no edge to the "no bond" node, so
+        matches a site whether or not it is bound.
 
         Compartment nodes are tracked and kept unique by the private
         `add_or_get_compartment_node` function, which uses a dictionary to
         track Compartment->node_id mapping.
 
+        Graphs are cached in a bounded least-recently-used cache shared by
+        all patterns (`pysb.core._pattern_cache`), rather than on the
+        pattern itself, so long species lists do not keep a graph alive for
+        every species. Pattern matching without compartments does not use
+        these graphs at all, but a compact array-based representation (see
+        :class:`pysb.pattern._PatternGraph`).
+
         .. [Blinov2006] https://link.springer.com/chapter/10.1007%2F11905455_5
         .. [Faeder2009] https://www.csb.pitt.edu/Faculty/Faeder/Publications/Reprints/Faeder_2009.pdf
         """
-        if self._graph is not None:
-            return self._graph
+        return _pattern_cache.get(self, 'graph', ComplexPattern._build_graph)
 
+    def _build_graph(self):
+        """ Build the graph for :func:`_as_graph` (without caching) """
         NO_BOND = 'NoBond'
 
         def autoinc():
@@ -796,12 +849,6 @@ class ComplexPattern(object):
                 i += 1
         node_count = autoinc()
 
-        class AnyBondTester(object):
-            def __eq__(self, other):
-                return not isinstance(other, Component) and other != NO_BOND
-
-        any_bond_tester = AnyBondTester()
-
         bond_edges = collections.defaultdict(list)
         g = nx.Graph()
         _cpt_nodes = {}
@@ -839,10 +886,8 @@ class ComplexPattern(object):
                     state_or_bond))
 
             if state_or_bond is ANY or bond_num is ANY:
-                bond_num = any_bond_tester
-                any_bond_tester_id = next(node_count)
-                g.add_node(any_bond_tester_id, id=any_bond_tester)
-                g.add_edge(mon_site_id, any_bond_tester_id)
+                bond_num = ANY
+                g.nodes[mon_site_id]['bound'] = True
 
             if state is not None:
                 mon_site_state_id = next(node_count)
@@ -852,8 +897,10 @@ class ComplexPattern(object):
             if bond_num is None:
                 bond_edges[NO_BOND].append(mon_site_id)
             elif isinstance(bond_num, int):
+                g.nodes[mon_site_id]['bound'] = True
                 bond_edges[bond_num].append(mon_site_id)
             elif isinstance(bond_num, list):
+                g.nodes[mon_site_id]['bound'] = True
                 for bond in bond_num:
                     bond_edges[bond].append(mon_site_id)
 
@@ -880,13 +927,9 @@ class ComplexPattern(object):
             for unbound_site in unbound_sites:
                 g.add_edge(unbound_site, no_bond_id)
 
-        # Add bond edges
+        # Add bond edges (a dangling bond is treated as ANY, as the site
+        # is already marked as bound)
         for site_nodes in bond_edges.values():
-            if len(site_nodes) == 1:
-                # Treat dangling bond as WILD
-                any_bond_tester_id = next(node_count)
-                g.add_node(any_bond_tester_id, id=any_bond_tester)
-                g.add_edge(site_nodes[0], any_bond_tester_id)
             for n1, n2 in itertools.combinations(site_nodes, 2):
                 g.add_edge(n1, n2)
 
@@ -896,8 +939,7 @@ class ComplexPattern(object):
                         g.degree(species_cpt_node_id) == 0:
             g.remove_node(species_cpt_node_id)
 
-        self._graph = g
-        return self._graph
+        return g
 
     def is_equivalent_to(self, other):
         """
@@ -917,6 +959,37 @@ class ComplexPattern(object):
 
         return match_complex_pattern(self, other, exact=True)
 
+    def canonical_key(self):
+        """
+        Return a canonical string representation of the pattern
+
+        Two concrete ComplexPatterns are equivalent (see
+        :func:`is_equivalent_to`) if and only if their canonical keys are
+        equal, so the key can be used to look up species in a dictionary
+        instead of testing each candidate for graph isomorphism. The key is
+        written in BioNetGen syntax, with the molecules and bonds numbered in
+        a canonical order. It is calculated on first use and then cached, so
+        the pattern should not be modified afterwards.
+
+        Examples
+        --------
+
+        >>> Model()  # doctest:+ELLIPSIS
+        <Model '_interactive_' ...>
+        >>> Monomer('A', ['b', 's'], {'s': ['u', 'p']})
+        Monomer('A', ['b', 's'], {'s': ['u', 'p']})
+        >>> cp1 = A(b=1, s='u') % A(b=1, s='p')
+        >>> cp2 = A(b=2, s='p') % A(b=2, s='u')
+        >>> cp1.canonical_key()
+        'A(b!1,s~p).A(b!1,s~u)'
+        >>> cp1.canonical_key() == cp2.canonical_key()
+        True
+        """
+        if self._canonical_key is None:
+            from pysb.pattern import _canonical_key
+            self._canonical_key = _canonical_key(self)
+        return self._canonical_key
+
     def matches(self, other):
         """
         Compare another ComplexPattern against this one
@@ -1786,12 +1859,18 @@ class Model(object):
         rate of the reaction ('rate'), tuples of species indexes for the
         reactants and products ('reactants', 'products'), and a bool indicating
         whether the reaction is the reverse component of a bidirectional
-        reaction ('reverse').
+        reaction ('reverse'). When backed by a `reaction_network`, this is
+        a read-only sequence which builds each dict the first time it is
+        accessed.
     reactions_bidirectional : list of dict
         Similar to `reactions` but with only one entry for each bidirectional
         reaction. The fields are identical except 'reverse' is replaced by
         'reversible', a bool indicating whether the reaction is reversible. The
         'rate' is the forward rate minus the reverse rate.
+    reaction_network : ReactionNetwork or None
+        Compact, array-backed storage for `reactions` and
+        `reactions_bidirectional`, which is set when the network is loaded
+        from BioNetGen. None if `reactions` is a plain list.
     annotations : list of Annotation
         Structured annotations of model components. See the Annotation class for
         details.
@@ -1816,6 +1895,9 @@ class Model(object):
         self.annotations = []
         self._odes = OdeView(self)
         self._initial_conditions = InitialConditionsView(self)
+        # Kept across reset_equations() for incremental network generation
+        # (see pysb.netgen)
+        self._network_generator = None
         self.reset_equations()
         #####
         self.diffusivities = []
@@ -1837,6 +1919,8 @@ class Model(object):
         # in a cross-Python-version-compatible way. Since it's regenerated on
         # demand anyway, we can just clear it here.
         state['_stoichiometry_matrix'] = None
+        state['_species_lookup'] = None
+        state['_network_generator'] = None
         return state
 
     def __setstate__(self, state):
@@ -1973,20 +2057,48 @@ class Model(object):
         """Return sympy Expressions for the time derivative of each species."""
         return self._odes
 
+    @property
+    def reaction_network(self):
+        """
+        The ReactionNetwork backing `reactions`, or None
+
+        Setting this property replaces `reactions` and
+        `reactions_bidirectional` with read-only views of the network.
+        """
+        return getattr(self.reactions, 'network', None)
+
+    @reaction_network.setter
+    def reaction_network(self, network):
+        self.reactions = _ReactionList(network)
+        self.reactions_bidirectional = _BidirectionalReactionList(network)
+        self._stoichiometry_matrix = None
+
     @property
     def stoichiometry_matrix(self):
         """Return the stoichiometry matrix for the reaction network."""
         if self._stoichiometry_matrix is None:
-            shape = (len(self.species), len(self.reactions))
-            sm = scipy.sparse.lil_matrix(shape, dtype='int')
-            for i, reaction in enumerate(self.reactions):
-                for r in reaction['reactants']:
-                    sm[r, i] -= 1
-                for p in reaction['products']:
-                    sm[p, i] += 1
             fixed = [i for i, ic in enumerate(self.initials) if ic.fixed]
-            sm[fixed, :] = 0
-            self._stoichiometry_matrix = sm.tocsr()
+            network = self.reaction_network
+            if network is not None:
+                n_species = len(self.species)
+                sm = (network.product_matrix(n_species) -
+                      network.reactant_matrix(n_species)).T
+                mask = np.ones(n_species, dtype=int)
+                mask[fixed] = 0
+                sm = scipy.sparse.diags(mask, dtype=int).dot(sm).tocsr()
+                sm.eliminate_zeros()
+                sm.sort_indices()
+            else:
+                shape = (len(self.species), len(self.reactions))
+                sm = scipy.sparse.lil_matrix(shape, dtype='int')
+                for i, reaction in enumerate(self.reactions):
+                    for r in reaction['reactants']:
+                        sm[r, i] -= 1
+                    for p in reaction['products']:
+                        sm[p, i] += 1
+                sm[fixed, :] = 0
+                sm = sm.tocsr()
+            self._stoichiometry_matrix = sm
         return self._stoichiometry_matrix
 
     def add_component(self, other):
@@ -2113,11 +2225,26 @@ class Model(object):
             A concrete pattern specifying the species to find.
 
         """
-        # FIXME I don't even want to think about the inefficiency of this, but at least it works
-        try:
-            return next((i for i, s_cp in enumerate(self.species) if s_cp.is_equivalent_to(complex_pattern)))
-        except StopIteration:
-            return None
+        complex_pattern = as_complex_pattern(complex_pattern)
+        return self._species_keys().get(complex_pattern.canonical_key())
+
+    def _species_keys(self):
+        """
+        Return a dict mapping species canonical keys to species indexes
+
+        The dict is updated incrementally as species are appended to
+        `species`, and rebuilt if `species` is replaced.
+        """
+        species = self.species
+        lookup = getattr(self, '_species_lookup', None)
+        if lookup is None or lookup[0] is not species or \
+                lookup[1] > len(species):
+            lookup = (species, 0, {})
+        _, n_indexed, keys = lookup
+        for i in range(n_indexed, len(species)):
+            keys.setdefault(species[i].canonical_key(), i)
+        self._species_lookup = (species, len(species), keys)
+        return keys
 
     def has_synth_deg(self):
         """Return true if model uses synthesis or degradation reactions."""
@@ -2133,6 +2260,7 @@ class Model(object):
         self.species = []
         self.reactions = []
         self.reactions_bidirectional = []
+        self._species_lookup = None
         self._stoichiometry_matrix = None
         self._derived_parameters = ComponentSet()
         self._derived_expressions = ComponentSet()
@@ -2484,6 +2612,305 @@ class InitialConditionsView(collections.Sequence):
         return len(self.model.initials)
 
 
+class ReactionNetwork(object):
+    """
+    Compact, array-backed storage for a model's reaction network
+
+    Reactions are stored in integer arrays rather than as dicts of tuples
+    and SymPy expressions. Assigning a network to
+    :attr:`Model.reaction_network` makes `Model.reactions` and
+    `Model.reactions_bidirectional` read-only views of it, which build each
+    reaction dict (including its rate expression) the first time it is
+    accessed. Structural queries such as :attr:`Model.stoichiometry_matrix`
+    are computed from the arrays directly.
+
+    Reactions are added with :meth:`add_reaction`, which also groups them
+    into bidirectional reactions. :meth:`finalize` must be called once all
+    reactions have been added.
+
+    Attributes
+    ----------
+    reactant_ptr, reactant_idx : numpy.ndarray
+        Reactant species indexes in compressed sparse row form: the
+        reactants of reaction i are
+        ``reactant_idx[reactant_ptr[i]:reactant_ptr[i + 1]]``.
+    product_ptr, product_idx : numpy.ndarray
+        Product species indexes, in the same form.
+    rate_ptr, rate_idx : numpy.ndarray
+        Indexes into `rate_factors`, in the same form. A reaction's rate is
+        the product of its reactant species and its rate factors.
+    rate_factors : list
+        Distinct factors (Parameters, Expressions and numbers) of the
+        reaction rate constants.
+    rule_id : numpy.ndarray
+        Index into `rules` for each reaction.
+    rules : list of tuple
+        Distinct (rule names, is_reverse flags) pairs, as found in the
+        'rule' and 'reverse' fields of the reaction dicts.
+    bd_id : numpy.ndarray
+        Index of the bidirectional reaction to which each reaction belongs.
+    bd_reverse : numpy.ndarray
+        Whether each reaction runs in the opposite direction to the first
+        reaction in its bidirectional reaction.
+    bd_ptr, bd_rxn : numpy.ndarray
+        The reactions making up each bidirectional reaction, in compressed
+        sparse row form.
+    """
+    _arrays = ('reactant_ptr', 'reactant_idx', 'product_ptr', 'product_idx',
+               'rate_ptr', 'rate_idx', 'rule_id', 'bd_id')
+
+    def __init__(self):
+        for attr in self._arrays:
+            setattr(self, attr, array.array('i'))
+        for attr in ('reactant_ptr', 'product_ptr', 'rate_ptr'):
+            getattr(self, attr).append(0)
+        self.bd_reverse = array.array('b')
+        self.bd_ptr = None
+        self.bd_rxn = None
+        self.rate_factors = []
+        self.rules = []
+        self._rate_factor_ids = {}
+        self._rule_ids = {}
+        self._bd_ids = {}
+
+    def __len__(self):
+        return len(self.rule_id)
+
+    @property
+    def n_bidirectional(self):
+        """Number of bidirectional reactions"""
+        return len(self.bd_ptr) - 1 if self.bd_ptr is not None else \
+            len(self._bd_ids)
+
+    def add_reaction(self, reactants, products, rate_factors, rule, reverse):
+        """
+        Append a reaction to the network
+
+        Parameters
+        ----------
+        reactants, products : tuple of int
+            Reactant and product species indexes
+        rate_factors : list
+            Factors of the rate constant (Parameters, Expressions or numbers)
+        rule : tuple of str
+            Names of the rules which generate the reaction
+        reverse : tuple of bool
+            Whether the reaction is the reverse of each rule
+        """
+        self.reactant_idx.extend(reactants)
+        self.reactant_ptr.append(len(self.reactant_idx))
+        self.product_idx.extend(products)
+        self.product_ptr.append(len(self.product_idx))
+        for factor in rate_factors:
+            try:
+                self.rate_idx.append(self._rate_factor_ids[factor])
+            except KeyError:
+                self._rate_factor_ids[factor] = len(self.rate_factors)
+                self.rate_idx.append(len(self.rate_factors))
+                self.rate_factors.append(sympy.S(factor))
+        self.rate_ptr.append(len(self.rate_idx))
+        rule = (rule, reverse)
+        try:
+            self.rule_id.append(self._rule_ids[rule])
+        except KeyError:
+            self._rule_ids[rule] = len(self.rules)
+            self.rule_id.append(len(self.rules))
+            self.rules.append(rule)
+        # bidirectional reactions
+        key = (reactants, products)
+        key_reverse = (products, reactants)
+        if key in self._bd_ids:
+            self.bd_id.append(self._bd_ids[key])
+            self.bd_reverse.append(False)
+        elif key_reverse in self._bd_ids:
+            self.bd_id.append(self._bd_ids[key_reverse])
+            self.bd_reverse.append(True)
+        else:
+            self._bd_ids[key] = len(self._bd_ids)
+            self.bd_id.append(self._bd_ids[key])
+            self.bd_reverse.append(False)
+
+    def finalize(self):
+        """Convert the network to numpy arrays once all reactions are added"""
+        for attr in self._arrays:
+            setattr(self, attr, np.frombuffer(getattr(self, attr),
+                                              dtype=np.intc))
+        self.bd_reverse = np.frombuffer(self.bd_reverse,
+                                        dtype=np.int8).astype(bool)
+        self._index_bidirectional()
+
+    def to_arrays(self):
+        """
+        Return the network's integer arrays, e.g. for saving with numpy.savez
+
+        The `rate_factors` and `rules` tables must be saved separately.
+        """
+        return {attr: getattr(self, attr)
+                for attr in self._arrays + ('bd_reverse', )}
+
+    @classmethod
+    def from_arrays(cls, arrays, rate_factors, rules):
+        """
+        Create a network from arrays returned by :meth:`to_arrays`
+
+        Parameters
+        ----------
+        arrays : mapping
+            Arrays keyed by name, as returned by :meth:`to_arrays`
+        rate_factors : list
+            Rate constant factors (Parameters, Expressions or numbers)
+        rules : list
+            (rule names, is_reverse flags) pairs
+        """
+        network = cls()
+        for attr in cls._arrays:
+            setattr(network, attr, np.asarray(arrays[attr], dtype=np.intc))
+        network.bd_reverse = np.asarray(arrays['bd_reverse'], dtype=bool)
+        network.rate_factors = [sympy.S(f) for f in rate_factors]
+        network.rules = [(tuple(str(r) for r in names),
+                          tuple(bool(r) for r in reverse))
+                         for names, reverse in rules]
+        network._index_bidirectional()
+        return network
+
+    def _index_bidirectional(self):
+        self.bd_rxn = np.argsort(self.bd_id, kind='mergesort')
+        self.bd_ptr = np.concatenate(([0], np.cumsum(np.bincount(
+            self.bd_id, minlength=self.bd_id.max() + 1 if len(self) else 0))))
+        for attr in self._arrays + ('bd_reverse', 'bd_rxn', 'bd_ptr'):
+            getattr(self, attr).flags.writeable = False
+        # These are only needed while reactions are being added
+        self._rate_factor_ids = self._rule_ids = self._bd_ids = None
+
+    def reactants(self, i):
+        """Reactant species indexes of reaction i, as a tuple"""
+        return tuple(self.reactant_idx[
+            self.reactant_ptr[i]:self.reactant_ptr[i + 1]].tolist())
+
+    def products(self, i):
+        """Product species indexes of reaction i, as a tuple"""
+        return tuple(self.product_idx[
+            self.product_ptr[i]:self.product_ptr[i + 1]].tolist())
+
+    def rate(self, i):
+        """Build the SymPy rate expression of reaction i"""
+        factors = [sympy.Symbol('__s%d' % s) for s in self.reactants(i)]
+        factors.extend(self.rate_factors[f] for f in self.rate_idx[
+            self.rate_ptr[i]:self.rate_ptr[i + 1]])
+        return sympy.Mul(*factors)
+
+    def reaction(self, i):
+        """Build the dict for reaction i, as found in Model.reactions"""
+        rule_name, is_reverse = self.rules[self.rule_id[i]]
+        return {
+            'reactants': self.reactants(i),
+            'products': self.products(i),
+            'rate': self.rate(i),
+            'rule': rule_name,
+            'reverse': is_reverse,
+        }
+
+    def reaction_bidirectional(self, j):
+        """
+        Build the dict for bidirectional reaction j, as found in
+        Model.reactions_bidirectional
+        """
+        members = self.bd_rxn[self.bd_ptr[j]:self.bd_ptr[j + 1]]
+        first = members[0]
+        rule_name, is_reverse = self.rules[self.rule_id[first]]
+        rates = []
+        for i in members:
+            rate = self.rate(i)
+            rates.append(-rate if self.bd_reverse[i] else rate)
+            for r in self.rules[self.rule_id[i]][0]:
+                if r not in rule_name:
+                    rule_name += (r, )
+        rate = sympy.Add(*rates)
+        reactants, products = self.reactants(first), self.products(first)
+        # use the forward direction when the reverse reaction came first
+        if all(is_reverse):
+            reactants, products = products, reactants
+            rate *= -1
+        return {
+            'reactants': reactants,
+            'products': products,
+            'rate': rate,
+            'rule': rule_name,
+            'reversible': bool(self.bd_reverse[members].any()),
+        }
+
+    def reactant_matrix(self, n_species):
+        """
+        Return the number of each species consumed by each reaction
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Integer matrix of shape (reactions, species)
+        """
+        return self._count_matrix(self.reactant_ptr, self.reactant_idx,
+                                  n_species)
+
+    def product_matrix(self, n_species):
+        """
+        Return the number of each species produced by each reaction
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Integer matrix of shape (reactions, species)
+        """
+        return self._count_matrix(self.product_ptr, self.product_idx,
+                                  n_species)
+
+    def _count_matrix(self, ptr, idx, n_species):
+        m = scipy.sparse.csr_matrix(
+            (np.ones(len(idx), dtype=int), idx, ptr),
+            shape=(len(self), n_species), copy=True)
+        m.sum_duplicates()
+        return m
+
+
+class _ReactionList(collections.Sequence):
+    """
+    Read-only list of reaction dicts, built on demand from a ReactionNetwork
+
+    Each reaction's dict is built the first time it is accessed, then
+    cached, so repeated accesses return the same dict.
+    """
+    def __init__(self, network):
+        self.network = network
+        self._cache = [None] * len(self)
+
+    def __len__(self):
+        return len(self.network)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[k] for k in range(*key.indices(len(self)))]
+        rxn = self._cache[key]
+        if rxn is None:
+            if key < 0:
+                key += len(self)
+            rxn = self._cache[key] = self._build(key)
+        return rxn
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _build(self, i):
+        return self.network.reaction(i)
+
+
+class _BidirectionalReactionList(_ReactionList):
+    """Read-only list of bidirectional reaction dicts, built on demand"""
+    def __len__(self):
+        return self.network.n_bidirectional
+
+    def _build(self, i):
+        return self.network.reaction_bidirectional(i)
+
+
 class ComponentDuplicateNameError(ValueError):
     """A component was added with the same name as an existing one."""
     pass
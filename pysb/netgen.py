@@ -0,0 +1,965 @@
+"""
+Native reaction network generation
+
+This module expands a model's rules into a reaction network in-process,
+without calling BioNetGen. Rule reactant patterns are compiled into search
+plans by :mod:`pysb.pattern` and matched against compact representations of
+the species, and the network is built in the same way as BioNetGen's
+``generate_network`` action:
+
+* each iteration applies the rules, in order (forward then reverse
+  direction), to the species which existed at the start of the iteration,
+  only considering reactant combinations which involve a species not yet
+  processed by an earlier iteration;
+* new species are appended to the species list as they are found;
+* identical reactions with equivalent rates are merged, summing their
+  statistical factors, which are calculated from the symmetries of each rule
+  as in BioNetGen.
+
+The resulting species are therefore numbered as BioNetGen would number them
+(ties between different matches of a pattern to a single species aside), and
+the reactions have the same rates. Generation stops when an iteration produces
+no new species, or after `max_iter` iterations.
+
+The generator is kept with the model, so after :func:`Model.reset_equations
+<pysb.core.Model.reset_equations>` the network is regenerated incrementally:
+
+* parameter values are not part of the network (reaction rates refer to the
+  rate Parameters and Expressions), so when only parameter values have
+  changed the previous network is reused as it is;
+* the reactions of rules which have been removed or changed are dropped,
+  along with any species no longer reachable from the initial species;
+* rules which have been added are applied to the existing species, and
+  generation continues from any new species.
+
+The species keep their indexes, apart from shifting down over any species
+which are dropped. The result is the same network as a fresh generation (up
+to the order of species and reactions, and identical reactions from
+different iterations being merged) provided generation runs to completion
+rather than stopping at `max_iter`. Changing the monomers, or the generation
+arguments, starts again from scratch.
+
+Compartments, MultiState (duplicate) sites, local functions (tags) and
+`move_connected` are not supported.
+
+Examples
+--------
+
+>>> from pysb.examples.bngwiki_simple import model
+>>> from pysb.netgen import generate_equations
+>>> generate_equations(model)
+>>> len(model.species), len(model.reactions)
+(3, 2)
+"""
+
+import collections
+import itertools
+import math
+from pysb.core import ANY, WILD, Monomer, MonomerPattern, ComplexPattern, \
+    Expression, ReactionNetwork, as_complex_pattern
+from pysb.logging import get_logger
+from pysb.pattern import SpeciesPatternMatcher, _CompiledPattern, \
+    _PatternGraph
+
+try:
+    basestring
+except NameError:
+    # Under Python 3, do not pretend that bytes are a valid string
+    basestring = str
+
+def generate_equations(model, max_iter=100, max_agg=None, max_stoich=None,
+                       verbose=False, incremental=True):
+    """
+    Generate a model's species, reactions and observables in-process
+
+    A native alternative to :func:`pysb.bng.generate_equations`, which fills
+    in the same fields of the model.
+
+    Parameters
+    ----------
+    model : Model
+        Model whose rules are expanded.
+    max_iter : int, optional
+        Maximum number of rule application iterations.
+    max_agg : int, optional
+        Maximum number of molecules in a species. Reactions producing larger
+        species are discarded.
+    max_stoich : dict, optional
+        Maximum number of each monomer (keyed by Monomer or monomer name) in
+        a species. Reactions producing species exceeding a limit are
+        discarded.
+    verbose : bool or int, optional (default: False)
+        Sets the verbosity level of the logger. See the logging levels and
+        constants from Python's logging module for interpretation of integer
+        values. False is equal to the PySB default level (currently WARNING),
+        True is equal to DEBUG.
+    incremental : bool, optional
+        If True (default), update the network generated by a previous call
+        (with the same arguments) to match the model's current rules and
+        initials, rather than generating it from scratch. See the module
+        documentation for details.
+    """
+    if model.reactions:
+        return
+    generator = getattr(model, '_network_generator', None)
+    if not incremental or generator is None or \
+            not generator._same_settings(max_iter, max_agg, max_stoich):
+        generator = NetworkGenerator(model, max_iter=max_iter,
+                                     max_agg=max_agg, max_stoich=max_stoich,
+                                     verbose=verbose)
+        model._network_generator = generator
+    generator.generate()
+
+
+class NetworkGenerator(object):
+    """
+    Expand a model's rules into a reaction network
+
+    Parameters
+    ----------
+    model : Model
+        Model whose rules are expanded.
+    max_iter, max_agg, max_stoich, verbose
+        See :func:`generate_equations`.
+
+    Attributes
+    ----------
+    species : list of ComplexPattern
+        The species found so far, in order of discovery.
+    """
+    def __init__(self, model, max_iter=100, max_agg=None, max_stoich=None,
+                 verbose=False):
+        _check_model(model)
+        self.model = model
+        self.max_iter = max_iter
+        self.max_agg = max_agg
+        self.max_stoich = _max_stoich_by_name(max_stoich)
+        self._logger = get_logger(__name__, model=model, log_level=verbose)
+        self._reset()
+
+    def _reset(self):
+        """Forget any network generated previously"""
+        self.species = []
+        self._graphs = []
+        self._pattern_graphs = []
+        self._species_index = {}
+        self._reactions = []
+        self._reaction_index = {}
+        self._rules = []
+        self._monomers = None
+        self._n_processed = 0
+
+    def _same_settings(self, max_iter, max_agg, max_stoich):
+        return (max_iter, max_agg, _max_stoich_by_name(max_stoich)) == \
+            (self.max_iter, self.max_agg, self.max_stoich)
+
+    def generate(self):
+        """
+        Generate the network and store it in the model
+
+        Sets the model's species, reaction network and observable species
+        and coefficients. If the generator has already been run, the
+        network is updated incrementally (see the module documentation).
+        """
+        _check_model(self.model)
+        if self._monomers is not None and self._monomers_changed():
+            self._logger.debug('Monomers changed, regenerating network')
+            self._reset()
+        if self._monomers is None:
+            for rule in self.model.rules:
+                self._rules.append(_DirectedRule(rule, False))
+                if rule.is_reversible:
+                    self._rules.append(_DirectedRule(rule, True))
+            for initial in self.model.initials:
+                self._add_species(_decompose(as_complex_pattern(
+                    initial.pattern)))
+            self._logger.debug('Iteration 0: %d species', len(self.species))
+            self._iterate(first=True)
+        else:
+            self._update()
+        self._monomers = [(monomer, repr(monomer))
+                          for monomer in self.model.monomers]
+
+        network = ReactionNetwork()
+        for reaction in self._reactions:
+            rate_factors = [reaction.rate]
+            stat_factor = sum(reaction.rule_factors.values())
+            if stat_factor != 1:
+                rate_factors.insert(0, stat_factor)
+            rules, reverse = zip(*reaction.rule_factors)
+            network.add_reaction(reaction.reactants, reaction.products,
+                                 rate_factors, rules, reverse)
+        network.finalize()
+        self.model.species = list(self.species)
+        self.model.reaction_network = network
+        self._match_observables()
+
+    def _iterate(self, first=False):
+        """Apply the rules to new species until no more are found"""
+        for n_iter in range(1, self.max_iter + 1):
+            n_species = len(self.species)
+            new_species = range(self._n_processed, n_species)
+            # Reactions are only merged with others from the same iteration,
+            # as in BioNetGen
+            self._reaction_index = {}
+            for rule in self._rules:
+                if first and n_iter == 1 and not rule.reactants:
+                    self._build_reaction(rule, ())
+                self._expand_rule(rule, new_species)
+            self._n_processed = n_species
+            self._logger.debug('Iteration %d: %d species, %d reactions',
+                               n_iter, len(self.species),
+                               len(self._reactions))
+            if len(self.species) == n_species:
+                break
+
+    def _monomers_changed(self):
+        monomers = dict((id(monomer), monomer)
+                        for monomer in self.model.monomers)
+        return any(monomers.get(id(monomer)) is not monomer or
+                   repr(monomer) != monomer_repr
+                   for monomer, monomer_repr in self._monomers)
+
+    def _update(self):
+        """Bring the network up to date with the model's rules and initials"""
+        model_rules = dict((id(rule), rule) for rule in self.model.rules)
+        kept = {}
+        removed = set()
+        for rule in self._rules:
+            model_rule = model_rules.get(id(rule.rule))
+            if model_rule is not None and rule.unchanged(model_rule):
+                kept[(id(model_rule), rule.reverse)] = rule
+            else:
+                removed.add((rule.name, rule.reverse))
+        self._rules = []
+        added = []
+        for model_rule in self.model.rules:
+            for reverse in (False, True) if model_rule.is_reversible else \
+                    (False, ):
+                rule = kept.get((id(model_rule), reverse))
+                if rule is None:
+                    rule = _DirectedRule(model_rule, reverse)
+                    added.append(rule)
+                self._rules.append(rule)
+        self._logger.debug('Updating network: %d rules removed, %d added',
+                           len(removed), len(added))
+
+        # Drop the contributions of removed rules to each reaction
+        if removed:
+            reactions = []
+            for reaction in self._reactions:
+                for rule_key in removed.intersection(reaction.rule_factors):
+                    del reaction.rule_factors[rule_key]
+                if reaction.rule_factors:
+                    reactions.append(reaction)
+            self._reactions = reactions
+
+        seeds = [self._add_species(_decompose(as_complex_pattern(
+            initial.pattern))) for initial in self.model.initials]
+        self._prune(seeds)
+
+        # Apply added rules to the species processed so far, then carry on
+        # from any species which have not been processed yet
+        self._reaction_index = {}
+        processed = range(self._n_processed)
+        for rule in added:
+            if not rule.reactants:
+                self._build_reaction(rule, ())
+            self._expand_rule(rule, processed)
+        self._iterate()
+
+    def _prune(self, seeds):
+        """
+        Drop species which are no longer reachable from the seed species,
+        and the reactions which consume them
+        """
+        consumers = collections.defaultdict(list)
+        missing = []
+        queue = collections.deque(seeds)
+        for n, reaction in enumerate(self._reactions):
+            reactants = set(reaction.reactants)
+            missing.append(len(reactants))
+            for sp in reactants:
+                consumers[sp].append(n)
+            if not reactants:
+                queue.extend(reaction.products)
+        reachable = set()
+        while queue:
+            sp = queue.popleft()
+            if sp in reachable:
+                continue
+            reachable.add(sp)
+            for n in consumers[sp]:
+                missing[n] -= 1
+                if not missing[n]:
+                    queue.extend(self._reactions[n].products)
+        if len(reachable) == len(self.species):
+            return
+
+        keep = sorted(reachable)
+        self._logger.debug('Dropping %d unreachable species',
+                           len(self.species) - len(keep))
+        index = dict((sp, n) for n, sp in enumerate(keep))
+        self.species = [self.species[sp] for sp in keep]
+        self._graphs = [self._graphs[sp] for sp in keep]
+        self._pattern_graphs = [self._pattern_graphs[sp] for sp in keep]
+        self._species_index = dict((cp.canonical_key(), n)
+                                   for n, cp in enumerate(self.species))
+        self._n_processed = sum(1 for sp in keep if sp < self._n_processed)
+        reactions = []
+        for reaction, n_missing in zip(self._reactions, missing):
+            if not n_missing:
+                reaction.reactants = tuple(index[sp]
+                                           for sp in reaction.reactants)
+                reaction.products = tuple(index[sp]
+                                          for sp in reaction.products)
+                reactions.append(reaction)
+        self._reactions = reactions
+        for rule in self._rules:
+            rule.matches = [[(index[sp], match) for sp, match in matches
+                             if sp in index] for matches in rule.matches]
+
+    def _expand_rule(self, rule, new_species):
+        """Apply a rule to all combinations of reactants involving new ones"""
+        for ipatt in reversed(range(len(rule.reactants))):
+            new_matches = []
+            for sp in new_species:
+                new_matches.extend((sp, m) for m in self._embeddings(
+                    rule, ipatt, sp))
+            # Earlier patterns use old matches only, later ones old and new,
+            # so that each combination is generated once
+            lists = rule.matches[:ipatt] + [new_matches] + \
+                rule.matches[ipatt + 1:]
+            for instance in itertools.product(*lists):
+                self._build_reaction(rule, instance)
+            rule.matches[ipatt].extend(new_matches)
+
+    def _embeddings(self, rule, ipatt, sp):
+        """
+        Find the matches of a rule reactant pattern to a species
+
+        Returns a list of tuples giving the species molecule matched by each
+        molecule of the pattern. Matches with the same reaction center image
+        are redundant and only the first of them is kept (or only the first
+        match of all, for MatchOnce patterns).
+        """
+        pattern = rule.reactants[ipatt]
+        center = rule.center[ipatt]
+        matches = []
+        images = set()
+        # Matches are processed in the same order as in BioNetGen
+        all_matches = set(rule.compiled[ipatt].embeddings(
+            self._pattern_graphs[sp]))
+        for match in sorted(all_matches):
+            image = tuple(_center_image(element, match) for element in center)
+            if image not in images:
+                images.add(image)
+                matches.append(match)
+                if pattern.match_once:
+                    break
+        return matches
+
+    def _build_reaction(self, rule, instance):
+        """Apply a rule to a combination of matches and store the reaction"""
+        products = self._apply_rule(rule, instance)
+        if products is None:
+            return
+        product_species = []
+        for graph in products:
+            monomers = graph[0]
+            if self.max_agg is not None and len(monomers) > self.max_agg:
+                return
+            if self.max_stoich:
+                counts = collections.Counter(m.name for m in monomers)
+                for name, limit in self.max_stoich.items():
+                    if counts[name] > limit:
+                        return
+            product_species.append(self._add_species(graph))
+        # As in BioNetGen, reactants and products are sorted for elementary
+        # rate laws, and keep the order of the rule's patterns for
+        # functional ones; reactions are identified regardless of order
+        reactants = tuple(sp for sp, _ in instance)
+        products = tuple(product_species)
+        key = (tuple(sorted(reactants)), tuple(sorted(products)))
+        if key[0] == key[1]:
+            return
+        if rule.elementary:
+            reactants, products = key
+        rule_key = (rule.name, rule.reverse)
+        for reaction in self._reaction_index.get(key, ()):
+            if reaction.rate is rule.rate:
+                reaction.rule_factors[rule_key] = \
+                    reaction.rule_factors.get(rule_key, 0) + rule.mult_scale
+                return
+        reaction = _Reaction(reactants, products, rule.rate,
+                             collections.OrderedDict([(rule_key,
+                                                       rule.mult_scale)]))
+        self._reactions.append(reaction)
+        self._reaction_index.setdefault(key, []).append(reaction)
+
+    def _apply_rule(self, rule, instance):
+        """
+        Apply a rule's operations to a combination of matches
+
+        Returns the product species graphs, or None if the rule does not
+        produce valid products.
+        """
+        monomers = []
+        states = []
+        bonds = {}
+        offsets = []
+        for sp, _ in instance:
+            sp_monomers, sp_states, sp_bonds = self._graphs[sp]
+            offset = len(monomers)
+            offsets.append(offset)
+            monomers.extend(sp_monomers)
+            states.extend(dict(s) for s in sp_states)
+            for (i, site), (j, site2) in sp_bonds.items():
+                bonds[(i + offset, site)] = (j + offset, site2)
+
+        def target(r):
+            ipatt, imol = rule.r_position[r]
+            return offsets[ipatt] + instance[ipatt][1][imol]
+
+        for r, site, state in rule.state_changes:
+            states[target(r)][site] = state
+        for end1, end2 in rule.edge_del:
+            bonds.pop((target(end1[0]), end1[1]), None)
+            bonds.pop((target(end2[0]), end2[1]), None)
+        added = {}
+        for q, monomer, mol_states in rule.mol_add:
+            added[q] = len(monomers)
+            monomers.append(monomer)
+            states.append(dict(mol_states))
+
+        def product_target(q):
+            r = rule.map_r[q]
+            return target(r) if r >= 0 else added[q]
+
+        for (q1, site1), (q2, site2) in rule.edge_add:
+            end1 = (product_target(q1), site1)
+            end2 = (product_target(q2), site2)
+            bonds[end1] = end2
+            bonds[end2] = end1
+        deleted = set(target(r) for r in rule.mol_del)
+        for ipatt in rule.species_del:
+            n_mols = len(self._graphs[instance[ipatt][0]][0])
+            deleted.update(range(offsets[ipatt], offsets[ipatt] + n_mols))
+
+        # Molecules of the same product pattern must end up in the same
+        # product, and each product pattern in a separate one
+        product_pattern = [None] * len(monomers)
+        for r, q in enumerate(rule.map_f):
+            if q >= 0:
+                product_pattern[target(r)] = rule.p_position[q][0]
+        for q, i in added.items():
+            product_pattern[i] = rule.p_position[q][0]
+        neighbours = collections.defaultdict(list)
+        for (i, _), (j, _) in bonds.items():
+            if i not in deleted and j not in deleted:
+                neighbours[i].append(j)
+
+        n_patterns = len(rule.products)
+        components = [None] * n_patterns
+        extra = []
+        visited = set(deleted)
+        for i in range(len(monomers)):
+            if i in visited:
+                continue
+            component = []
+            stack = [i]
+            visited.add(i)
+            while stack:
+                j = stack.pop()
+                component.append(j)
+                for k in neighbours[j]:
+                    if k not in visited:
+                        visited.add(k)
+                        stack.append(k)
+            ipatts = set(product_pattern[j] for j in component)
+            ipatts.discard(None)
+            if len(ipatts) > 1:
+                return None
+            elif ipatts:
+                ipatt = ipatts.pop()
+                if components[ipatt] is not None:
+                    return None
+                components[ipatt] = component
+            else:
+                extra.append(component)
+        if None in components or (extra and not rule.delete_molecules):
+            return None
+
+        products = []
+        for component in components + extra:
+            component.sort()
+            index = {j: n for n, j in enumerate(component)}
+            product_bonds = {}
+            for j in component:
+                for site in states[j]:
+                    partner = bonds.get((j, site))
+                    if partner is not None and partner[0] in index:
+                        product_bonds[(index[j], site)] = \
+                            (index[partner[0]], partner[1])
+            products.append(([monomers[j] for j in component],
+                             [states[j] for j in component], product_bonds))
+        return products
+
+    def _add_species(self, graph):
+        """Return the index of a species, adding it if it is new"""
+        graph = _sort_molecules(*graph)
+        cp = _compose(*graph)
+        sp = self._species_index.setdefault(cp.canonical_key(),
+                                            len(self.species))
+        if sp < len(self.species):
+            return sp
+        self.species.append(cp)
+        self._graphs.append(graph)
+        self._pattern_graphs.append(_PatternGraph(cp))
+        return sp
+
+    def _match_observables(self):
+        """Set the species and coefficients of the model's observables"""
+        if not self.species:
+            return
+        spm = SpeciesPatternMatcher(self.model, self.species)
+        spm._species_graphs.update(enumerate(self._pattern_graphs))
+        for obs, (species, coefficients) in \
+                spm.match_observables().items():
+            obs.species = species
+            obs.coefficients = coefficients
+
+
+class _Reaction(object):
+    """
+    A reaction found during network generation
+
+    The statistical factor is the sum of the contributions of each (rule
+    name, reverse) in rule_factors.
+    """
+    __slots__ = ('reactants', 'products', 'rate', 'rule_factors')
+
+    def __init__(self, reactants, products, rate, rule_factors):
+        self.reactants = reactants
+        self.products = products
+        self.rate = rate
+        self.rule_factors = rule_factors
+
+
+class _DirectedRule(object):
+    """
+    A rule in one direction, compiled into graph operations
+
+    Reactant and product molecules are numbered consecutively across the
+    rule's patterns ("aggregate" indexes). As in BioNetGen, a reactant
+    molecule corresponds to the product molecule of the same monomer with
+    the same sites listed, in order of appearance.
+    """
+    def __init__(self, rule, reverse):
+        self.rule = rule
+        self.signature = repr(rule)
+        self.name = rule.name
+        self.reverse = reverse
+        self.delete_molecules = rule.delete_molecules
+        if reverse:
+            self.rate = rule.rate_reverse
+            reactants, products = rule.product_pattern, rule.reactant_pattern
+        else:
+            self.rate = rule.rate_forward
+            reactants, products = rule.reactant_pattern, rule.product_pattern
+        # Rates given by dynamic expressions are functions in BioNetGen
+        self.elementary = not isinstance(self.rate, Expression) or \
+            self.rate.is_constant_expression()
+        self.reactants = [cp for cp in reactants.complex_patterns
+                          if cp is not None]
+        self.products = [cp for cp in products.complex_patterns
+                         if cp is not None]
+        self.compiled = [_CompiledPattern(cp) for cp in self.reactants]
+        self.matches = [[] for _ in self.reactants]
+
+        r_mols, r_conds, r_bonds = _aggregate(self.reactants)
+        p_mols, p_conds, p_bonds = _aggregate(self.products)
+        self.r_position = [pos for pos, _ in r_mols]
+        self.p_position = [pos for pos, _ in p_mols]
+        self._map_molecules(r_mols, p_mols)
+        self._find_operations(r_mols, r_conds, r_bonds, p_mols, p_conds,
+                              p_bonds, rule)
+        self._find_reaction_center()
+        self.mult_scale = self._symmetry_factor(r_mols, r_conds, r_bonds,
+                                                p_mols, p_conds, p_bonds)
+
+    def unchanged(self, rule):
+        """Whether this still describes a (possibly edited) model rule"""
+        rate = rule.rate_reverse if self.reverse else rule.rate_forward
+        return rule is self.rule and rate is self.rate and \
+            repr(rule) == self.signature
+
+    def _map_molecules(self, r_mols, p_mols):
+        def labels(mols):
+            seen = collections.Counter()
+            result = []
+            for _, mp in mols:
+                label = (mp.monomer, tuple(sorted(mp.site_conditions)))
+                seen[label] += 1
+                result.append(label + (seen[label], ))
+            return result
+        p_labels = {label: q for q, label in enumerate(labels(p_mols))}
+        self.map_f = [p_labels.get(label, -1) for label in labels(r_mols)]
+        self.map_r = [-1] * len(p_mols)
+        for r, q in enumerate(self.map_f):
+            if q >= 0:
+                self.map_r[q] = r
+
+    def _find_operations(self, r_mols, r_conds, r_bonds, p_mols, p_conds,
+                         p_bonds, rule):
+        self.state_changes = []
+        for r, q in enumerate(self.map_f):
+            if q < 0:
+                continue
+            for site, (r_state, r_bond) in r_conds[r].items():
+                p_state, p_bond = p_conds[q][site]
+                if r_state != p_state:
+                    if r_state is None or p_state is None:
+                        raise ValueError(
+                            'Rule "{}": state of site {} of monomer {} must '
+                            'be given on both sides of the rule'.format(
+                                rule.name, site, r_mols[r][1].monomer.name))
+                    self.state_changes.append((r, site, p_state))
+                if (r_bond in (ANY, WILD) or p_bond in (ANY, WILD)) and \
+                        r_bond is not p_bond:
+                    raise NotImplementedError(
+                        'Rule "{}": ANY or WILD bonds on site {} of monomer '
+                        '{} must be the same on both sides of the '
+                        'rule'.format(rule.name, site,
+                                      r_mols[r][1].monomer.name))
+
+        r_edges = _edges(r_bonds)
+        p_edges = _edges(p_bonds)
+        # Edges are compared in reactant space; product molecules without a
+        # reactant counterpart are given negative indexes
+        p_edges_r = set(frozenset((self.map_r[q], site) if self.map_r[q] >= 0
+                                  else (-1 - q, site) for q, site in edge)
+                        for edge in p_edges)
+        self.edge_del = []
+        for edge in sorted(r_edges, key=sorted):
+            if edge not in p_edges_r and any(
+                    self.map_f[r] >= 0 for r, _ in edge):
+                self.edge_del.append(tuple(sorted(edge)))
+        r_edges_p = set(frozenset((self.map_f[r], site) if self.map_f[r] >= 0
+                                  else (-1 - r, site) for r, site in edge)
+                        for edge in r_edges)
+        self.edge_add = [tuple(sorted(edge))
+                         for edge in sorted(p_edges, key=sorted)
+                         if edge not in r_edges_p]
+
+        self.mol_add = []
+        for q, r in enumerate(self.map_r):
+            if r >= 0:
+                continue
+            monomer = p_mols[q][1].monomer
+            states = {}
+            for site in monomer.sites:
+                state, bond = p_conds[q].get(site, (None, None))
+                if bond is ANY or bond is WILD:
+                    raise ValueError(
+                        'Rule "{}": synthesized monomer {} cannot have ANY '
+                        'or WILD bonds'.format(rule.name, monomer.name))
+                if state is None and site in monomer.site_states:
+                    state = monomer.site_states[site][0]
+                states[site] = state
+            self.mol_add.append((q, monomer, states))
+
+        self.mol_del = []
+        self.species_del = []
+        for ipatt, cp in enumerate(self.reactants):
+            mols = [r for r, (pos, _) in enumerate(r_mols)
+                    if pos[0] == ipatt]
+            unmapped = [r for r in mols if self.map_f[r] < 0]
+            if len(unmapped) == len(mols) and not self.delete_molecules:
+                self.species_del.append(ipatt)
+            else:
+                self.mol_del.extend(unmapped)
+
+    def _find_reaction_center(self):
+        """Find the molecules and sites each reactant pattern changes"""
+        center = [set() for _ in self.reactants]
+
+        def add_site(r, site):
+            ipatt, imol = self.r_position[r]
+            center[ipatt].add((imol, site))
+
+        for edge in self.edge_del:
+            for r, site in edge:
+                add_site(r, site)
+        for edge in self.edge_add:
+            for q, site in edge:
+                if self.map_r[q] >= 0:
+                    add_site(self.map_r[q], site)
+        for r, site, _ in self.state_changes:
+            add_site(r, site)
+        for r in self.mol_del:
+            add_site(r, None)
+        for ipatt in self.species_del:
+            center[ipatt].add((-1, None))
+        self.center = [sorted(c, key=repr) for c in center]
+
+    def _symmetry_factor(self, r_mols, r_conds, r_bonds, p_mols, p_conds,
+                         p_bonds):
+        """
+        Calculate the rule's statistical factor, as in BioNetGen
+
+        The factor is 1 / [RG:Stab] / C, where RG is the group of reactant
+        automorphisms which induce a product automorphism, Stab is the
+        subgroup of RG which fixes the reaction center and C is the number of
+        permutations of identical reactant patterns with no reaction center.
+        """
+        p_auts = set(_automorphisms(p_mols, p_conds, p_bonds))
+        rule_group = []
+        for aut in _automorphisms(r_mols, r_conds, r_bonds):
+            induced = list(range(len(self.p_position)))
+            for r, q in enumerate(self.map_f):
+                if (q < 0) != (self.map_f[aut[r]] < 0):
+                    break
+                if q >= 0:
+                    induced[q] = self.map_f[aut[r]]
+            else:
+                if tuple(induced) in p_auts:
+                    rule_group.append(aut)
+
+        offsets = [self.r_position.index((ipatt, 0))
+                   for ipatt in range(len(self.reactants))]
+        def fixes_center(aut):
+            for ipatt, center in enumerate(self.center):
+                r0 = offsets[ipatt]
+                for imol, _ in center:
+                    if imol < 0:
+                        if self.r_position[aut[r0]][0] != ipatt:
+                            return False
+                    elif aut[r0 + imol] != r0 + imol:
+                        return False
+            return True
+
+        n_stab = sum(1 for aut in rule_group if fixes_center(aut))
+
+        context = [cp for cp, center in zip(self.reactants, self.center)
+                   if not center]
+        n_context_perms = 1
+        while context:
+            cp = context.pop()
+            n_identical = 1
+            for other in list(context):
+                if cp.canonical_key() == other.canonical_key():
+                    context.remove(other)
+                    n_identical += 1
+            n_context_perms *= math.factorial(n_identical)
+
+        return float(n_stab) / len(rule_group) / n_context_perms
+
+
+def _max_stoich_by_name(max_stoich):
+    """Key a max_stoich dict by monomer name"""
+    return dict((monomer.name if isinstance(monomer, Monomer) else monomer,
+                 limit) for monomer, limit in (max_stoich or {}).items())
+
+
+def _center_image(element, match):
+    """Map a reaction center element onto a species"""
+    imol, site = element
+    return (match[imol], site) if imol >= 0 else element
+
+
+def _split_condition(cond):
+    """Split a site condition into a (state, bond) pair"""
+    if cond is None or isinstance(cond, int) or cond is ANY or cond is WILD:
+        return None, cond
+    if isinstance(cond, basestring):
+        return cond, None
+    if isinstance(cond, tuple) and len(cond) == 2:
+        return cond
+    raise NotImplementedError('Unsupported site condition: {!r}'.format(cond))
+
+
+def _aggregate(cps):
+    """
+    Flatten a list of ComplexPatterns
+
+    Returns ((pattern index, molecule index), MonomerPattern) pairs, the
+    split site conditions of each molecule and the bonds between
+    (molecule, site) pairs.
+    """
+    mols = []
+    conds = []
+    bonds = {}
+    for ipatt, cp in enumerate(cps):
+        ends = collections.defaultdict(list)
+        for imol, mp in enumerate(cp.monomer_patterns):
+            mol_conds = {}
+            for site, cond in mp.site_conditions.items():
+                mol_conds[site] = state, bond = _split_condition(cond)
+                if isinstance(bond, int):
+                    ends[bond].append((len(mols), site))
+            mols.append(((ipatt, imol), mp))
+            conds.append(mol_conds)
+        for end1, end2 in ends.values():
+            bonds[end1] = end2
+            bonds[end2] = end1
+    return mols, conds, bonds
+
+
+def _edges(bonds):
+    return set(frozenset((end1, end2)) for end1, end2 in bonds.items())
+
+
+def _automorphisms(mols, conds, bonds):
+    """
+    Enumerate the automorphisms of a list of patterns
+
+    Automorphisms permute molecules with identical site conditions,
+    preserving bonds and mapping the molecules of each pattern onto a single
+    pattern. They are returned as tuples giving the image of each molecule.
+    """
+    def signature(i):
+        return mols[i][1].monomer, tuple(sorted(
+            ((site, state, 'bond' if isinstance(bond, int) else bond)
+             for site, (state, bond) in conds[i].items()), key=repr))
+
+    n = len(conds)
+    signatures = [signature(i) for i in range(n)]
+    image = [None] * n
+    used = [False] * n
+    pattern_map = {}
+
+    def consistent(i):
+        for site in conds[i]:
+            partner = bonds.get((i, site))
+            if partner is None or image[partner[0]] is None:
+                continue
+            if bonds.get((image[i], site)) != (image[partner[0]], partner[1]):
+                return False
+        return True
+
+    def extend(i):
+        if i == n:
+            yield tuple(image)
+            return
+        ipatt = mols[i][0][0]
+        for j in range(n):
+            if used[j] or signatures[j] != signatures[i]:
+                continue
+            jpatt = mols[j][0][0]
+            if pattern_map.get(ipatt, jpatt) != jpatt:
+                continue
+            new_pattern = ipatt not in pattern_map
+            if new_pattern:
+                if jpatt in pattern_map.values():
+                    continue
+                pattern_map[ipatt] = jpatt
+            image[i] = j
+            used[j] = True
+            if consistent(i):
+                for aut in extend(i + 1):
+                    yield aut
+            image[i] = None
+            used[j] = False
+            if new_pattern:
+                del pattern_map[ipatt]
+
+    return list(extend(0))
+
+
+def _decompose(cp):
+    """Convert a concrete ComplexPattern to (monomers, states, bonds)"""
+    monomers = []
+    states = []
+    ends = collections.defaultdict(list)
+    for i, mp in enumerate(cp.monomer_patterns):
+        mol_states = {}
+        for site in mp.monomer.sites:
+            state, bond = _split_condition(mp.site_conditions.get(site))
+            if bond is ANY or bond is WILD:
+                raise ValueError('Species {} is not concrete'.format(cp))
+            if bond is not None:
+                ends[bond].append((i, site))
+            mol_states[site] = state
+        monomers.append(mp.monomer)
+        states.append(mol_states)
+    bonds = {}
+    for end1, end2 in ends.values():
+        bonds[end1] = end2
+        bonds[end2] = end1
+    return monomers, states, bonds
+
+
+def _compose(monomers, states, bonds):
+    """Convert (monomers, states, bonds) to a ComplexPattern"""
+    bond_numbers = {}
+    mps = []
+    for i, (monomer, mol_states) in enumerate(zip(monomers, states)):
+        site_conditions = {}
+        for site in monomer.sites:
+            state = mol_states[site]
+            partner = bonds.get((i, site))
+            bond = None
+            if partner is not None:
+                bond = bond_numbers.setdefault(
+                    tuple(sorted(((i, site), partner))),
+                    len(bond_numbers) + 1)
+            if state is None:
+                site_conditions[site] = bond
+            elif bond is None:
+                site_conditions[site] = state
+            else:
+                site_conditions[site] = (state, bond)
+        mps.append(MonomerPattern(monomer, site_conditions, None))
+    return ComplexPattern(mps, None)
+
+
+def _sort_molecules(monomers, states, bonds):
+    """
+    Put a species' molecules in BioNetGen's canonical order
+
+    Molecules are sorted by monomer name, number of sites and then site
+    names, states and whether each site is bound (bound sites first). Ties
+    are kept in their original order.
+    """
+    def key(i):
+        return monomers[i].name, len(states[i]), sorted(
+            (site, (0, '') if state is None else (1, state),
+             (i, site) not in bonds)
+            for site, state in states[i].items())
+    order = sorted(range(len(monomers)), key=key)
+    if order == list(range(len(monomers))):
+        return monomers, states, bonds
+    position = {i: n for n, i in enumerate(order)}
+    return ([monomers[i] for i in order], [states[i] for i in order],
+            {(position[i], site): (position[j], site2)
+             for (i, site), (j, site2) in bonds.items()})
+
+
+def _check_model(model):
+    """Raise an error if a model uses unsupported features"""
+    if model.compartments:
+        raise NotImplementedError('Compartments are not supported by native '
+                                  'network generation')
+    for monomer in model.monomers:
+        if len(set(monomer.sites)) != len(monomer.sites):
+            raise NotImplementedError(
+                'Monomer {} has duplicate sites (MultiState), which are not '
+                'supported by native network generation'.format(monomer.name))
+    for rule in model.rules:
+        if rule.move_connected:
+            raise NotImplementedError(
+                'Rule "{}": move_connected is not supported by native '
+                'network generation'.format(rule.name))
+        for rate in (rule.rate_forward, rule.rate_reverse):
+            if isinstance(rate, Expression) and rate.tags():
+                raise NotImplementedError(
+                    'Rule "{}": local functions are not supported by native '
+                    'network generation'.format(rule.name))
+        for rp in (rule.reactant_pattern, rule.product_pattern):
+            for cp in rp.complex_patterns:
+                if cp is not None and (cp._tag or any(
+                        mp._tag for mp in cp.monomer_patterns)):
+                    raise NotImplementedError(
+                        'Rule "{}": tags are not supported by native network '
+                        'generation'.format(rule.name))
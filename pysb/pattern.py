@@ -1,12 +1,16 @@
+import array
 import collections
+import itertools
+import math
 from .core import ComplexPattern, MonomerPattern, Monomer, \
-    ReactionPattern, ANY, as_complex_pattern, DanglingBondError, Rule
+    ReactionPattern, ANY, WILD, MultiState, as_complex_pattern, \
+    DanglingBondError, Rule, _pattern_cache
 import networkx as nx
 from networkx.algorithms.isomorphism.vf2userfunc import GraphMatcher
-from networkx.algorithms.isomorphism import categorical_node_match
 import numpy as np
 from abc import ABCMeta, abstractmethod
 import re
+from concurrent.futures import ProcessPoolExecutor
 try:
     basestring
 except NameError:
@@ -256,25 +260,513 @@ def check_dangling_bonds(pattern):
                                 .format(dangling_bonds, pattern))
 
 
+def _node_match(candidate_node, pattern_node):
+    """ Node matcher for pattern graphs (bound sites only match bound) """
+    return candidate_node['id'] == pattern_node['id'] and (
+        candidate_node.get('bound', False) or
+        not pattern_node.get('bound', False))
+
+
 def _match_graphs(pattern, candidate, exact, count):
     """ Compare two pattern graphs for isomorphism """
-    node_matcher = categorical_node_match('id', default=None)
     if exact:
-        match = nx.is_isomorphic(pattern._as_graph(),
-                                 candidate._as_graph(),
-                                 node_match=node_matcher)
+        match = pattern.canonical_key() == candidate.canonical_key()
         return 1 if count else match
     else:
+        # Monomorphisms, rather than induced subgraph isomorphisms, as the
+        # candidate may have edges between matched nodes which the pattern
+        # leaves unspecified (e.g. a bond to the "no bond" node at a WILD
+        # site)
         gm = GraphMatcher(
             candidate._as_graph(), pattern._as_graph(),
-            node_match=node_matcher
+            node_match=_node_match
         )
         if count:
             if pattern.match_once:
-                return 1 if gm.subgraph_is_isomorphic() else 0
-            return sum(1 for _ in gm.subgraph_isomorphisms_iter())
+                return 1 if gm.subgraph_is_monomorphic() else 0
+            return sum(1 for _ in gm.subgraph_monomorphisms_iter())
         else:
-            return gm.subgraph_is_isomorphic()
+            return gm.subgraph_is_monomorphic()
+
+
+def _canonical_key(cp):
+    """
+    Build a canonical string for a ComplexPattern (see
+    :func:`pysb.core.ComplexPattern.canonical_key`)
+
+    The pattern is represented as a graph with a node for each molecule,
+    labelled by its monomer, compartment and unbound sites, and an edge for
+    each bond, labelled by the sites (and their states) at either end. The
+    nodes are put in a canonical order by colour refinement (1-dimensional
+    Weisfeiler-Lehman), and any ties which remain, which are due to
+    symmetries, are broken by individualising each candidate node in turn and
+    keeping the ordering with the smallest encoding of the bonds. Branches
+    equivalent under an automorphism already found are pruned.
+
+    The string is written in BioNetGen syntax, with the molecules in the
+    canonical order and the bonds numbered in order of appearance.
+    """
+    labels = []
+    unbound_sites = []
+    bond_ends = collections.defaultdict(list)
+    for i, mp in enumerate(cp.monomer_patterns):
+        mol_sites = []
+        for site, condition in mp.site_conditions.items():
+            if not isinstance(condition, MultiState):
+                condition = (condition, )
+            for site_condition in condition:
+                state, bond = _split_site_condition(site_condition)
+                state = state or ''
+                if isinstance(bond, list):
+                    for bond_num in bond:
+                        bond_ends[bond_num].append((i, (site, state)))
+                else:
+                    mol_sites.append(
+                        (site, state, '' if bond is None else
+                         '!+' if bond is ANY else '!?'))
+        compartment = mp.compartment or cp.compartment
+        labels.append((mp.monomer.name,
+                       compartment.name if compartment else ''))
+        unbound_sites.append(mol_sites)
+
+    edges = []
+    adjacency = [[] for _ in labels]
+    for ends in bond_ends.values():
+        if len(ends) == 1:
+            # Treat dangling bond as ANY
+            i, (site, state) = ends[0]
+            unbound_sites[i].append((site, state, '!+'))
+            continue
+        for (i, end_i), (j, end_j) in itertools.combinations(ends, 2):
+            edges.append((i, end_i, j, end_j))
+            adjacency[i].append((end_i, end_j, j))
+            adjacency[j].append((end_j, end_i, i))
+    labels = [label + (tuple(sorted(mol_sites)), )
+              for label, mol_sites in zip(labels, unbound_sites)]
+
+    ranks = {label: r for r, label in enumerate(sorted(set(labels)))}
+    search = _CanonicalSearch(adjacency, edges)
+    search.run([ranks[label] for label in labels], [])
+    encoding, order = search.best
+
+    mol_sites = [list(unbound_sites[i]) for i in order]
+    for bond_num, (pos_i, (site_i, state_i), pos_j, (site_j, state_j)) in \
+            enumerate(encoding, 1):
+        mol_sites[pos_i].append((site_i, state_i, '!%d' % bond_num))
+        mol_sites[pos_j].append((site_j, state_j, '!%d' % bond_num))
+    molecules = []
+    for i, sites in zip(order, mol_sites):
+        monomer, compartment = labels[i][:2]
+        molecules.append('{}({}){}'.format(
+            monomer,
+            ','.join(site + ('~' + state if state else '') + bond
+                     for site, state, bond in sorted(sites)),
+            '@' + compartment if compartment else ''))
+    return '.'.join(molecules)
+
+
+class _CanonicalSearch(object):
+    """ Search tree for the canonical ordering of a pattern's molecules """
+    def __init__(self, adjacency, edges):
+        self.adjacency = adjacency
+        self.edges = edges
+        self.best = None
+        self.automorphisms = []
+
+    def refine(self, colors):
+        """ Refine node colours until no colour class is split further """
+        n_colors = len(set(colors))
+        while True:
+            signatures = [
+                (colors[v], tuple(sorted((end_v, end_w, colors[w])
+                                         for end_v, end_w, w in neighbours)))
+                for v, neighbours in enumerate(self.adjacency)]
+            ranks = {sig: r for r, sig in enumerate(sorted(set(signatures)))}
+            colors = [ranks[sig] for sig in signatures]
+            if len(ranks) == n_colors:
+                return colors
+            n_colors = len(ranks)
+
+    def run(self, colors, path):
+        colors = self.refine(colors)
+        n = len(colors)
+        cell_sizes = collections.Counter(colors)
+        if len(cell_sizes) == n:
+            self._leaf(colors)
+            return
+        # Branch on the first colour class with more than one member
+        target = min(c for c, size in cell_sizes.items() if size > 1)
+        explored = []
+        for v in range(n):
+            if colors[v] != target:
+                continue
+            if explored and v in self._orbits(explored, path):
+                continue
+            explored.append(v)
+            self.run([2 * c + (c == target and u != v)
+                      for u, c in enumerate(colors)], path + [v])
+
+    def _leaf(self, colors):
+        order = sorted(range(len(colors)), key=colors.__getitem__)
+        encoding = []
+        for i, end_i, j, end_j in self.edges:
+            bond = (colors[i], end_i), (colors[j], end_j)
+            encoding.append(bond[0] + bond[1] if bond[0] <= bond[1] else
+                            bond[1] + bond[0])
+        encoding = tuple(sorted(encoding))
+        if self.best is None or encoding < self.best[0]:
+            self.best = (encoding, order)
+        elif encoding == self.best[0]:
+            automorphism = [None] * len(order)
+            for v, w in zip(self.best[1], order):
+                automorphism[v] = w
+            self.automorphisms.append(automorphism)
+
+    def _orbits(self, nodes, path):
+        """ Nodes reachable by automorphisms which fix the search path """
+        generators = [g for g in self.automorphisms
+                      if all(g[p] == p for p in path)]
+        orbit = set(nodes)
+        frontier = list(nodes)
+        while frontier:
+            v = frontier.pop()
+            for g in generators:
+                if g[v] not in orbit:
+                    orbit.add(g[v])
+                    frontier.append(g[v])
+        return orbit
+
+
+def _split_site_condition(site_condition):
+    """ Split a site condition into state and bond (as a list if bonded) """
+    if isinstance(site_condition, tuple):
+        state, bond = site_condition
+    elif isinstance(site_condition, basestring):
+        state, bond = site_condition, None
+    else:
+        state, bond = None, site_condition
+    if isinstance(bond, int):
+        bond = [bond]
+    return state, bond
+
+
+def _site_instances(cp):
+    """
+    Iterate over a pattern's site instances (duplicate sites separately)
+
+    Yields (molecule index, site, state, bond) tuples.
+    """
+    for i, mp in enumerate(cp.monomer_patterns):
+        for site, condition in mp.site_conditions.items():
+            if not isinstance(condition, MultiState):
+                condition = (condition, )
+            for site_condition in condition:
+                yield (i, site) + _split_site_condition(site_condition)
+
+
+# Interned site and state names: each label is matched as an integer
+_label_ids = {}
+_label_names = []
+
+
+def _label_id(label):
+    """ Integer id of a site or state name (see :class:`_PatternGraph`) """
+    try:
+        return _label_ids[label]
+    except KeyError:
+        _label_names.append(label)
+        return _label_ids.setdefault(label, len(_label_names) - 1)
+
+
+# Bond conditions of site instances in a _PatternGraph
+_SITE_WILD = 0
+_SITE_UNBOUND = 1
+_SITE_BOUND = 2
+
+
+class _PatternGraph(object):
+    """
+    Compact array-based graph of a species (or of any pattern without
+    compartments), which a :class:`_CompiledPattern` is matched against
+
+    Molecules are numbered in order, and so are the site instances (counting
+    duplicate sites separately), grouped by molecule: the site instances of
+    molecule i are numbered from site_ptr[i] up to site_ptr[i + 1]. Site and
+    state names are stored as integer ids (see :func:`_label_id`), with -1
+    for no state, and each site instance's bond condition as one of
+    _SITE_WILD, _SITE_UNBOUND or _SITE_BOUND. Bonds are stored in compressed
+    sparse row form: the site instances bonded to site instance x are
+    bond_partners[bond_ptr[x]:bond_ptr[x + 1]].
+
+    This takes a fraction of the memory of the networkx graph built by
+    :func:`pysb.core.ComplexPattern._as_graph`, which can be recovered
+    with :func:`to_networkx`.
+    """
+    __slots__ = ('monomers', 'molecules', 'site_ptr', 'site_labels',
+                 'site_states', 'site_bonds', 'site_molecules', 'bond_ptr',
+                 'bond_partners')
+
+    def __init__(self, cp):
+        if _has_compartments(cp):
+            raise NotImplementedError('Compiled pattern matching does not '
+                                      'support compartments')
+        self.monomers = tuple(mp.monomer for mp in cp.monomer_patterns)
+        molecules = collections.defaultdict(list)
+        for i, monomer in enumerate(self.monomers):
+            molecules[monomer].append(i)
+        self.molecules = dict((monomer, tuple(mols))
+                              for monomer, mols in molecules.items())
+        self.site_ptr = array.array('i', [0] * (len(self.monomers) + 1))
+        self.site_labels = array.array('i')
+        self.site_states = array.array('i')
+        self.site_bonds = array.array('b')
+        self.site_molecules = array.array('i')
+        bond_ends = collections.defaultdict(list)
+        for i, site, state, bond in _site_instances(cp):
+            instance = len(self.site_labels)
+            self.site_ptr[i + 1] = instance + 1
+            self.site_labels.append(_label_id(site))
+            self.site_states.append(-1 if state is None else
+                                    _label_id(state))
+            if bond is None:
+                self.site_bonds.append(_SITE_UNBOUND)
+            elif bond is WILD:
+                self.site_bonds.append(_SITE_WILD)
+            else:
+                self.site_bonds.append(_SITE_BOUND)
+            self.site_molecules.append(i)
+            if isinstance(bond, list):
+                for bond_num in bond:
+                    bond_ends[bond_num].append(instance)
+        # Molecules without sites start where the previous molecule ends
+        for i in range(len(self.monomers)):
+            self.site_ptr[i + 1] = max(self.site_ptr[i + 1], self.site_ptr[i])
+        partners = [[] for _ in self.site_labels]
+        for ends in bond_ends.values():
+            for end1, end2 in itertools.combinations(ends, 2):
+                partners[end1].append(end2)
+                partners[end2].append(end1)
+        self.bond_ptr = array.array('i', [0])
+        self.bond_partners = array.array('i')
+        for instance_partners in partners:
+            self.bond_partners.extend(instance_partners)
+            self.bond_ptr.append(len(self.bond_partners))
+
+    def partners(self, instance):
+        """ Site instances bonded to a site instance """
+        return self.bond_partners[self.bond_ptr[instance]:
+                                  self.bond_ptr[instance + 1]]
+
+    def to_networkx(self):
+        """
+        Convert to a networkx graph
+
+        The graph has the same structure and node attributes as the one
+        built by :func:`pysb.core.ComplexPattern._as_graph`, although the
+        node numbering may differ.
+        """
+        g = nx.Graph()
+        for i, monomer in enumerate(self.monomers):
+            g.add_node(i, id=monomer)
+        next_node = len(self.monomers)
+        site_nodes = []
+        no_bond_node = None
+        for instance, site in enumerate(self.site_labels):
+            site_node = next_node
+            next_node += 1
+            site_nodes.append(site_node)
+            g.add_node(site_node, id=_label_names[site])
+            g.add_edge(self.site_molecules[instance], site_node)
+            bond = self.site_bonds[instance]
+            if bond == _SITE_BOUND:
+                g.nodes[site_node]['bound'] = True
+            elif bond == _SITE_UNBOUND:
+                if no_bond_node is None:
+                    no_bond_node = next_node
+                    next_node += 1
+                    g.add_node(no_bond_node, id='NoBond')
+                g.add_edge(site_node, no_bond_node)
+            state = self.site_states[instance]
+            if state >= 0:
+                g.add_node(next_node, id=_label_names[state])
+                g.add_edge(site_node, next_node)
+                next_node += 1
+        for instance, site_node in enumerate(site_nodes):
+            for partner in self.partners(instance):
+                g.add_edge(site_node, site_nodes[partner])
+        return g
+
+
+def _pattern_graph(cp):
+    """ The _PatternGraph of a ComplexPattern (cached) """
+    return _pattern_cache.get(cp, 'pattern_graph', _PatternGraph)
+
+
+class _CompiledPattern(object):
+    """
+    A ComplexPattern compiled into a search plan for matching species
+
+    Matching gives the same results as :func:`match_complex_pattern` (i.e.
+    subgraph monomorphisms of the pattern's graph into the species' graph),
+    but runs directly on a :class:`_PatternGraph`.
+
+    The pattern's molecules are matched in the order of the search plan:
+    the first molecule of each connected component is the one with the
+    most site conditions, and the rest of the component is reached by
+    following bonds from molecules already matched, so the candidates for
+    most molecules are fixed by a bond partner. The site instances of each
+    molecule are checked against the conditions (state, bond, bond partner)
+    before moving on to the next molecule.
+    """
+    def __init__(self, cp):
+        if _has_compartments(cp):
+            raise NotImplementedError('Compiled pattern matching does not '
+                                      'support compartments')
+        self.match_once = cp.match_once
+        self.monomers = [mp.monomer for mp in cp.monomer_patterns]
+        self.monomer_counts = collections.Counter(self.monomers)
+        self.site_names = []
+        self.site_states = []
+        self.site_bonds = []
+        site_molecules = []
+        mol_sites = [[] for _ in self.monomers]
+        bond_ends = collections.defaultdict(list)
+        for i, site, state, bond in _site_instances(cp):
+            instance = len(self.site_names)
+            mol_sites[i].append(instance)
+            site_molecules.append(i)
+            self.site_names.append(_label_id(site))
+            self.site_states.append(None if state is None else
+                                    _label_id(state))
+            self.site_bonds.append(bond)
+            if isinstance(bond, list):
+                for bond_num in bond:
+                    bond_ends[bond_num].append(instance)
+        # Replace bond numbers with the partner site instances, treating
+        # dangling bonds as ANY
+        partners = [set() for _ in self.site_names]
+        for ends in bond_ends.values():
+            for end1, end2 in itertools.combinations(ends, 2):
+                partners[end1].add(end2)
+                partners[end2].add(end1)
+        for instance, bond in enumerate(self.site_bonds):
+            if isinstance(bond, list):
+                self.site_bonds[instance] = tuple(sorted(
+                    partners[instance])) or ANY
+
+        # Search plan: list of (molecule, site instances, bond followed)
+        self.plan = []
+        placed = [False] * len(self.monomers)
+        for _ in self.monomers:
+            unplaced = [i for i, p in enumerate(placed) if not p]
+            if not unplaced:
+                break
+            start = max(unplaced, key=lambda i: (len(mol_sites[i]), -i))
+            placed[start] = True
+            queue = collections.deque([(start, None)])
+            while queue:
+                i, via = queue.popleft()
+                sites = list(mol_sites[i])
+                if via is not None:
+                    sites.remove(via[1])
+                    sites.insert(0, via[1])
+                self.plan.append((i, sites, via))
+                for instance in mol_sites[i]:
+                    for partner in sorted(partners[instance]):
+                        j = site_molecules[partner]
+                        if not placed[j]:
+                            placed[j] = True
+                            queue.append((j, (instance, partner)))
+
+    def embeddings(self, species):
+        """
+        Iterate over the matches of the pattern to a _PatternGraph
+
+        Yields a tuple giving the species molecule matched by each molecule
+        of the pattern, once per distinct match of the pattern's site
+        instances (so the same tuple can be repeated if the pattern has
+        duplicate sites).
+        """
+        for monomer, count in self.monomer_counts.items():
+            if len(species.molecules.get(monomer, ())) < count:
+                return iter(())
+        mol_image = [None] * len(self.monomers)
+        site_image = [None] * len(self.site_names)
+        return self._place(species, 0, mol_image, site_image, set())
+
+    def _place(self, species, step, mol_image, site_image, used_molecules):
+        if step == len(self.plan):
+            yield tuple(mol_image)
+            return
+        i, sites, via = self.plan[step]
+        monomer = self.monomers[i]
+        if via is None:
+            candidates = species.molecules.get(monomer, ())
+        else:
+            candidates = sorted(set(
+                species.site_molecules[partner] for partner in
+                species.partners(site_image[via[0]])))
+        for mol in candidates:
+            if mol in used_molecules or species.monomers[mol] is not monomer:
+                continue
+            used_molecules.add(mol)
+            mol_image[i] = mol
+            mol_sites = range(species.site_ptr[mol], species.site_ptr[mol + 1])
+            for _ in self._assign_sites(species, sites, 0, mol_sites,
+                                        site_image, set()):
+                for match in self._place(species, step + 1, mol_image,
+                                         site_image, used_molecules):
+                    yield match
+            used_molecules.discard(mol)
+        mol_image[i] = None
+
+    def _assign_sites(self, species, sites, k, mol_sites, site_image,
+                      used_sites):
+        if k == len(sites):
+            yield
+            return
+        instance = sites[k]
+        name = self.site_names[instance]
+        state = self.site_states[instance]
+        bond = self.site_bonds[instance]
+        for candidate in mol_sites:
+            if species.site_labels[candidate] != name or \
+                    candidate in used_sites:
+                continue
+            if state is not None and species.site_states[candidate] != state:
+                continue
+            if bond is None:
+                if species.site_bonds[candidate] != _SITE_UNBOUND:
+                    continue
+            elif bond is not WILD:
+                if species.site_bonds[candidate] != _SITE_BOUND:
+                    continue
+                if bond is not ANY:
+                    partners = species.partners(candidate)
+                    if not all(site_image[partner] is None or
+                               site_image[partner] in partners
+                               for partner in bond):
+                        continue
+            used_sites.add(candidate)
+            site_image[instance] = candidate
+            for _ in self._assign_sites(species, sites, k + 1, mol_sites,
+                                        site_image, used_sites):
+                yield
+            used_sites.discard(candidate)
+        site_image[instance] = None
+
+    def match(self, species, count=False):
+        """
+        Match the pattern against a _PatternGraph
+
+        Returns the number of matches if count is True (or 1 if the pattern
+        is MatchOnce), otherwise whether the pattern matches.
+        """
+        embeddings = self.embeddings(species)
+        if count and not self.match_once:
+            return sum(1 for _ in embeddings)
+        matched = next(embeddings, None) is not None
+        return int(matched) if count else matched
 
 
 def match_complex_pattern(pattern, candidate, exact=False, count=False):
@@ -324,7 +816,12 @@ def match_complex_pattern(pattern, candidate, exact=False, count=False):
             return False
 
     # If we've got this far, we'll need to do a full pattern match
-    # by searching for a graph isomorphism
+    # by searching for a graph isomorphism. Patterns without compartments
+    # are matched on their compact graphs.
+    if not exact and not _has_compartments(pattern) and \
+            not _has_compartments(candidate):
+        return _pattern_cache.get(pattern, 'compiled', _CompiledPattern).match(
+            _pattern_graph(candidate), count=count)
     return _match_graphs(pattern, candidate, exact=exact, count=count)
 
 
@@ -401,6 +898,47 @@ def monomers_from_pattern(pattern):
         raise Exception('Unsupported pattern type: %s' % type(pattern))
 
 
+def _site_states(cp):
+    """ Set of (monomer, site, state) tuples required by a pattern """
+    return set((cp.monomer_patterns[i].monomer, site, state)
+               for i, site, state, _ in _site_instances(cp)
+               if state is not None)
+
+
+def _has_compartments(cp):
+    return cp.compartment is not None or any(
+        mp.compartment is not None for mp in cp.monomer_patterns)
+
+
+def _match_species_chunk(patterns, species, counts):
+    """
+    Match patterns against a chunk of species (run in worker processes)
+
+    Parameters
+    ----------
+    patterns: list of ComplexPattern
+    species: list of (species index, species, pattern indexes) tuples
+    counts: bool
+
+    Returns
+    -------
+    list of (pattern index, species index, match) tuples for each match
+    """
+    compiled = {}
+    matches = []
+    for idx, sp, pids in species:
+        sp = _PatternGraph(sp)
+        for pid in pids:
+            try:
+                pattern = compiled[pid]
+            except KeyError:
+                pattern = compiled[pid] = _CompiledPattern(patterns[pid])
+            val = pattern.match(sp, count=counts)
+            if val:
+                matches.append((pid, idx, val))
+    return matches
+
+
 class SpeciesPatternMatcher(object):
     """
     Match a pattern against a model's species list
@@ -482,6 +1020,9 @@ class SpeciesPatternMatcher(object):
         self.species = species
 
         self._species_cache = collections.defaultdict(set)
+        self._site_state_cache = collections.defaultdict(set)
+        self._species_keys = None
+        self._species_graphs = {}
         for idx, sp in enumerate(species):
             self._add_species(idx, sp)
 
@@ -492,6 +1033,18 @@ class SpeciesPatternMatcher(object):
             if mp.compartment:
                 raise NotImplementedError
             self._species_cache[mp.monomer].add(idx)
+        for i, site, state, _ in _site_instances(sp):
+            if state is not None:
+                self._site_state_cache[(sp.monomer_patterns[i].monomer,
+                                        site, state)].add(idx)
+
+    def _species_graph(self, idx):
+        try:
+            return self._species_graphs[idx]
+        except KeyError:
+            graph = _PatternGraph(self.species[idx])
+            self._species_graphs[idx] = graph
+            return graph
 
     def add_species(self, species, check_duplicate=True):
         """
@@ -506,8 +1059,16 @@ class SpeciesPatternMatcher(object):
             If True, check the species list to make sure the new species
             is not already in the list
         """
-        if check_duplicate and self.match(species, exact=True):
-            return
+        if check_duplicate:
+            if self._species_keys is None:
+                self._species_keys = set(sp.canonical_key()
+                                         for sp in self.species)
+            key = species.canonical_key()
+            if key in self._species_keys:
+                return
+            self._species_keys.add(key)
+        elif self._species_keys is not None:
+            self._species_keys.add(species.canonical_key())
         self.species.append(species)
         self._add_species(len(self.species) - 1, species)
 
@@ -546,16 +1107,7 @@ class SpeciesPatternMatcher(object):
         >>> spm.match(L())
         [L(b=None), L(b=1) % pR(b=1)]
         """
-        if isinstance(pattern, ReactionPattern):
-            if len(pattern.complex_patterns) == 1:
-                pattern = pattern.complex_patterns[0]
-            else:
-                raise NotImplementedError()
-
-        if not isinstance(pattern, (Monomer, MonomerPattern, ComplexPattern)):
-            raise ValueError('A Monomer, MonomerPattern or ComplexPattern is '
-                             'required to match species')
-
+        pattern = self._search_pattern(pattern)
         monomers = monomers_from_pattern(pattern)
 
         if exact:
@@ -568,18 +1120,28 @@ class SpeciesPatternMatcher(object):
             # candidates if we're not doing an exact match of the species
             num_mon_pats = None
 
+        cp = as_complex_pattern(pattern)
         shortlist, shortlist_indexes = self._species_containing_monomers(
-            monomers, num_mon_pats)
+            monomers, num_mon_pats, _site_states(cp))
 
         # If pattern is a Monomer and we don't need match counts, we're done
         if isinstance(pattern, Monomer) and not counts:
             return shortlist_indexes if index else shortlist
 
+        # Non-exact matches use a compiled search plan on the species'
+        # compact representations, except for patterns with compartments
+        compiled = None
+        if not exact and not _has_compartments(cp):
+            compiled = _CompiledPattern(cp)
+
         matches = collections.OrderedDict() if counts else []
         for idx, sp in enumerate(shortlist):
-            val = match_complex_pattern(
-                as_complex_pattern(pattern), sp, exact=exact, count=counts
-            )
+            if compiled is not None:
+                val = compiled.match(
+                    self._species_graph(shortlist_indexes[idx]), count=counts)
+            else:
+                val = match_complex_pattern(cp, sp, exact=exact,
+                                            count=counts)
             if val:
                 key = shortlist_indexes[idx] if index else sp
                 if counts:
@@ -589,7 +1151,194 @@ class SpeciesPatternMatcher(object):
 
         return matches
 
-    def _species_containing_monomers(self, monomer_list, num_mon_pats=None):
+    def match_patterns(self, patterns, index=False, counts=False,
+                       num_processors=1):
+        """
+        Match several patterns against the list of species in one pass
+
+        This gives the same results as calling :func:`match` for each
+        pattern, but is faster for many patterns (such as all of a model's
+        observables or rule reactant patterns). Each distinct pattern is
+        compiled only once, even if it appears several times, and each
+        species is visited once and tested against all of the patterns whose
+        monomers and site states it contains.
+
+        Parameters
+        ----------
+        patterns: iterable
+            Patterns to match (each a pysb.Monomer, pysb.MonomerPattern,
+            pysb.ComplexPattern or single-ComplexPattern
+            pysb.ReactionPattern)
+        index: bool
+            If True, return species numerical indexes, rather than species
+            themselves
+        counts: bool
+            If True, return match counts for each pattern within each
+            species.
+        num_processors: int
+            Number of processes to use (default: 1). If greater than 1, the
+            species are split into chunks which are matched in a process
+            pool.
+
+        Returns
+        -------
+        list
+            One result per pattern, in the same format as the return value
+            of :func:`match`. Species are listed in species list order.
+
+        Examples
+        --------
+
+        >>> from pysb.examples import earm_1_0
+        >>> from pysb.bng import generate_equations
+        >>> model = earm_1_0.model
+        >>> generate_equations(model)
+        >>> spm = SpeciesPatternMatcher(model)
+        >>> L, pR = model.monomers['L'], model.monomers['pR']
+        >>> spm.match_patterns([L(), pR(b=None), L(b=1) % pR(b=1)])
+        [[L(b=None), L(b=1) % pR(b=1)], [pR(b=None)], [L(b=1) % pR(b=1)]]
+        """
+        # Match each distinct pattern only once
+        unique = []
+        unique_index = {}
+        pattern_ids = []
+        for pattern in patterns:
+            cp = as_complex_pattern(self._search_pattern(pattern))
+            key = (cp.canonical_key(), cp.match_once,
+                   frozenset(monomers_from_pattern(cp)))
+            if key not in unique_index:
+                unique_index[key] = len(unique)
+                unique.append(cp)
+            pattern_ids.append(unique_index[key])
+
+        # Invert the shortlists to find the patterns to try on each species
+        species_patterns = collections.defaultdict(list)
+        results = [collections.OrderedDict() for _ in unique]
+        for pid, cp in enumerate(unique):
+            _, shortlist = self._species_containing_monomers(
+                monomers_from_pattern(cp), None, _site_states(cp))
+            if _has_compartments(cp):
+                for idx in sorted(shortlist):
+                    val = match_complex_pattern(cp, self.species[idx],
+                                                count=counts)
+                    if val:
+                        results[pid][idx] = val
+            else:
+                for idx in shortlist:
+                    species_patterns[idx].append(pid)
+
+        work = [(idx, species_patterns[idx])
+                for idx in sorted(species_patterns)]
+        if num_processors > 1 and work:
+            chunk_size = int(math.ceil(len(work) / (4.0 * num_processors)))
+            with ProcessPoolExecutor(max_workers=num_processors) as executor:
+                futures = [executor.submit(
+                    _match_species_chunk, unique,
+                    [(idx, self.species[idx], pids) for idx, pids in
+                     work[start:start + chunk_size]], counts)
+                    for start in range(0, len(work), chunk_size)]
+                chunk_results = [future.result() for future in futures]
+        else:
+            compiled = {}
+            chunk_results = [[]]
+            for idx, pids in work:
+                sp = self._species_graph(idx)
+                for pid in pids:
+                    try:
+                        pattern = compiled[pid]
+                    except KeyError:
+                        pattern = compiled[pid] = _CompiledPattern(
+                            unique[pid])
+                    val = pattern.match(sp, count=counts)
+                    if val:
+                        chunk_results[0].append((pid, idx, val))
+        for chunk in chunk_results:
+            for pid, idx, val in chunk:
+                results[pid][idx] = val
+
+        matches = []
+        for pid in pattern_ids:
+            found = sorted(results[pid].items())
+            if counts:
+                matches.append(collections.OrderedDict(
+                    (idx if index else self.species[idx], val)
+                    for idx, val in found))
+            else:
+                matches.append([idx if index else self.species[idx]
+                                for idx, _ in found])
+        return matches
+
+    def match_observables(self, observables=None, num_processors=1):
+        """
+        Match observables against the list of species
+
+        All of the observables' patterns are matched in one pass, using
+        :func:`match_patterns`.
+
+        Parameters
+        ----------
+        observables: iterable of pysb.Observable, optional
+            Observables to match. If None, use all observables in the
+            model.
+        num_processors: int
+            Number of processes to use (see :func:`match_patterns`)
+
+        Returns
+        -------
+        collections.OrderedDict
+            Dictionary with observables as keys. Values are (species,
+            coefficients) tuples of lists, in the format of the
+            observables' `species` and `coefficients` attributes.
+
+        Examples
+        --------
+
+        >>> from pysb.examples import bax_pore
+        >>> from pysb.bng import generate_equations
+        >>> model = bax_pore.model
+        >>> generate_equations(model)
+        >>> spm = SpeciesPatternMatcher(model)
+        >>> obs = model.observables['BAX4_inh']
+        >>> spm.match_observables([obs])[obs]
+        ([8, 9, 10, 11, 12], [1, 2, 2, 3, 4])
+        """
+        if observables is None:
+            observables = self.model.observables
+        observables = list(observables)
+        matches = iter(self.match_patterns(
+            [cp for obs in observables
+             for cp in obs.reaction_pattern.complex_patterns],
+            index=True, counts=True, num_processors=num_processors))
+        observable_matches = collections.OrderedDict()
+        for obs in observables:
+            coefficients = collections.defaultdict(int)
+            for _ in obs.reaction_pattern.complex_patterns:
+                for idx, count in next(matches).items():
+                    if obs.match == 'species':
+                        coefficients[idx] = 1
+                    else:
+                        coefficients[idx] += count
+            species = sorted(coefficients)
+            observable_matches[obs] = (species,
+                                       [coefficients[sp] for sp in species])
+        return observable_matches
+
+    @staticmethod
+    def _search_pattern(pattern):
+        """ Check a search pattern, unpacking a single-CP ReactionPattern """
+        if isinstance(pattern, ReactionPattern):
+            if len(pattern.complex_patterns) == 1:
+                pattern = pattern.complex_patterns[0]
+            else:
+                raise NotImplementedError()
+
+        if not isinstance(pattern, (Monomer, MonomerPattern, ComplexPattern)):
+            raise ValueError('A Monomer, MonomerPattern or ComplexPattern is '
+                             'required to match species')
+        return pattern
+
+    def _species_containing_monomers(self, monomer_list, num_mon_pats=None,
+                                     site_states=()):
         """
         Identifies species containing a list of monomers
 
@@ -600,13 +1349,18 @@ class SpeciesPatternMatcher(object):
         num_mon_pats: int or None
             Restrict matches to species with exactly the specified number of
             MonomerPatterns
+        site_states: iterable of (Monomer, site, state) tuples
+            Restrict matches to species containing each monomer with the
+            specified site in the specified state
 
         Returns
         -------
         Model species containing all of the monomers in the list
         """
-        sp_indexes = set.intersection(*[self._species_cache[mon] for mon in
-                                        monomer_list])
+        sp_indexes = set.intersection(
+            *[self._species_cache[mon] for mon in monomer_list] +
+            [self._site_state_cache[site_state]
+             for site_state in site_states])
         if num_mon_pats:
             retval = zip(*[(self.species[sp], sp) for sp in sp_indexes
                            if len(self.species[sp].monomer_patterns)
@@ -657,19 +1411,25 @@ class SpeciesPatternMatcher(object):
         """
         if rules_to_consider is None:
             rules_to_consider = self.model.rules
+        rules_to_consider = list(rules_to_consider)
+        reaction_patterns = []
+        for r in rules_to_consider:
+            reaction_patterns.append(r.reactant_pattern)
+            if include_reverse and r.is_reversible:
+                reaction_patterns.append(r.product_pattern)
+        species_fired = iter(self._species_fired_by_reaction_patterns(
+            reaction_patterns))
         rules_fired = collections.OrderedDict()
         for r in rules_to_consider:
             rp = r.reactant_pattern
+            rule_species_fired = next(species_fired)
+            if include_reverse and r.is_reversible:
+                rule_species_fired += next(species_fired)
             if len(rp.complex_patterns) == 0:
                 # Synthesis rules are always fired
                 rules_fired[r] = []
-            else:
-                species_fired = self.species_fired_by_reactant_pattern(rp)
-                if include_reverse and r.is_reversible:
-                    species_fired += self.species_fired_by_reactant_pattern(
-                        r.product_pattern)
-                if species_fired:
-                    rules_fired[r] = species_fired
+            elif rule_species_fired:
+                rules_fired[r] = rule_species_fired
         return rules_fired
 
     def species_fired_by_reactant_pattern(self, reaction_pattern):
@@ -708,15 +1468,18 @@ class SpeciesPatternMatcher(object):
          [BAX(t1=None, t2=None, inh=None),
               BAX(t1=None, t2=None, inh=1) % MCL1(b=1)]]
         """
-        species_fired = []
-
-        for i, cp in enumerate(reaction_pattern.complex_patterns):
-            species_fired_this_cp = self.match(cp)
-            if not species_fired_this_cp:
-                return []
-            else:
-                species_fired.append(species_fired_this_cp)
+        return self._species_fired_by_reaction_patterns([reaction_pattern])[0]
 
+    def _species_fired_by_reaction_patterns(self, reaction_patterns):
+        """ Match several ReactionPatterns' ComplexPatterns in one pass """
+        matches = iter(self.match_patterns(
+            [cp for rp in reaction_patterns for cp in rp.complex_patterns]))
+        species_fired = []
+        for rp in reaction_patterns:
+            rp_species_fired = [next(matches) for _ in rp.complex_patterns]
+            if not all(rp_species_fired):
+                rp_species_fired = []
+            species_fired.append(rp_species_fired)
         return species_fired
 
 
@@ -851,14 +1614,15 @@ class RulePatternMatcher(object):
             return shortlist
 
         if isinstance(pattern, (MonomerPattern, ComplexPattern)):
-            new_shortlist = []
-            for rule in shortlist:
-                reaction_pattern = pat_fn(rule)
-                if self._match_complex_pattern_to_reaction_pattern(
-                        as_complex_pattern(pattern), reaction_pattern):
-                    new_shortlist.append(rule)
-
-            return new_shortlist
+            pattern = as_complex_pattern(pattern)
+            if _has_compartments(pattern):
+                return [rule for rule in shortlist if
+                        self._match_complex_pattern_to_reaction_pattern(
+                            pattern, pat_fn(rule))]
+            compiled = _CompiledPattern(pattern)
+            return [rule for rule in shortlist if
+                    any(compiled.match(_pattern_graph(cp))
+                        for cp in pat_fn(rule).complex_patterns)]
 
         else:
             return [rule for rule in shortlist if
@@ -981,8 +1745,7 @@ class ReactionPatternMatcher(object):
         self._reactant_cache = collections.defaultdict(set)
         self._product_cache = collections.defaultdict(set)
 
-        if not species_pattern_matcher:
-            self.spm = SpeciesPatternMatcher(model)
+        self.spm = species_pattern_matcher or SpeciesPatternMatcher(model)
 
         for r_id, rxn in enumerate(model.reactions_bidirectional):
             for cache, species_ids in (
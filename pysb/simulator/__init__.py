@@ -1,10 +1,13 @@
-from .base import SimulatorException, SimulationResult
+from .base import SimulatorException, SimulationResult, \
+    SimulationResultWriter, LazySimulationResult
 from .scipyode import ScipyOdeSimulator
 from .cupsoda import CupSodaSimulator
 from .stochkit import StochKitSimulator
+from .ssa import SsaSimulator
 from .bng import BngSimulator, PopulationMap
 from .kappa import KappaSimulator
 
 __all__ = ['BngSimulator', 'CupSodaSimulator', 'ScipyOdeSimulator',
-           'StochKitSimulator', 'KappaSimulator',
-           'SimulationResult', 'PopulationMap']
+           'StochKitSimulator', 'KappaSimulator', 'SsaSimulator',
+           'SimulationResult', 'SimulationResultWriter',
+           'LazySimulationResult', 'PopulationMap']
@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractmethod
 import numpy as np
+import scipy.sparse
 import itertools
 import sympy
 import collections
@@ -76,6 +77,10 @@ class Simulator(object):
         Model passed to the constructor.
     tspan : vector-like
         Time values passed to the constructor.
+    columnar_results : bool
+        If True, results are stored in a single contiguous block of memory
+        (see the ``columnar`` argument of :class:`SimulationResult`).
+        Defaults to False.
 
     Notes
     -----
@@ -119,11 +124,39 @@ class Simulator(object):
         # Store init kwargs and run kwargs if needed for saving results
         self._init_kwargs = kwargs
         self._run_kwargs = None
+        # Model snapshot shared by SimulationResults (see _model_snapshot)
+        self._snapshot = None
+        self.columnar_results = False
 
     @property
     def model(self):
         return self._model
 
+    def _model_snapshot(self):
+        """
+        Return a frozen copy of the model and init kwargs for results
+
+        The deep copy is taken once and shared by all
+        :class:`SimulationResult` objects created by this simulator, until
+        the model's fingerprint changes (see :func:`_model_fingerprint`).
+        Snapshots must therefore be treated as read-only.
+
+        Returns
+        -------
+        tuple
+            (model copy, init kwargs copy)
+        """
+        fingerprint = _model_fingerprint(self._model)
+        if self._snapshot is None or self._snapshot[0] != fingerprint:
+            self._logger.debug('Taking model snapshot')
+            # The network lists are kept referenced by the snapshot, so
+            # their ids in the fingerprint cannot be reused
+            self._snapshot = (fingerprint,
+                              (self._model.species, self._model.reactions),
+                              copy.deepcopy(self._model),
+                              copy.deepcopy(self._init_kwargs))
+        return self._snapshot[2:]
+
     @property
     def tspan(self):
         return self._run_tspan if self._run_tspan is not None else self._tspan
@@ -163,14 +196,15 @@ class Simulator(object):
                 return len(self.param_values)
 
     def _update_initials_dict(self, initials_dict, initials_source, subs=None):
+        # Can't just use .update() as we need to test species equivalence,
+        # rather than ComplexPattern identity
+        existing_keys = set(cp.canonical_key() for cp in initials_dict)
         if isinstance(initials_source, collections.Mapping):
-            # Can't just use .update() as we need to test
-            # equality with .is_equivalent_to()
             for cp, value_obj in initials_source.items():
                 cp = as_complex_pattern(cp)
-                if any(existing_cp.is_equivalent_to(cp)
-                       for existing_cp in initials_dict):
+                if cp.canonical_key() in existing_keys:
                     continue
+                existing_keys.add(cp.canonical_key())
 
                 if isinstance(value_obj, (collections.Sequence, np.ndarray))\
                         and all(isinstance(v, numbers.Number) for v in value_obj):
@@ -180,7 +214,7 @@ class Simulator(object):
                 elif isinstance(value_obj, Parameter):
                     # Set parameter using param_values
                     pi = self._model.parameters.index(value_obj)
-                    value = [self.param_values[sim][pi] for sim in range(len(self.param_values))]
+                    value = self.param_values[:, pi]
                 else:
                     raise TypeError("Unexpected initial condition "
                                     "value type: %s" % type(value_obj))
@@ -194,8 +228,7 @@ class Simulator(object):
                     'Cannot update initials from an array-like source without '
                     'model species.')
             for cp_idx, cp in enumerate(self.model.species):
-                if any(existing_cp.is_equivalent_to(cp) for existing_cp in
-                       initials_dict):
+                if cp.canonical_key() in existing_keys:
                     continue
                 initials_dict[cp] = [initials_source[n][cp_idx]
                                      for n in range(len(initials_source))]
@@ -505,6 +538,30 @@ class Simulator(object):
         self._run_initials = None
         self._run_params = None
 
+    def _result_writer(self, save_to, n_times, **kwargs):
+        """
+        Start streaming results to an HDF5 file
+
+        For use by subclasses' run methods, which should append results to
+        the returned writer as simulations complete, then close it and
+        return ``writer.result()``.
+
+        Parameters
+        ----------
+        save_to: str or SimulationResultWriter
+            Filename or writer, as supplied to the subclass's run method
+        n_times: int
+            Number of time points per simulation
+        kwargs: dict
+            Further arguments to :func:`SimulationResultWriter.start`
+        """
+        if isinstance(save_to, SimulationResultWriter):
+            writer = save_to
+        else:
+            writer = SimulationResultWriter(save_to)
+        writer.start(self, n_times, **kwargs)
+        return writer
+
     @abstractmethod
     def run(self, tspan=None, initials=None, param_values=None,
             _run_kwargs=None):
@@ -529,6 +586,7 @@ class Simulator(object):
             _run_kwargs.pop('initials', None)
             _run_kwargs.pop('param_values', None)
             _run_kwargs.pop('tspan', None)
+            _run_kwargs.pop('save_to', None)
             self._run_kwargs = _run_kwargs
         elif _run_kwargs is None:
             self._logger.warning(
@@ -621,6 +679,16 @@ class SimulationResult(object):
         mechanism used when loading SimulationResults from files (see
         :func:`SimulationResult.load`). Setting just the simulator argument
         instead of these arguments is recommended.
+    columnar : bool or None, optional
+        If True, species, observables and expressions for all simulations
+        are stored in a single contiguous 2D float array, with one row per
+        time point (simulations concatenated along the time axis) and one
+        column per species, observable and expression. The ``species``,
+        ``observables``, ``expressions``, ``all`` and ``dataframe``
+        attributes are then views of this array rather than copies, which
+        roughly halves peak memory use for large ensembles. If None
+        (default), the ``columnar_results`` attribute of the simulator is
+        used.
 
     Examples
     --------
@@ -696,7 +764,10 @@ class SimulationResult(object):
     def __init__(self, simulator, tout, trajectories=None,
                  observables_and_expressions=None, squeeze=True,
                  simulations_per_param_set=1,
-                 model=None, initials=None, param_values=None):
+                 model=None, initials=None, param_values=None,
+                 columnar=None):
+        if columnar is None:
+            columnar = getattr(simulator, 'columnar_results', False)
         if simulator:
             simulator._logger.debug('SimulationResult constructor started')
             self._param_values = simulator.param_values.copy()
@@ -705,9 +776,9 @@ class SimulationResult(object):
             except SimulatorException:
                 # Network free simulations don't have initials list, only dict
                 self._initials = simulator.initials_dict.copy()
-            self._model = copy.deepcopy(simulator._model)
+            # Shared between results from the same simulator and model
+            self._model, self.init_kwargs = simulator._model_snapshot()
             self.simulator_class = simulator.__class__
-            self.init_kwargs = copy.deepcopy(simulator._init_kwargs)
             self.run_kwargs = copy.deepcopy(simulator._run_kwargs)
         else:
             self._param_values = param_values
@@ -720,6 +791,7 @@ class SimulationResult(object):
         self.squeeze = squeeze
         self.tout = np.asarray(tout)
         self._yfull = None
+        self._data = None
         self.n_sims_per_parameter_set = simulations_per_param_set
         self.pysb_version = PYSB_VERSION
         self.timestamp = datetime.now()
@@ -786,8 +858,35 @@ class SimulationResult(object):
                        if expr_names else float)
 
         if observables_and_expressions:
-            # Observables and expression values are used as supplied
             self._nsims = len(observables_and_expressions)
+        offsets = np.cumsum([0] + [len(t) for t in self.tout])
+        sim_slices = [slice(offsets[n], offsets[n + 1])
+                      for n in range(self.nsims)]
+
+        if columnar:
+            # Species, observables and expressions for all simulations are
+            # columns of a single array, concatenated along the time axis,
+            # with per-simulation (record array) views
+            n_sp = len(self._model.species) if self._y is not None else 0
+            n_obs = len(obs_names)
+            sp_names = ['__s%d' % i for i in range(n_sp)]
+            self._columns = sp_names + obs_names + expr_names
+            self._data = np.empty((offsets[-1], len(self._columns)))
+            if self._y is not None:
+                for sl, y in zip(sim_slices, self._y):
+                    self._data[sl, :n_sp] = y
+                self._y = [self._data[sl, :n_sp] for sl in sim_slices]
+            yobs_all_view = self._data[:, n_sp:n_sp + n_obs]
+            yexpr_all_view = self._data[:, n_sp + n_obs:]
+            yobs_all = _record_view(self._data, obs_names, n_sp) \
+                if obs_names else yobs_all_view
+            yexpr_all = _record_view(self._data, expr_names, n_sp + n_obs) \
+                if expr_names else yexpr_all_view
+            if self._columns:
+                yfull_all = _record_view(self._data, self._columns, 0)
+                self._yfull = [yfull_all[sl] for sl in sim_slices]
+        elif observables_and_expressions:
+            # Observables and expression values are used as supplied
             self._yobs_view = [observables_and_expressions[n][:, 0:(len(
                 self._model.observables))] for n in range(self.nsims)]
             self._yexpr_view = [observables_and_expressions[n][:, (len(
@@ -800,39 +899,67 @@ class SimulationResult(object):
                 len(tout[n]) * len(expr_names)).view(dtype=yexpr_dtype) for n
                           in range(self.nsims)]
         else:
-            self._yobs = [np.ndarray((len(self.tout[n]),),
-                                     dtype=yobs_dtype) for n in range(self.nsims)]
-            self._yobs_view = [self._yobs[n].view(float).
-                               reshape(len(self._yobs[n]), -1) for n in range(
-                self.nsims)]
-            self._yexpr = [np.ndarray((len(self.tout[n]),),
-                                      dtype=yexpr_dtype) for n in range(
-                self.nsims)]
-            self._yexpr_view = [self._yexpr[n].view(float).reshape(len(
-                self._yexpr[n]), -1) for n in range(self.nsims)]
+            # Observables and expressions for all simulations are stored
+            # in single arrays, concatenated along the time axis, with
+            # per-simulation views
+            yobs_all = np.ndarray((offsets[-1],), dtype=yobs_dtype)
+            yobs_all_view = yobs_all.view(float).reshape(len(yobs_all), -1)
+            yexpr_all = np.ndarray((offsets[-1],), dtype=yexpr_dtype)
+            yexpr_all_view = yexpr_all.view(float).reshape(len(yexpr_all),
+                                                           -1)
+
+        if columnar or not observables_and_expressions:
+            self._yobs = [yobs_all[sl] for sl in sim_slices]
+            self._yobs_view = [yobs_all_view[sl] for sl in sim_slices]
+            self._yexpr = [yexpr_all[sl] for sl in sim_slices]
+            self._yexpr_view = [yexpr_all_view[sl] for sl in sim_slices]
 
-            # loop over simulations
-            sym_names = obs_names + param_names
-            expanded_exprs = [sympy.lambdify(sym_names, expr.expand_expr(),
-                                             "numpy") for expr in exprs]
-            for n in range(self.nsims):
-                if simulator:
-                    simulator._logger.log(EXTENDED_DEBUG,
-                                          'Evaluating exprs/obs %d/%d'
-                                          % (n + 1, self.nsims))
-
-                # observables
-                for i, obs in enumerate(model_obs):
-                    self._yobs_view[n][:, i] = (
-                        self._y[n][:, obs.species] * obs.coefficients).sum(axis=1)
-
-                # expressions
-                sym_dict = dict((k, self._yobs[n][k]) for k in obs_names)
-                sym_dict.update(dict((p.name, self.param_values[
-                    n // self.n_sims_per_parameter_set][i]) for i, p in
-                                enumerate(self._model.parameters)))
+        if observables_and_expressions:
+            if columnar:
+                # Copy the supplied values into the columnar array
+                for sl, obs_exprs in zip(sim_slices,
+                                         observables_and_expressions):
+                    yobs_all_view[sl] = obs_exprs[:, :n_obs]
+                    yexpr_all_view[sl] = obs_exprs[:, n_obs:]
+        else:
+            if simulator:
+                simulator._logger.log(EXTENDED_DEBUG,
+                                      'Evaluating exprs/obs for %d '
+                                      'simulation(s)' % self.nsims)
+
+            # observables: one sparse matrix product over all simulations
+            if model_obs:
+                if columnar:
+                    y_all = self._data[:, :n_sp]
+                elif self.nsims == 1:
+                    y_all = self._y[0]
+                else:
+                    y_all = np.concatenate(self._y)
+                obs_matrix = _observables_matrix(self._model)
+                yobs_all_view[:] = obs_matrix.T.dot(y_all.T).T
+
+            # expressions: evaluated once over all simulations, with each
+            # parameter broadcast to the time points of its simulations
+            if exprs:
+                sym_values = dict(
+                    (obs.name, yobs_all_view[:, i])
+                    for i, obs in enumerate(model_obs))
+                param_set_idx = np.repeat(
+                    np.arange(self.nsims) // self.n_sims_per_parameter_set,
+                    np.diff(offsets))
+                param_idx = dict((p.name, i) for i, p in
+                                 enumerate(self._model.parameters))
                 for i, expr in enumerate(exprs):
-                    self._yexpr_view[n][:, i] = expanded_exprs[i](**sym_dict)
+                    expanded_expr = expr.expand_expr()
+                    arg_names = sorted(sym.name for sym in
+                                       expanded_expr.free_symbols)
+                    for name in arg_names:
+                        if name not in sym_values:
+                            sym_values[name] = self.param_values[
+                                param_set_idx, param_idx[name]]
+                    yexpr_all_view[:, i] = sympy.lambdify(
+                        arg_names, expanded_expr, "numpy")(
+                        *[sym_values[name] for name in arg_names])
 
         if simulator:
             simulator._reset_run_overrides()
@@ -902,8 +1029,11 @@ class SimulationResult(object):
         if self.nsims == 1 and self.squeeze:
             idx = pd.Index(times, name='time')
         else:
-            idx = pd.MultiIndex.from_tuples(list(zip(sim_ids, times)),
+            idx = pd.MultiIndex.from_arrays([sim_ids, times],
                                             names=['simulation', 'time'])
+        if self._data is not None:
+            return pd.DataFrame(self._data, index=idx,
+                                columns=self._columns, copy=False)
         simdata = self.all
         if not isinstance(simdata, np.ndarray):
             simdata = np.concatenate(simdata)
@@ -1110,23 +1240,10 @@ class SimulationResult(object):
         if dataset_name is None:
             dataset_name = 'result'
 
-        # np.void maps to bytes in HDF5.
-        enpickle = lambda obj: np.void(pickle.dumps(obj, -1))
+        enpickle = _enpickle
 
         with h5py.File(filename, 'a' if append else 'w-') as hdf:
-            # Get or create the group
-            try:
-                grp = hdf.create_group(group_name)
-                grp.create_dataset('_model', data=enpickle(self._model))
-            except ValueError:
-                grp = hdf[group_name]
-                model = pickle.loads(grp['_model'][()])
-                if model.name != self._model.name:
-                    raise ValueError('SimulationResult model has name "{}", '
-                                     'but the model in HDF5 file group "{}" '
-                                     'has name "{}"'.format(self._model.name,
-                                                            group_name,
-                                                            model.name))
+            grp = _hdf5_model_group(hdf, group_name, self._model)
 
             # Create the result dataset, which is actually a nested HDF group
             dset = grp.create_group(dataset_name)
@@ -1199,26 +1316,7 @@ class SimulationResult(object):
             raise Exception('Please "pip install h5py" for this feature')
 
         with h5py.File(filename, 'r') as hdf:
-            if group_name is None:
-                groups = hdf.keys()
-                if len(groups) > 1:
-                    raise ValueError("group_name must be specified when file "
-                                     "contains more than one group. Options "
-                                     "are: {}".format(str(groups)))
-                group_name = next(iter(hdf))
-
-            grp = hdf[group_name]
-
-            if dataset_name is None:
-                datasets = list(grp.keys())
-                datasets.remove('_model')
-                if len(datasets) > 1:
-                    raise ValueError("dataset_name must be specified when "
-                                     "group contains more than one dataset. "
-                                     "Options are: {}".format(str(datasets)))
-                dataset_name = datasets[0]
-
-            dset = grp[dataset_name]
+            grp, dset = _hdf5_result_group(hdf, group_name, dataset_name)
 
             obs_and_exprs = None
 
@@ -1259,23 +1357,486 @@ class SimulationResult(object):
                 simulations_per_param_set=dset.attrs[
                     'simulations_per_param_set']
             )
-            simres.pysb_version = dset.attrs['pysb_version']
-            simres.timestamp = dateutil.parser.parse(
-                dset.attrs['timestamp'])
-            simres.simulator_class = pickle.loads(
-                dset.attrs['simulator_class'])
-            simres.init_kwargs = pickle.loads(dset.attrs['init_kwargs'])
-            simres.run_kwargs = pickle.loads(dset.attrs['run_kwargs'])
-            for attr_name in dset.attrs.keys():
-                if attr_name.startswith(cls.CUSTOM_ATTR_PREFIX):
-                    orig_name = attr_name[len(cls.CUSTOM_ATTR_PREFIX):]
-                    attr_val = dset.attrs[attr_name]
-                    # Restore objects that were pickled for storage.
-                    if isinstance(attr_val, np.void):
-                        attr_val = pickle.loads(attr_val)
-                    simres.custom_attrs[orig_name] = attr_val
+            simres._load_attrs(dset.attrs)
             return simres
 
+    def _load_attrs(self, attrs):
+        """ Restore metadata from the attributes of an HDF5 group """
+        self.pysb_version = attrs['pysb_version']
+        self.timestamp = dateutil.parser.parse(attrs['timestamp'])
+        self.simulator_class = pickle.loads(attrs['simulator_class'])
+        self.init_kwargs = pickle.loads(attrs['init_kwargs'])
+        self.run_kwargs = pickle.loads(attrs['run_kwargs'])
+        for attr_name in attrs.keys():
+            if attr_name.startswith(self.CUSTOM_ATTR_PREFIX):
+                orig_name = attr_name[len(self.CUSTOM_ATTR_PREFIX):]
+                attr_val = attrs[attr_name]
+                # Restore objects that were pickled for storage.
+                if isinstance(attr_val, np.void):
+                    attr_val = pickle.loads(attr_val)
+                self.custom_attrs[orig_name] = attr_val
+
+
+class SimulationResultWriter(object):
+    """
+    Stream simulation results into an HDF5 file as simulations complete
+
+    Simulators which support streaming accept a ``save_to`` argument to
+    their ``run`` method, which can be a filename or an instance of this
+    class (to customise the options below). Completed simulations are
+    appended to the file during the run rather than held in memory, so
+    ensembles larger than the available memory can be simulated, and the
+    run method returns a :class:`LazySimulationResult`.
+
+    The file layout is the same as :func:`SimulationResult.save`, so files
+    can also be read with :func:`SimulationResult.load`. The trajectories,
+    observables, expressions and tout datasets are resizable along the
+    simulation axis, chunked so that each chunk holds whole simulations,
+    and gzip compressed.
+
+    Parameters
+    ----------
+    filename: str
+        Filename to which the data will be saved
+    dataset_name: str or None
+        Dataset name. If None, it will default to 'result'.
+    group_name: str or None
+        Group name. If None, will default to the name of the model.
+    append: bool
+        If False, raise IOError if the specified file already exists. If
+        True, append to existing file (or create if it doesn't exist).
+    swmr: bool
+        If True, open the file in HDF5 single-writer multiple-reader mode,
+        so that completed simulations can be read (e.g. with
+        :class:`LazySimulationResult`) while the run is still in progress.
+        Requires HDF5 1.10 or later, and the file can only be read by
+        HDF5 1.10 or later.
+
+    Examples
+    --------
+    Stream a parameter scan to a file, and read back the last simulation:
+
+    >>> from pysb.examples.robertson import model
+    >>> from pysb.simulator import ScipyOdeSimulator
+    >>> import numpy as np
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'scan.h5')
+    >>> sim = ScipyOdeSimulator(model, tspan=np.linspace(0, 40, 10))
+    >>> k1_values = list(np.linspace(0.01, 0.1, 100))
+    >>> lazy_res = sim.run(param_values={'k1': k1_values}, save_to=filename)
+    >>> lazy_res.nsims
+    100
+    >>> lazy_res[-1].species.shape
+    (10, 3)
+    """
+    #: Target size of each chunk, in bytes
+    CHUNK_BYTES = 2 ** 16
+
+    def __init__(self, filename, dataset_name=None, group_name=None,
+                 append=False, swmr=False):
+        if h5py is None:
+            raise Exception('Please "pip install h5py" for this feature')
+        self.filename = filename
+        self.dataset_name = dataset_name
+        self.group_name = group_name
+        self._append_file = append
+        self.swmr = swmr
+        self._hdf = None
+        self._dset = None
+        self._simulator = None
+        self._n_obs = 0
+        self._nsims = 0
+
+    @property
+    def nsims(self):
+        """ The number of simulations written so far """
+        return self._nsims
+
+    def start(self, simulator, n_times, simulations_per_param_set=1,
+              species=True):
+        """
+        Create the result group and (empty) datasets
+
+        Called by the simulator at the start of a run, once the parameter
+        values, initial conditions and reaction network are known.
+
+        Parameters
+        ----------
+        simulator: Simulator
+            The simulator performing the run
+        n_times: int
+            Number of time points per simulation
+        simulations_per_param_set: int
+            Number of simulations per parameter set
+        species: bool
+            Whether species trajectories will be supplied (False for
+            network-free simulations)
+        """
+        if self._hdf is not None:
+            raise ValueError('SimulationResultWriter has already been '
+                             'started')
+        model, init_kwargs = simulator._model_snapshot()
+        if self.group_name is None:
+            self.group_name = model.name
+        if self.dataset_name is None:
+            self.dataset_name = 'result'
+        file_kwargs = {'libver': 'latest'} if self.swmr else {}
+        self._hdf = h5py.File(self.filename,
+                              'a' if self._append_file else 'w-',
+                              **file_kwargs)
+        self._simulator = simulator
+        try:
+            grp = _hdf5_model_group(self._hdf, self.group_name, model)
+            dset = grp.create_group(self.dataset_name)
+            self._n_obs = len(model.observables)
+            n_cols = {'trajectories': len(model.species) if species else 0,
+                      'observables': self._n_obs,
+                      'expressions': len(model.expressions_dynamic(
+                          include_local=False))}
+            for name, n in n_cols.items():
+                if n:
+                    self._create_dataset(dset, name, (n_times, n))
+            self._create_dataset(dset, 'tout', (n_times, ))
+
+            dset.create_dataset('param_values', data=simulator.param_values,
+                                compression='gzip', shuffle=True)
+            try:
+                dset.create_dataset('initials', data=simulator.initials,
+                                    compression='gzip', shuffle=True)
+            except SimulatorException:
+                dset.create_dataset('initials_dict', data=_enpickle(
+                    simulator.initials_dict))
+            dset.attrs['simulator_class'] = _enpickle(simulator.__class__)
+            dset.attrs['init_kwargs'] = _enpickle(init_kwargs)
+            dset.attrs['run_kwargs'] = _enpickle(simulator._run_kwargs)
+            dset.attrs['squeeze'] = True
+            dset.attrs['simulations_per_param_set'] = \
+                simulations_per_param_set
+            dset.attrs['pysb_version'] = PYSB_VERSION
+            dset.attrs['timestamp'] = datetime.isoformat(datetime.now())
+            if self.swmr:
+                self._hdf.swmr_mode = True
+        except Exception:
+            self.close()
+            raise
+        self._dset = dset
+
+    def _create_dataset(self, dset, name, shape):
+        sim_size = int(np.prod(shape)) * np.dtype(float).itemsize
+        chunk_sims = max(1, self.CHUNK_BYTES // max(sim_size, 1))
+        dset.create_dataset(name, shape=(0, ) + shape,
+                            maxshape=(None, ) + shape, dtype=float,
+                            chunks=(chunk_sims, ) + shape,
+                            compression='gzip', shuffle=True)
+
+    def append(self, tout, trajectories=None,
+               observables_and_expressions=None):
+        """
+        Append one or more completed simulations to the file
+
+        Parameters
+        ----------
+        tout: numpy.ndarray
+            Time points, either 1D (for a single simulation) or 2D
+            (simulations x time points)
+        trajectories: numpy.ndarray or list, optional
+            Species trajectories, as a 2D array for a single simulation or a
+            3D array or list of 2D arrays for multiple simulations
+        observables_and_expressions: numpy.ndarray or list, optional
+            Observable and expression trajectories (in that order), in the
+            same format as ``trajectories``
+        """
+        if self._dset is None:
+            raise ValueError('SimulationResultWriter has not been started, '
+                             'or has been closed')
+        tout = np.asarray(tout, dtype=float)
+        if tout.ndim == 1:
+            tout = tout[np.newaxis]
+        data = []
+        if trajectories is not None:
+            data.append(('trajectories', trajectories))
+        if observables_and_expressions is not None:
+            obs_exprs = np.asarray(observables_and_expressions, dtype=float)
+            if obs_exprs.ndim == 2:
+                obs_exprs = obs_exprs[np.newaxis]
+            data.append(('observables', obs_exprs[:, :, :self._n_obs]))
+            data.append(('expressions', obs_exprs[:, :, self._n_obs:]))
+        # tout is written last, since readers use its length as the number
+        # of simulations
+        data.append(('tout', tout))
+        start = self._nsims
+        end = start + len(tout)
+        for name, values in data:
+            if name not in self._dset:
+                continue
+            values = np.asarray(values, dtype=float)
+            if values.ndim == 2 and name != 'tout':
+                values = values[np.newaxis]
+            if len(values) != len(tout):
+                raise ValueError('The number of simulations in {} should '
+                                 'match tout'.format(name))
+            dataset = self._dset[name]
+            dataset.resize(end, axis=0)
+            dataset[start:end] = values
+        if self.swmr:
+            for name, _ in data:
+                if name in self._dset:
+                    self._dset[name].flush()
+        else:
+            self._hdf.flush()
+        self._nsims = end
+
+    def close(self):
+        """
+        Close the file, and reset the simulator's per-run overrides
+        """
+        if self._hdf is not None:
+            self._hdf.close()
+            self._hdf = None
+            self._dset = None
+        if self._simulator is not None:
+            self._simulator._reset_run_overrides()
+            self._simulator = None
+
+    def result(self):
+        """
+        A :class:`LazySimulationResult` for the written simulations
+        """
+        return LazySimulationResult(self.filename,
+                                    dataset_name=self.dataset_name,
+                                    group_name=self.group_name)
+
+
+class LazySimulationResult(object):
+    """
+    Simulation results in an HDF5 file, read from disk on demand
+
+    Metadata (model, parameter values, initial conditions) are read on
+    creation. Simulations are read when indexed, either individually or
+    as a slice, which returns an in-memory :class:`SimulationResult`
+    containing only those simulations. The ``param_values`` and
+    ``initials`` of the returned result have one entry per simulation.
+
+    The number of simulations is read from the file each time it is
+    requested, so results can be read while they are being written by a
+    :class:`SimulationResultWriter` (with ``swmr=True``).
+
+    Parameters
+    ----------
+    filename: str
+        Filename from which to load data
+    dataset_name: str or None
+        Dataset name. Can be left as None when the group specified only
+        contains one dataset, which will then be selected. If None and
+        more than one dataset is in the group, a ValueError is raised.
+    group_name: str or None
+        Group name. This is typically the name of the model. Can be left as
+        None when the file only contains one group, which will then be
+        selected. If None and more than group is in the file a
+        ValueError is raised.
+
+    Examples
+    --------
+    Iterate over a file in blocks of 1000 simulations:
+
+    >>> lazy_res = LazySimulationResult('scan.h5') # doctest: +SKIP
+    >>> for start in range(0, lazy_res.nsims, 1000): # doctest: +SKIP
+    ...     df = lazy_res[start:start + 1000].dataframe
+    """
+    def __init__(self, filename, dataset_name=None, group_name=None):
+        if h5py is None:
+            raise Exception('Please "pip install h5py" for this feature')
+        self.filename = filename
+        with self._open() as hdf:
+            grp, dset = _hdf5_result_group(hdf, group_name, dataset_name)
+            self._path = dset.name
+            self._model = pickle.loads(grp['_model'][()])
+            self._param_values = np.array(dset['param_values'])
+            try:
+                self._initials = np.array(dset['initials'])
+            except KeyError:
+                self._initials = pickle.loads(dset['initials_dict'][()])
+            self.squeeze = dset.attrs['squeeze']
+            self.n_sims_per_parameter_set = \
+                dset.attrs['simulations_per_param_set']
+            self._attrs = dict(dset.attrs)
+
+    def _open(self):
+        if h5py.version.hdf5_version_tuple >= (1, 10):
+            return h5py.File(self.filename, 'r', swmr=True)
+        return h5py.File(self.filename, 'r')
+
+    @property
+    def nsims(self):
+        """ The number of simulations currently in the file """
+        with self._open() as hdf:
+            return len(hdf[self._path]['tout'])
+
+    def __len__(self):
+        return self.nsims
+
+    @property
+    def param_values(self):
+        return self._param_values
+
+    @property
+    def initials(self):
+        return self._initials
+
+    def __getitem__(self, key):
+        with self._open() as hdf:
+            dset = hdf[self._path]
+            nsims = len(dset['tout'])
+            if isinstance(key, slice):
+                start, stop, step = key.indices(nsims)
+                if step < 0:
+                    raise ValueError('Negative slice steps are not supported')
+                sims = np.arange(start, stop, step)
+                sel = slice(start, max(start, stop), step)
+            elif isinstance(key, numbers.Integral):
+                sim = key + nsims if key < 0 else key
+                if not 0 <= sim < nsims:
+                    raise IndexError('Simulation index out of range')
+                sims = np.array([sim])
+                sel = slice(sim, sim + 1)
+            else:
+                raise TypeError('Simulations must be selected using an '
+                                'integer or a slice')
+
+            tout = dset['tout'][sel]
+            trajectories = None
+            if 'trajectories' in dset:
+                trajectories = dset['trajectories'][sel]
+            obs_and_exprs = [dset[name][sel] for name in
+                             ('observables', 'expressions') if name in dset]
+            if obs_and_exprs:
+                obs_and_exprs = list(np.concatenate(obs_and_exprs, axis=2))
+
+        param_sets = sims // self.n_sims_per_parameter_set
+        if isinstance(self._initials, np.ndarray):
+            initials = self._initials[param_sets]
+        else:
+            initials = dict((cp, np.asarray(values)[param_sets])
+                            for cp, values in self._initials.items())
+        simres = SimulationResult(
+            simulator=None,
+            model=self._model,
+            initials=initials,
+            param_values=self._param_values[param_sets],
+            tout=tout,
+            trajectories=trajectories,
+            observables_and_expressions=obs_and_exprs or None,
+            squeeze=self.squeeze
+        )
+        simres._load_attrs(self._attrs)
+        return simres
+
+
+def _enpickle(obj):
+    """ Pickle an object for storage in HDF5 (np.void maps to bytes) """
+    return np.void(pickle.dumps(obj, -1))
+
+
+def _hdf5_model_group(hdf, group_name, model):
+    """ Get or create the HDF5 group in which a model's results are stored """
+    try:
+        grp = hdf.create_group(group_name)
+        grp.create_dataset('_model', data=_enpickle(model))
+    except ValueError:
+        grp = hdf[group_name]
+        existing_model = pickle.loads(grp['_model'][()])
+        if existing_model.name != model.name:
+            raise ValueError('SimulationResult model has name "{}", '
+                             'but the model in HDF5 file group "{}" '
+                             'has name "{}"'.format(model.name,
+                                                    group_name,
+                                                    existing_model.name))
+    return grp
+
+
+def _hdf5_result_group(hdf, group_name=None, dataset_name=None):
+    """ Find the model group and result group within an HDF5 file """
+    if group_name is None:
+        groups = hdf.keys()
+        if len(groups) > 1:
+            raise ValueError("group_name must be specified when file "
+                             "contains more than one group. Options "
+                             "are: {}".format(str(groups)))
+        group_name = next(iter(hdf))
+
+    grp = hdf[group_name]
+
+    if dataset_name is None:
+        datasets = list(grp.keys())
+        datasets.remove('_model')
+        if len(datasets) > 1:
+            raise ValueError("dataset_name must be specified when "
+                             "group contains more than one dataset. "
+                             "Options are: {}".format(str(datasets)))
+        dataset_name = datasets[0]
+
+    return grp, grp[dataset_name]
+
+
+def _record_view(data, names, start):
+    """
+    Record array view of consecutive columns of a C-contiguous 2D array
+
+    The view has one record per row of ``data``, with fields ``names``
+    mapped onto the columns from ``start`` onwards. No data is copied.
+    """
+    dtype = np.dtype({
+        'names': names,
+        'formats': [data.dtype] * len(names),
+        'offsets': [data.itemsize * (start + i) for i in range(len(names))],
+        'itemsize': data.itemsize * data.shape[1]
+    })
+    return data.view(dtype)[:, 0]
+
+
+def _observables_matrix(model):
+    """
+    Sparse (n_species x n_observables) matrix of observable coefficients
+
+    Observable trajectories are obtained by multiplying a (time x species)
+    trajectory array by this matrix.
+    """
+    rows = []
+    cols = []
+    coefficients = []
+    for i, obs in enumerate(model.observables):
+        rows.extend(obs.species)
+        cols.extend([i] * len(obs.species))
+        coefficients.extend(obs.coefficients)
+    return scipy.sparse.csc_matrix(
+        (np.array(coefficients, dtype=float), (rows, cols)),
+        shape=(len(model.species), len(model.observables))
+    )
+
+
+def _model_fingerprint(model):
+    """
+    Fingerprint of a model's current state, for snapshot invalidation
+
+    Components and initials are compared by their representations (which
+    include parameter values, rule and expression definitions). The
+    generated network is compared by the identity and length of the
+    species and reaction lists, since these are replaced, not modified,
+    when equations are (re)generated or reset; this avoids examining every
+    species and reaction.
+    """
+    return (
+        model.name,
+        tuple(repr(c) for c in model.all_components()),
+        tuple(repr(ic) for ic in model.initials),
+        tuple(repr(c) for c in model._derived_parameters),
+        tuple(repr(c) for c in model._derived_expressions),
+        len(model.annotations),
+        id(model.species), len(model.species),
+        id(model.reactions), len(model.reactions),
+        len(model.reactions_bidirectional)
+    )
+
 
 def _allow_unicode_recarray():
     """Return True if numpy recarray can take unicode data type.
@@ -1,5 +1,6 @@
 from pysb.simulator.base import Simulator, SimulationResult, SimulatorException
-from pysb.bng import BngFileInterface, load_equations, generate_hybrid_model
+from pysb.bng import BngFileInterface, load_equations, \
+    generate_hybrid_model, _read_simulation_result
 import numpy as np
 import logging
 from pysb.logging import EXTENDED_DEBUG
@@ -7,6 +8,7 @@ from pysb.core import as_complex_pattern, Parameter, \
     InvalidComplexPatternException
 import collections
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 
 class BngSimulator(Simulator):
@@ -25,10 +27,15 @@ class BngSimulator(Simulator):
                                            verbose=verbose)
         self.cleanup = cleanup
         self._outdir = None
+        # BNG .net file generated by the first network-based run, reused
+        # by later runs while the model's network is unchanged
+        self._netfile = None
+        self._network = None
 
     def run(self, tspan=None, initials=None, param_values=None, n_runs=1,
             method='ssa', output_dir=None, output_file_basename=None,
-            cleanup=None, population_maps=None, **additional_args):
+            cleanup=None, population_maps=None, save_to=None,
+            num_processors=1, **additional_args):
         """
         Simulate a model using BioNetGen
 
@@ -76,6 +83,15 @@ class BngSimulator(Simulator):
         population_maps: list of PopulationMap
             List of :py:class:`PopulationMap` objects for hybrid
             particle/population modeling. Only used when method='nf'.
+        save_to : str or SimulationResultWriter, optional
+            If set, simulation results are written to this HDF5 file one
+            simulation at a time, instead of being kept in memory, and a
+            :class:`LazySimulationResult` is returned. See
+            :class:`SimulationResultWriter`.
+        num_processors : int, optional
+            Number of processes with which to read BioNetGen's output files
+            (default: 1). Worthwhile for runs with many simulations or long
+            trajectories. Simulations themselves are run by BioNetGen.
         additional_args: kwargs, optional
             Additional arguments to pass to BioNetGen
 
@@ -164,6 +180,14 @@ class BngSimulator(Simulator):
         else:
             model_to_load = self._model
 
+        reuse_network = method != 'nf' and self._netfile is not None and \
+            self._model.reaction_network is self._network
+        if reuse_network:
+            # Simulate the network file from an earlier run, instead of
+            # generating the network from the model's BNGL again
+            self._logger.debug('Reusing the previously generated network')
+            model_to_load = None
+
         with BngFileInterface(model_to_load,
                               verbose=verbose_bool,
                               output_dir=output_dir,
@@ -177,8 +201,10 @@ class BngSimulator(Simulator):
                 self._logger.debug('HPP BNGL:\n\n' + hpp_bngl)
                 with open(hpp_bngl_filename, 'w') as f:
                     f.write(hpp_bngl)
-            if method != 'nf':
-                # TODO: Write existing netfile if already generated
+            if reuse_network:
+                with open(bngfile.net_filename, 'w') as f:
+                    f.write(self._netfile)
+            elif method != 'nf':
                 bngfile.action('generate_network', overwrite=True,
                                verbose=extended_debug)
             if output_file_basename is None:
@@ -208,38 +234,90 @@ class BngSimulator(Simulator):
                 bngfile.execute(reload_netfile=hpp_bngl_filename,
                                 skip_file_actions=True)
             else:
-                bngfile.execute()
-            if method != 'nf':
+                bngfile.execute(reload_netfile=reuse_network)
+            if method != 'nf' and not reuse_network:
+                # Load the network, so model.species matches the order of
+                # species in BNG's output
                 load_equations(self.model, bngfile.net_filename)
-            list_of_yfull = \
-                BngFileInterface.read_simulation_results_multi(
-                [bngfile.base_filename + str(n) for n in range(total_sims)])
+                self._netfile = bngfile.read_netfile()
+                self._network = self._model.reaction_network
+            base_filenames = [bngfile.base_filename + str(n)
+                              for n in range(total_sims)]
+            if save_to is not None:
+                # Read and write one simulation at a time
+                writer = self._result_writer(
+                    save_to, len(self.tspan),
+                    simulations_per_param_set=n_runs,
+                    species=method != 'nf')
+                try:
+                    for yfull in _iter_simulation_results(base_filenames,
+                                                          num_processors):
+                        tout, species, obs_exp = self._split_yfull(yfull,
+                                                                   method)
+                        writer.append(tout, species, obs_exp)
+                finally:
+                    writer.close()
+                return writer.result()
+            list_of_yfull = BngFileInterface.read_simulation_results_multi(
+                base_filenames, num_processors=num_processors)
 
         tout = []
         species_out = []
         obs_exp_out = []
-        for i in range(total_sims):
-            yfull = list_of_yfull[i]
-            yfull_view = yfull.view(float).reshape(len(yfull), -1)
-
-            tout.append(yfull_view[:, 0])
-
-            if method == 'nf':
-                obs_exp_out.append(yfull_view[:, 1:])
-            else:
-                species_out.append(yfull_view[:,
-                                   1:(len(self.model.species) + 1)])
-                if len(self.model.observables) or len(self.model.expressions):
-                    obs_exp_out.append(yfull_view[:,
-                                        (len(self.model.species) + 1):
-                                        (len(self.model.species) + 1) +
-                                        len(self.model.observables) +
-                                        len(self.model.expressions_dynamic())])
+        for yfull in list_of_yfull:
+            t, species, obs_exp = self._split_yfull(yfull, method)
+            tout.append(t)
+            if species is not None:
+                species_out.append(species)
+            if obs_exp is not None:
+                obs_exp_out.append(obs_exp)
 
         return SimulationResult(self, tout=tout, trajectories=species_out,
                                 observables_and_expressions=obs_exp_out,
                                 simulations_per_param_set=n_runs)
 
+    def _split_yfull(self, yfull, method):
+        """
+        Split BNG output into time, species and observables/expressions
+        """
+        yfull_view = yfull.view(float).reshape(len(yfull), -1)
+        tout = yfull_view[:, 0]
+
+        if method == 'nf':
+            return tout, None, yfull_view[:, 1:]
+
+        species = yfull_view[:, 1:(len(self.model.species) + 1)]
+        obs_exp = None
+        if len(self.model.observables) or len(self.model.expressions):
+            obs_exp = yfull_view[:,
+                                 (len(self.model.species) + 1):
+                                 (len(self.model.species) + 1) +
+                                 len(self.model.observables) +
+                                 len(self.model.expressions_dynamic())]
+        return tout, species, obs_exp
+
+
+def _iter_simulation_results(base_filenames, num_processors=1):
+    """
+    Read the results of BNG simulations one at a time, in order
+
+    With num_processors > 1, files are read ahead in a process pool, with
+    at most two per process in flight, to bound memory use.
+    """
+    if num_processors == 1:
+        for base_filename in base_filenames:
+            yield _read_simulation_result(base_filename)
+        return
+    with ProcessPoolExecutor(num_processors) as executor:
+        pending = collections.deque()
+        for base_filename in base_filenames:
+            pending.append(executor.submit(_read_simulation_result,
+                                           base_filename))
+            if len(pending) >= 2 * num_processors:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 
 class PopulationMap(object):
     """
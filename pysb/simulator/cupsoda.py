@@ -478,20 +478,8 @@ class CupSodaSimulator(Simulator):
 
         # left_side
         with open(os.path.join(directory, "left_side"), 'w') as left_side:
-            for i in range(self._len_rxns):
-                line = ""
-                for j in range(self._len_species):
-                    if j > 0:
-                        line += "\t"
-                    stoich = 0
-                    for k in self._model.reactions[i]['reactants']:
-                        if j == k:
-                            stoich += 1
-                    line += str(stoich)
-                if i < self._len_rxns - 1:
-                    left_side.write(line + "\n")
-                else:
-                    left_side.write(line)
+            left_side.write(self._format_matrix(
+                self._reaction_counts('reactants')))
 
         # max_steps
         with open(os.path.join(directory, "max_steps"), 'w') as mxsteps:
@@ -524,20 +512,8 @@ class CupSodaSimulator(Simulator):
 
         # right_side
         with open(os.path.join(directory, "right_side"), 'w') as right_side:
-            for i in range(self._len_rxns):
-                line = ""
-                for j in range(self._len_species):
-                    if j > 0:
-                        line += "\t"
-                    stochiometry = 0
-                    for k in self._model.reactions[i]['products']:
-                        if j == k:
-                            stochiometry += 1
-                    line += str(stochiometry)
-                if i < self._len_rxns - 1:
-                    right_side.write(line + "\n")
-                else:
-                    right_side.write(line)
+            right_side.write(self._format_matrix(
+                self._reaction_counts('products')))
 
         # rtol
         with open(os.path.join(directory, "rtol"), 'w') as rtol:
@@ -552,6 +528,37 @@ class CupSodaSimulator(Simulator):
         with open(os.path.join(directory, "time_max"), 'w') as time_max:
             time_max.write(str(float(self.tspan[-1])))
 
+    def _reaction_counts(self, side):
+        """
+        Count the reactants or products of each reaction
+
+        Parameters
+        ----------
+        side: str
+            'reactants' or 'products'
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer array of shape (reactions, species)
+        """
+        network = self._model.reaction_network
+        if network is not None:
+            if side == 'reactants':
+                counts = network.reactant_matrix(self._len_species)
+            else:
+                counts = network.product_matrix(self._len_species)
+            return counts.toarray()
+        counts = np.zeros((self._len_rxns, self._len_species), dtype=int)
+        for i, rxn in enumerate(self._model.reactions):
+            for k in rxn[side]:
+                counts[i, k] += 1
+        return counts
+
+    @staticmethod
+    def _format_matrix(matrix):
+        return "\n".join("\t".join(str(x) for x in row) for row in matrix)
+
     def _get_cmatrix(self):
         self._logger.debug("Constructing the c_matrix:")
         c_matrix = np.zeros((len(self.param_values), self._len_rxns))
@@ -1,5 +1,6 @@
 from pysb.simulator.base import Simulator, SimulationResult
 import scipy.integrate
+import scipy.sparse
 try:
     # weave is not available under Python 3.
     from weave import inline as weave_inline
@@ -19,6 +20,8 @@ except ImportError:
 from sympy.printing.lambdarepr import lambdarepr
 import distutils
 import pysb.bng
+import pysb.core
+import pysb.cache
 import sympy
 import re
 import numpy as np
@@ -27,10 +30,32 @@ import os
 from pysb.logging import get_logger, EXTENDED_DEBUG
 import logging
 import itertools
+import collections
+import tempfile
+import threading
+import time
+import pickle
+import uuid
 import contextlib
 import importlib
+import shutil
+import sysconfig
+import sys
+import concurrent.futures
 from concurrent.futures import ProcessPoolExecutor, Executor, Future
 
+_KERNEL_CACHE_NAMESPACE = 'cython'
+
+# Whether process pools can initialise their workers (Python >= 3.7)
+_POOL_INITIALIZER = sys.version_info >= (3, 7)
+
+# Integrators provided by scipy.integrate.solve_ivp, which support sparse
+# Jacobians (name used by ScipyOdeSimulator: solve_ivp method name)
+_SOLVE_IVP_METHODS = {'bdf': 'BDF', 'radau': 'Radau'}
+
+# Identifiers in generated code (see ScipyOdeSimulator._eqn_substitutions)
+_IDENTIFIER_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+
 
 class ScipyOdeSimulator(Simulator):
     """
@@ -73,15 +98,34 @@ class ScipyOdeSimulator(Simulator):
 
         * ``integrator``: Choice of integrator, including ``vode`` (default),
           ``zvode``, ``lsoda``, ``dopri5`` and ``dop853``. See
-          :func:`scipy.integrate.ode` for further information.
+          :func:`scipy.integrate.ode` for further information. The stiff
+          integrators ``bdf`` and ``radau`` from
+          :func:`scipy.integrate.solve_ivp` are also available; these
+          exploit the sparsity of the Jacobian (as a sparse analytic
+          Jacobian if ``use_analytic_jacobian`` is True, or a sparsity
+          pattern for finite differences otherwise), which is much faster
+          for large reaction networks.
         * ``integrator_options``: A dictionary of keyword arguments to
-          supply to the integrator. See :func:`scipy.integrate.ode`.
+          supply to the integrator. See :func:`scipy.integrate.ode` or
+          :func:`scipy.integrate.solve_ivp`.
+        * ``use_analytic_jacobian``: Boolean, compute the Jacobian
+          symbolically (only its structurally non-zero entries, determined
+          from the stoichiometry matrix and reaction rates) rather than by
+          finite differences within the integrator.
         * ``compiler``: Choice of compiler for ODE system: ``cython``,
           ``weave`` (Python 2 only), ``theano`` or ``python``. Leave
           unspecified or equal to None for auto-select (tries weave,
           then cython, then python). Cython, weave and theano all compile the
           equation system into C code. Python is the slowest but most
-          compatible.
+          compatible. Compiled Cython kernels are cached on disk and
+          shared between processes; see :mod:`pysb.cache`.
+        * ``cython_directives``: A dictionary of Cython compiler directives
+          used when ``compiler='cython'``. Defaults to
+          :attr:`default_cython_directives`.
+        * ``codegen_num_processors``: Number of processes used to print the
+          reaction rates to code for the ``cython`` and ``weave`` compilers
+          (default: 1). Worthwhile only for networks with many thousands of
+          reactions.
         * ``cleanup``: Boolean, `cleanup` argument used for
           :func:`pysb.bng.generate_equations` call
 
@@ -130,6 +174,15 @@ class ScipyOdeSimulator(Simulator):
         },
         'lsoda': {
             'mxstep': 2**31-1,
+        },
+        # Match vode's default tolerances
+        'bdf': {
+            'rtol': 1e-6,
+            'atol': 1e-12,
+        },
+        'radau': {
+            'rtol': 1e-6,
+            'atol': 1e-12,
         }
     }
 
@@ -156,11 +209,21 @@ class ScipyOdeSimulator(Simulator):
         integrator = kwargs.pop('integrator', 'vode')
         compiler_mode = kwargs.pop('compiler', None)
         integrator_options = kwargs.pop('integrator_options', {})
+        cython_directives = kwargs.pop('cython_directives',
+                                       self.default_cython_directives)
+        codegen_num_processors = kwargs.pop('codegen_num_processors', 1)
 
         if kwargs:
             raise ValueError('Unknown keyword argument(s): {}'.format(
                 ', '.join(kwargs.keys())
             ))
+        # Worker pool for parallel runs, created on demand (see run)
+        self._executor = None
+        self._executor_key = None
+        self._run_prefix = None
+        self._run_count = 0
+        # Identifies this simulator's kernels to executor workers
+        self._kernel_id = uuid.uuid4().hex
         # Generate the equations for the model
         pysb.bng.generate_equations(self._model, self.cleanup, self.verbose)
 
@@ -169,7 +232,9 @@ class ScipyOdeSimulator(Simulator):
                           e in self._model.expressions}
         self._eqn_subs.update({e: e.expand_expr(expand_observables=True) for
                                e in self._model._derived_expressions})
-        ode_mat = sympy.Matrix(self.model.odes).subs(self._eqn_subs)
+        # The full symbolic ODEs are only needed by the python and theano
+        # compilers and for the analytic Jacobian
+        ode_mat = None
 
         if compiler_mode is None:
             self._compiler = self._autoselect_compiler()
@@ -192,19 +257,13 @@ class ScipyOdeSimulator(Simulator):
 
         if self._compiler in ('weave', 'cython'):
             # Prepare the string representations of the RHS equations
-
-            code_eqs = '\n'.join(['ydot[%d] = %s;' %
-                                  (i, eqn_repr(o))
-                                  for i, o in enumerate(ode_mat)])
-            code_eqs = str(self._eqn_substitutions(code_eqs))
+            code_eqs = self._rhs_code(eqn_repr, codegen_num_processors)
 
             # Allocate ydot here, once.
             ydot = np.zeros(len(self.model.species))
 
             if self._compiler == 'cython':
-                self._compiler_directives = kwargs.pop(
-                    'cython_directives', self.default_cython_directives
-                )
+                self._compiler_directives = cython_directives
 
                 if not Cython:
                     raise ImportError('Cython library is not installed')
@@ -212,11 +271,9 @@ class ScipyOdeSimulator(Simulator):
                 rhs = _get_rhs(self._compiler,
                                code_eqs,
                                ydot=ydot,
-                               compiler_directives=self._compiler_directives
+                               compiler_directives=self._compiler_directives,
+                               logger=self._logger
                                )
-
-                with _set_cflags_no_warnings(self._logger):
-                    rhs(0.0, self.initials[0], self.param_values[0])
             else:
                 # Weave
                 self._compiler_directives = []
@@ -249,6 +306,7 @@ class ScipyOdeSimulator(Simulator):
             self._code_eqs = code_eqs
 
         elif self._compiler in ('theano', 'python'):
+            ode_mat = self._ode_matrix()
             self._symbols = sympy.symbols(','.join('__s%d' % sp_id for sp_id in
                                                    range(len(
                                                        self.model.species)))
@@ -271,8 +329,8 @@ class ScipyOdeSimulator(Simulator):
                     on_unused_input='ignore'
                 )
             else:
-                code_eqs_py = sympy.lambdify(self._symbols,
-                                             sympy.flatten(ode_mat))
+                code_eqs_py = _Lambdified(self._symbols,
+                                          sympy.flatten(ode_mat))
 
             rhs = _get_rhs(self._compiler, code_eqs_py)
             self._code_eqs = code_eqs_py
@@ -285,12 +343,59 @@ class ScipyOdeSimulator(Simulator):
         # put together the sensitivity matrix)
         jac_fn = None
         self._jac_eqs = None
+        self._jac_sparsity = None
+        if self._use_analytic_jacobian or integrator in _SOLVE_IVP_METHODS:
+            self._jac_sparsity = self._jacobian_sparsity()
         if self._use_analytic_jacobian:
+            # Differentiate the structurally non-zero entries only, in
+            # column-major (CSC) order
+            if ode_mat is None:
+                ode_mat = self._ode_matrix()
             species_symbols = [sympy.Symbol('__s%d' % i)
                                for i in range(len(self._model.species))]
-            jac_matrix = ode_mat.jacobian(species_symbols)
-
-            if self._compiler == 'theano':
+            jac_indptr = self._jac_sparsity.indptr
+            jac_entries = [
+                (i, j, ode_mat[i].diff(species_symbols[j]))
+                for j in range(len(species_symbols))
+                for i in self._jac_sparsity.indices[
+                    jac_indptr[j]:jac_indptr[j + 1]]
+            ]
+            if self._compiler in ('theano', 'python') and \
+                    integrator not in _SOLVE_IVP_METHODS:
+                jac_matrix = sympy.zeros(len(self._model.odes),
+                                         len(self._model.species))
+                for i, j, entry in jac_entries:
+                    jac_matrix[i, j] = entry
+
+            if integrator in _SOLVE_IVP_METHODS:
+                # Sparse Jacobian: the kernel fills the CSC data array
+                if self._compiler == 'cython':
+                    jac_eqs = str(self._eqn_substitutions('\n'.join(
+                        'jac[%d] = %s;' % (k, eqn_repr(entry))
+                        for k, (_, _, entry) in enumerate(jac_entries)
+                    )))
+                    if '# Not supported in Python' in jac_eqs:
+                        raise ValueError('Analytic Jacobian calculation '
+                                         'failed')
+                    jac_data = np.zeros(len(jac_entries))
+                    jac_fn = _get_rhs(
+                        self._compiler,
+                        jac_eqs,
+                        compiler_directives=self._compiler_directives,
+                        jac=jac_data,
+                        logger=self._logger
+                    )
+                    self._jac_eqs = jac_eqs
+                elif self._compiler == 'python':
+                    self._jac_eqs = _Lambdified(
+                        self._symbols, [entry for _, _, entry in jac_entries]
+                    )
+                else:
+                    raise ValueError(
+                        'Integrator "{}" with an analytic Jacobian is only '
+                        'supported with the "cython" and "python" '
+                        'compilers'.format(integrator))
+            elif self._compiler == 'theano':
                 jac_eqs_py = theano_function(
                     self._symbols,
                     [j if not j.is_zero else theano.tensor.zeros(1)
@@ -307,15 +412,13 @@ class ScipyOdeSimulator(Simulator):
             elif self._compiler in ('weave', 'cython'):
                 # Prepare the stringified Jacobian equations.
                 jac_eqs_list = []
-                for i in range(jac_matrix.shape[0]):
-                    for j in range(jac_matrix.shape[1]):
-                        entry = jac_matrix[i, j]
-                        # Skip zero entries in the Jacobian
-                        if entry == 0:
-                            continue
-                        jac_eq_str = 'jac[%d, %d] = %s;' % (
-                            i, j, eqn_repr(entry))
-                        jac_eqs_list.append(jac_eq_str)
+                for i, j, entry in jac_entries:
+                    # Skip zero entries in the Jacobian
+                    if entry == 0:
+                        continue
+                    jac_eq_str = 'jac[%d, %d] = %s;' % (
+                        i, j, eqn_repr(entry))
+                    jac_eqs_list.append(jac_eq_str)
                 jac_eqs = str(self._eqn_substitutions('\n'.join(jac_eqs_list)))
                 if '# Not supported in Python' in jac_eqs:
                     raise ValueError('Analytic Jacobian calculation failed')
@@ -349,14 +452,12 @@ class ScipyOdeSimulator(Simulator):
                         self._compiler,
                         jac_eqs,
                         compiler_directives=self._compiler_directives,
-                        jac=jac
+                        jac=jac,
+                        logger=self._logger
                     )
-
-                    with _set_cflags_no_warnings(self._logger):
-                        jac_fn(0.0, self.initials[0], self.param_values[0])
                 self._jac_eqs = jac_eqs
             else:
-                jac_eqs_py = sympy.lambdify(self._symbols, jac_matrix, "numpy")
+                jac_eqs_py = _Lambdified(self._symbols, jac_matrix, "numpy")
 
                 jac_fn = _get_rhs(self._compiler, jac_eqs_py)
 
@@ -373,13 +474,146 @@ class ScipyOdeSimulator(Simulator):
         # defaults
         self.opts = options
 
-        if integrator != 'lsoda':
+        if integrator not in _SOLVE_IVP_METHODS and integrator != 'lsoda':
             # Only used to check the user has selected a valid integrator
             self.integrator = scipy.integrate.ode(rhs, jac=jac_fn)
             with warnings.catch_warnings():
                 warnings.filterwarnings('error', 'No integrator name match')
                 self.integrator.set_integrator(integrator, **options)
 
+    def _ode_matrix(self):
+        """ODE right-hand sides with expressions and observables expanded"""
+        return sympy.Matrix(self._model.odes).subs(self._eqn_subs)
+
+    def _rhs_code(self, eqn_repr, num_processors=1):
+        """
+        Code for the ODE right-hand side, generated from the reaction network
+
+        Rather than printing each ODE in full, which repeats the rate of a
+        reaction in the equation of every species it changes, each rate is
+        printed and evaluated once, as a flux ``_r<j>`` for reaction ``j``.
+        The derivatives are then sums of fluxes, with coefficients taken
+        from the stoichiometry matrix. Observables and expressions used by
+        the rates are evaluated once too, as locals ``_o<k>`` and ``_e<k>``,
+        in dependency order.
+
+        Parameters
+        ----------
+        eqn_repr : callable
+            Function printing a SymPy expression as code: ``lambdarepr``
+            (Cython) or ``sympy.ccode`` (weave).
+        num_processors : int
+            Number of processes to print the expressions with.
+
+        Returns
+        -------
+        str
+            Code assigning every element of ``ydot``, with local variables
+            declared as ``cdef double`` (Cython) or ``double`` (weave).
+        """
+        stoich = self._model.stoichiometry_matrix
+        reactions = np.unique(stoich.indices)
+        rates = [self._model.reactions[j]['rate'] for j in reactions]
+
+        # Observables and expressions used by the rates, dependencies first
+        aux = collections.OrderedDict()
+
+        def _visit(sym):
+            if sym in aux:
+                return
+            if isinstance(sym, pysb.core.Expression):
+                for dep in sym.expr.free_symbols:
+                    _visit(dep)
+                aux[sym] = ('_e%d', sym.expr)
+            elif isinstance(sym, pysb.core.Observable):
+                aux[sym] = ('_o%d', sym.expand_obs())
+
+        for rate in rates:
+            for sym in rate.free_symbols:
+                _visit(sym)
+
+        local_names = {}
+        lhs = []
+        for k, (sym, (name_fmt, _)) in enumerate(aux.items()):
+            local_names[sym.name] = lhs_name = name_fmt % k
+            lhs.append(lhs_name)
+        lhs.extend('_r%d' % j for j in reactions)
+        rhs = self._eqn_substitutions(
+            _print_exprs(eqn_repr, [expr for _, expr in aux.values()] + rates,
+                         num_processors),
+            local_names
+        )
+
+        if self._compiler == 'cython':
+            lines = ['cdef double %s' % name for name in lhs]
+            lines.extend('%s = %s;' % assign for assign in zip(lhs, rhs))
+        else:
+            lines = ['double %s = %s;' % assign for assign in zip(lhs, rhs)]
+        for i in range(stoich.shape[0]):
+            terms = []
+            for j, v in zip(stoich.indices[stoich.indptr[i]:
+                                           stoich.indptr[i + 1]],
+                            stoich.data[stoich.indptr[i]:
+                                        stoich.indptr[i + 1]]):
+                coeff = '%d*' % abs(v) if abs(v) != 1 else ''
+                terms.append('%s %s_r%d' % ('-' if v < 0 else '+', coeff, j))
+            if terms:
+                eqn = ' '.join(terms)
+                eqn = eqn[2:] if eqn.startswith('+') else '-' + eqn[2:]
+            else:
+                eqn = '0'
+            lines.append('ydot[%d] = %s;' % (i, eqn))
+        return '\n'.join(lines)
+
+    def _jacobian_sparsity(self):
+        """
+        Structural sparsity pattern of the ODE Jacobian
+
+        Derived from the stoichiometry matrix and the species each reaction
+        rate depends on (after expanding expressions and observables):
+        d(ode_i)/d(species_j) can only be non-zero if some reaction changes
+        species i and has a rate depending on species j.
+
+        Returns
+        -------
+        scipy.sparse.csc_matrix
+            Boolean (n_odes x n_species) matrix with sorted indices
+        """
+        species_deps = {}
+
+        def _deps(sym):
+            try:
+                return species_deps[sym]
+            except KeyError:
+                pass
+            if sym in self._eqn_subs:
+                deps = set()
+                for s in self._eqn_subs[sym].free_symbols:
+                    deps.update(_deps(s))
+            elif sym.name.startswith('__s'):
+                deps = {int(sym.name[3:])}
+            else:
+                deps = set()
+            species_deps[sym] = deps
+            return deps
+
+        rows = []
+        cols = []
+        for r, rxn in enumerate(self._model.reactions):
+            for sym in rxn['rate'].free_symbols:
+                for sp in _deps(sym):
+                    rows.append(r)
+                    cols.append(sp)
+        n_species = len(self._model.species)
+        rate_deps = scipy.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(self._model.reactions), n_species)
+        )
+        stoich = abs(self._model.stoichiometry_matrix).astype(float)
+        sparsity = (stoich * rate_deps).tocsc() != 0
+        sparsity.sort_indices()
+        return sparsity
+
     @property
     def _patch_distutils_logging(self):
         """Return distutils logging context manager based on our logger."""
@@ -470,25 +704,38 @@ class ScipyOdeSimulator(Simulator):
         # Default to python/lambdify
         return 'python'
 
-    def _eqn_substitutions(self, eqns):
+    def _eqn_substitutions(self, eqns, local_names=None):
         """String substitutions on the sympy C code for the ODE RHS and
         Jacobian functions to use appropriate terms for variables and
-        parameters."""
-        # Substitute 'y[i]' for 'si'
-        eqns = re.sub(r'\b__s(\d+)\b',
-                      lambda m: 'y[%s]' % (int(m.group(1))),
-                      eqns)
-
-        # Substitute 'p[i]' for any named parameters
-        for i, p in enumerate(self._model.parameters):
-            eqns = re.sub(r'\b(%s)\b' % p.name, 'p[%d]' % i, eqns)
-        for i, p in enumerate(self._model._derived_parameters):
-            eqns = re.sub(r'\b(%s)\b' % p.name,
-                          'p[%d]' % (i + len(self._model.parameters)), eqns)
-        return eqns
+        parameters.
+
+        Species ``__s<i>`` become ``y[i]`` and parameters (including derived
+        parameters) become ``p[i]``, in a single pass over the identifiers
+        in the code. Names in the optional `local_names` dict are renamed to
+        the corresponding values. `eqns` may be a string or a list of
+        strings.
+        """
+        names = {p.name: 'p[%d]' % i for i, p in enumerate(itertools.chain(
+            self._model.parameters, self._model._derived_parameters))}
+        if local_names:
+            names.update(local_names)
+
+        def _substitute(match):
+            name = match.group(0)
+            try:
+                return names[name]
+            except KeyError:
+                pass
+            if name.startswith('__s') and name[3:].isdigit():
+                return 'y[%d]' % int(name[3:])
+            return name
+
+        if isinstance(eqns, list):
+            return [_IDENTIFIER_RE.sub(_substitute, eqn) for eqn in eqns]
+        return _IDENTIFIER_RE.sub(_substitute, eqns)
 
     def run(self, tspan=None, initials=None, param_values=None,
-            num_processors=1):
+            num_processors=1, batch_size=None, save_to=None, executor=None):
         """
         Run a simulation and returns the result (trajectories)
 
@@ -507,49 +754,259 @@ class ScipyOdeSimulator(Simulator):
             Number of processes to use (default: 1). Set to a larger number
             (e.g. the number of CPU cores available) for parallel execution of
             simulations. This is only useful when simulating with more than one
-            set of initial conditions and/or parameters.
+            set of initial conditions and/or parameters. The worker
+            processes receive the model's equations once, and are kept
+            running between calls to :func:`run` until :func:`close` is
+            called or the number of processes or integrator options change.
+            They read initial conditions and parameter values from, and
+            write trajectories to, shared memory (except when ``save_to``
+            is set, when trajectories are returned to this process).
+            Simulations are sent to workers in chunks,
+            sized from the measured cost of earlier simulations and
+            shrinking towards the end of the run, so that workers finish at
+            about the same time even when simulation costs vary.
+        batch_size : int, optional
+            If set, simulations are grouped into batches of up to this many
+            simulations, and each batch is integrated as one stacked system
+            with a single (shared) step size controller. The right hand side
+            is evaluated for the whole batch at once, using a compiled loop
+            over the batch (``cython`` compiler) or NumPy array operations
+            (``python`` compiler), which gives much higher throughput for
+            large parameter scans of small models, where per-simulation
+            overhead dominates the cost of integration. Implicit integrators
+            use a banded (``vode``, ``lsoda``) or sparse (``bdf``,
+            ``radau``) finite-difference Jacobian, since the stacked
+            system's Jacobian is block diagonal; the analytic Jacobian is not
+            used.
+            Batches are distributed across processes when
+            ``num_processors > 1``. Results agree with unbatched
+            simulations to within the integrator tolerances.
+        save_to : str or SimulationResultWriter, optional
+            If set, simulations are written to this HDF5 file as they
+            complete, instead of being kept in memory, and a
+            :class:`LazySimulationResult` is returned. See
+            :class:`SimulationResultWriter`.
+        executor : concurrent.futures.Executor, optional
+            Executor on which to run simulations instead of this
+            simulator's worker processes, e.g. a pool shared with other
+            code or an ``mpi4py.futures.MPIPoolExecutor``. Inputs and
+            trajectories are sent through the executor rather than shared
+            memory, and the model's kernels are sent once to each worker.
+            The number of chunks of work in flight is set from the
+            executor's number of workers where available (``max_workers``
+            of the standard library executors), or ``num_processors``
+            otherwise.
 
         Returns
         -------
-        A :class:`SimulationResult` object
+        A :class:`SimulationResult` object, or a
+        :class:`LazySimulationResult` if ``save_to`` is set
         """
         super(ScipyOdeSimulator, self).run(tspan=tspan,
                                            initials=initials,
                                            param_values=param_values,
                                            _run_kwargs=[])
-        n_sims = len(self.param_values)
-
-        num_species = len(self._model.species)
-        num_odes = len(self._model.odes)
-        results = []
-        if num_processors == 1:
+        initials = self.initials
+        param_values = self.param_values
+        n_sims = len(param_values)
+
+        if batch_size is not None and self._compiler not in ('cython',
+                                                             'python'):
+            raise ValueError('batch_size is only supported with the '
+                             '"cython" and "python" compilers')
+        writer = None
+        if save_to is not None:
+            writer = self._result_writer(save_to, len(self.tspan))
+        if executor is not None:
+            self._logger.debug('Running on supplied executor {}'.format(
+                executor))
+        elif num_processors == 1:
             self._logger.debug('Single processor (serial) mode')
         else:
             self._logger.debug('Multi-processor (parallel) mode using {} '
                                'processes'.format(num_processors))
-        with SerialExecutor() if num_processors == 1 else \
-                ProcessPoolExecutor(max_workers=num_processors) as executor:
-            for n in range(n_sims):
-                results.append(executor.submit(
-                    _integrator_process,
-                    self._code_eqs,
-                    self._jac_eqs,
-                    num_species,
-                    num_odes,
-                    self.initials[n],
-                    self.tspan,
-                    self.param_values[n],
-                    self._init_kwargs.get('integrator', 'vode'),
-                    compiler=self._compiler,
-                    integrator_opts=self.opts,
-                    compiler_directives=self._compiler_directives
-                ))
-            trajectories = [r.result() for r in results]
-
-        tout = np.array([self.tspan] * n_sims)
+        try:
+            trajectories = self._run_simulations(
+                initials, param_values, num_processors, batch_size, writer,
+                executor)
+        finally:
+            if writer is not None:
+                writer.close()
         self._logger.info('All simulation(s) complete')
+        if writer is not None:
+            return writer.result()
+        tout = np.array([self.tspan] * n_sims)
         return SimulationResult(self, tout, trajectories)
 
+    def _run_simulations(self, initials, param_values, num_processors,
+                         batch_size, writer=None, executor=None):
+        """
+        Run simulations in chunks, returning their trajectories
+
+        Chunks (see :class:`_ChunkScheduler`) are submitted to the
+        executor, which defaults to running them in this process if
+        num_processors is 1, or to the simulator's worker pool otherwise.
+        Two chunks per worker are kept in flight, so idle workers can
+        always take the next one. If writer is supplied, trajectories are
+        instead appended to it in order as they complete, and None is
+        returned.
+
+        The simulator's own workers receive the model's kernels once, when
+        the pool starts, and read each run's initial conditions and
+        parameter values from shared memory, so tasks only carry the run
+        number and a range of simulation indices. Other executors receive
+        the kernels with the first task each worker runs (see
+        :func:`_simulate_chunk`), then tasks carry the chunk's inputs.
+        """
+        n_sims = len(param_values)
+        num_species = len(self._model.species)
+        out_shape = (n_sims, len(self.tspan), num_species)
+        kernel_args = (self._code_eqs, self._jac_eqs, num_species,
+                       len(self._model.odes),
+                       self._init_kwargs.get('integrator', 'vode'),
+                       self._compiler, dict(self.opts),
+                       self._compiler_directives, self._jac_sparsity)
+        kernel_key = pysb.cache.cache_key(self._kernel_id,
+                                          sorted(self.opts.items()))
+        own_pool = executor is None and num_processors > 1
+        if own_pool and self._compiler == 'theano':
+            raise ValueError('num_processors > 1 is not supported with the '
+                             '"theano" compiler, since theano functions '
+                             'cannot be sent to worker processes. '
+                             'Alternatively, supply a thread-based executor.')
+        if executor is None:
+            executor = self._get_executor(num_processors, kernel_args,
+                                          kernel_key) if own_pool \
+                else SerialExecutor()
+        shared = own_pool and _POOL_INITIALIZER
+        if shared or executor is self._executor:
+            n_workers = num_processors
+        elif isinstance(executor, SerialExecutor):
+            n_workers = 1
+        else:
+            n_workers = getattr(executor, '_max_workers', None) or \
+                num_processors
+
+        out = None
+        shared_files = []
+        if shared:
+            run = self._run_count
+            self._run_count += 1
+            run_file = '{}{}.pkl'.format(self._run_prefix, run)
+            shared_out = None
+            if writer is None and np.prod(out_shape):
+                out, shared_out = _shared_output(out_shape)
+                shared_files.append(shared_out[0])
+            shared_inputs = []
+            for values in (initials, param_values):
+                values = np.asarray(values, dtype=float)
+                shared_values, shared_input = _shared_output(values.shape)
+                shared_files.append(shared_input[0])
+                shared_values[:] = values
+                shared_inputs.append(shared_input)
+            with open(run_file, 'wb') as f:
+                pickle.dump((shared_inputs, shared_out, self.tspan,
+                             batch_size), f, protocol=2)
+            shared_files.append(run_file)
+        elif writer is None:
+            out = np.empty(out_shape)
+
+        def submit(start, stop, send_kernels=False):
+            if shared:
+                future = executor.submit(_run_worker_chunk, run, start, stop)
+            else:
+                future = executor.submit(
+                    _simulate_chunk, kernel_key,
+                    kernel_args if send_kernels else None, start,
+                    initials[start:stop], param_values[start:stop],
+                    self.tspan, batch_size)
+            pending.add(future)
+
+        scheduler = _ChunkScheduler(n_sims, n_workers, batch_size)
+        pending = set()
+        # Chunks awaiting writing, by start index, and next index to write
+        completed = {}
+        next_write = 0
+        try:
+            while True:
+                while len(pending) < 2 * n_workers:
+                    chunk = scheduler.next_chunk()
+                    if chunk is None:
+                        break
+                    submit(*chunk)
+                if not pending:
+                    break
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result[2] is None:
+                        # The worker doesn't have the kernels yet
+                        submit(result[0], result[1], send_kernels=True)
+                        continue
+                    start, stop, elapsed, trajectories = result
+                    scheduler.record(stop - start, elapsed)
+                    if writer is None:
+                        if trajectories is not None:
+                            out[start:stop] = trajectories
+                        continue
+                    completed[start] = (stop, trajectories)
+                    while next_write in completed:
+                        next_write, trajectories = completed.pop(next_write)
+                        writer.append(
+                            np.tile(self.tspan, (len(trajectories), 1)),
+                            trajectories)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            if own_pool:
+                # The pool may be broken (e.g. if a worker was killed)
+                self.close()
+            raise
+        finally:
+            if shared:
+                if out is not None:
+                    out = _release_shared_output(out, shared_files.pop(0))
+                for filename in shared_files:
+                    _remove_shared_file(filename)
+        return out
+
+    def _get_executor(self, num_processors, kernel_args, kernel_key):
+        """ The simulator's worker pool, (re)started if necessary """
+        if self._executor is None or \
+                self._executor_key != (num_processors, kernel_key):
+            self.close()
+            if _POOL_INITIALIZER:
+                shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else \
+                    tempfile.gettempdir()
+                self._run_prefix = os.path.join(
+                    shm_dir, 'pysb-{}-'.format(uuid.uuid4().hex))
+                self._executor = ProcessPoolExecutor(
+                    max_workers=num_processors,
+                    initializer=_init_worker,
+                    initargs=(kernel_args, self._run_prefix)
+                )
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=num_processors)
+            self._executor_key = (num_processors, kernel_key)
+        return self._executor
+
+    def close(self):
+        """
+        Shut down the simulator's worker processes
+
+        Worker processes started by :func:`run` (with ``num_processors >
+        1``) are kept running between runs, to avoid the cost of starting
+        them (and loading the model's kernels) every time. They are shut
+        down by this method, when a run uses a different number of
+        processes or integrator options, or when Python exits.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self._executor_key = None
+
 
 @contextlib.contextmanager
 def _patch_distutils_logging(base_logger):
@@ -620,17 +1077,39 @@ class _DistutilsProxyLoggerAdapter(logging.LoggerAdapter):
     fatal = logging.LoggerAdapter.critical
 
 
-def _get_rhs(compiler, code_eqs, ydot=None, jac=None, compiler_directives=None):
+def _get_rhs(compiler, code_eqs, ydot=None, jac=None, compiler_directives=None,
+             logger=None, batch=False):
+    """
+    Get the RHS (or Jacobian) function for the integrator
+
+    With ``batch=True``, ``ydot`` must be a 2D array of shape
+    (n_sims, n_species) and the returned function takes a flattened state
+    vector for all simulations and a 2D (n_sims, n_params) parameter array,
+    returning the flattened ``ydot``.
+    """
     if compiler == 'cython':
-        if 'math.' in code_eqs:
-            code_eqs = 'import math\n' + code_eqs
+        # The compiled kernel is called directly by the integrator; it
+        # writes into and returns the preallocated ydot or jac array
+        kernel_module = _load_cython_kernel(
+            code_eqs, is_jac=ydot is None,
+            out_ndim=1 if ydot is not None else jac.ndim,
+            compiler_directives=compiler_directives, logger=logger
+        )
+        if batch:
+            return kernel_module.BatchKernel(ydot)
+        return kernel_module.Kernel(ydot if ydot is not None else jac)
+    elif batch:
+        if compiler != 'python':
+            raise ValueError('Batch mode is not supported with the "{}" '
+                             'compiler'.format(compiler))
 
         def rhs(t, y, p):
-            # note that the evaluated code sets ydot as a side effect
-            Cython.inline(code_eqs, quiet=True,
-                          cython_compiler_directives=compiler_directives)
-
-            return ydot if ydot is not None else jac
+            # Evaluate each equation for all simulations at once, with
+            # species and parameters as vectors over the batch
+            y = y.reshape(ydot.shape)
+            for i, dy in enumerate(code_eqs(*itertools.chain(y.T, p.T))):
+                ydot[:, i] = dy
+            return ydot.ravel()
     elif compiler == 'weave':
         def rhs(t, y, p):
             # note that the evaluated code sets ydot as a side effect
@@ -645,18 +1124,235 @@ def _get_rhs(compiler, code_eqs, ydot=None, jac=None, compiler_directives=None):
     return rhs
 
 
-def _integrator_process(code_eqs, jac_eqs, num_species, num_odes, initials,
-                        tspan, param_values, integrator_name, compiler,
-                        integrator_opts, compiler_directives):
-    """ Single integrator process, for parallel execution """
+def _print_exprs(printer, exprs, num_processors=1):
+    """
+    Print SymPy expressions as code strings, optionally in parallel
+
+    With ``num_processors > 1``, the expressions are split into one chunk
+    per process. Model components are replaced by plain symbols first, so
+    the expressions can be pickled without their model.
+    """
+    if num_processors <= 1 or len(exprs) < 2 * num_processors:
+        return [printer(expr) for expr in exprs]
+    symbols = {}
+    for expr in exprs:
+        for sym in expr.free_symbols:
+            if isinstance(sym, pysb.core.Component):
+                symbols[sym] = sympy.Symbol(sym.name)
+    exprs = [expr.xreplace(symbols) for expr in exprs]
+    chunk_size = -(-len(exprs) // num_processors)
+    with ProcessPoolExecutor(num_processors) as executor:
+        futures = [executor.submit(_print_chunk, printer,
+                                   exprs[i:i + chunk_size])
+                   for i in range(0, len(exprs), chunk_size)]
+        return [code for future in futures for code in future.result()]
+
+
+def _print_chunk(printer, exprs):
+    return [printer(expr) for expr in exprs]
+
+
+_CYTHON_KERNEL_TEMPLATE = """\
+{imports}
+
+cdef class Kernel:
+    cdef object out_arr
+    cdef double{dims} out
+
+    def __init__(self, out):
+        self.out_arr = out
+        self.out = out
+
+    def __call__(self, double t, const double[::1] y, const double[::1] p):
+        cdef double{dims} {out_name} = self.out
+{code}
+        return self.out_arr
+"""
+
+_CYTHON_BATCH_KERNEL_TEMPLATE = """
+
+cdef class BatchKernel:
+    cdef object out_arr
+    cdef double[:, ::1] out
+
+    def __init__(self, out):
+        self.out_arr = out.ravel()
+        self.out = out
+
+    def __call__(self, double t, const double[::1] y_all,
+                 const double[:, ::1] p_all):
+        cdef Py_ssize_t n
+        cdef Py_ssize_t n_species = self.out.shape[1]
+        cdef const double[::1] y
+        cdef const double[::1] p
+        cdef double[::1] ydot
+{decls}
+        for n in range(self.out.shape[0]):
+            y = y_all[n * n_species:(n + 1) * n_species]
+            p = p_all[n]
+            ydot = self.out[n]
+{code}
+        return self.out_arr
+"""
+
+
+def _load_cython_kernel(code_eqs, is_jac, out_ndim, compiler_directives,
+                        logger=None):
+    """
+    Load a compiled Cython kernel module for an RHS or Jacobian code string
+
+    The equations are compiled into a real extension module containing a
+    ``Kernel`` class, whose instances wrap a preallocated output array and
+    are called as ``kernel(t, y, p)`` with typed memoryviews, so each call
+    costs only the arithmetic. The output array is 1D for the RHS and for
+    sparse Jacobians (CSC data array), or 2D for dense Jacobians. RHS
+    modules also contain a ``BatchKernel`` class, which loops over a batch
+    of simulations (see :func:`_get_rhs`). Built modules are stored in the
+    ``cython`` namespace of :mod:`pysb.cache`, keyed on the generated
+    source, the compiler directives and the Python/NumPy/Cython versions,
+    so they are reused across simulator instances, processes and hosts.
+    """
+    if logger is None:
+        logger = get_logger(__name__)
+    # cdef declarations of local variables are not allowed inside the
+    # batch kernel's loop, so they are hoisted above it
+    lines = code_eqs.splitlines()
+    decls = [line for line in lines if line.startswith('cdef ')]
+    body = [line for line in lines if not line.startswith('cdef ')]
+    module_code = _CYTHON_KERNEL_TEMPLATE.format(
+        imports='import math' if 'math.' in code_eqs else '',
+        dims='[:, ::1]' if out_ndim == 2 else '[::1]',
+        out_name='jac' if is_jac else 'ydot',
+        code='\n'.join('        ' + line for line in decls + body)
+    )
+    if not is_jac:
+        module_code += _CYTHON_BATCH_KERNEL_TEMPLATE.format(
+            decls='\n'.join('        ' + line for line in decls),
+            code='\n'.join('            ' + line for line in body)
+        )
+    return _load_cython_module(module_code, compiler_directives, logger)
+
+
+def _load_cython_module(module_code, compiler_directives, logger=None):
+    """
+    Load a compiled Cython module from source, building it if necessary
+
+    Built modules are stored in the ``cython`` namespace of
+    :mod:`pysb.cache`, keyed on the source, the compiler directives and the
+    Cython/NumPy versions, and modules already loaded in this process are
+    reused.
+    """
+    if logger is None:
+        logger = get_logger(__name__)
+    compiler_directives = dict(compiler_directives or {})
+    compiler_directives.setdefault('language_level', 3)
+    key = pysb.cache.cache_key(module_code,
+                               sorted(compiler_directives.items()),
+                               Cython.__version__, np.__version__)
+    module_name = '_pysb_kernel_' + key
+    if module_name in sys.modules:
+        # Extension modules cannot be re-initialised, so reuse it
+        return sys.modules[module_name]
+
+    lib_dir = pysb.cache.lookup(_KERNEL_CACHE_NAMESPACE, key)
+    if lib_dir is not None:
+        logger.debug('Using cached Cython kernel %s', key)
+    else:
+        logger.debug('Compiling Cython kernel %s', key)
+        build_dir = pysb.cache.build_dir(_KERNEL_CACHE_NAMESPACE)
+        try:
+            with _set_cflags_no_warnings(logger):
+                _build_cython_module(module_name, module_code, build_dir,
+                                     compiler_directives)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        lib_dir = pysb.cache.publish(_KERNEL_CACHE_NAMESPACE, key, build_dir)
+
+    ext_suffix = sysconfig.get_config_var('EXT_SUFFIX') or \
+        sysconfig.get_config_var('SO')
+    return _load_extension(module_name,
+                           os.path.join(lib_dir, module_name + ext_suffix))
+
+
+def _load_extension(module_name, path):
+    """ Import a compiled extension module from a file path """
+    try:
+        from importlib.machinery import ExtensionFileLoader
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        # Python 2
+        import imp
+        return imp.load_dynamic(module_name, path)
+    loader = ExtensionFileLoader(module_name, path)
+    spec = spec_from_file_location(module_name, path, loader=loader)
+    module = module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def _build_cython_module(module_name, module_code, build_dir,
+                         compiler_directives):
+    """ Cythonize and compile a module's source code into build_dir """
+    from Cython.Build import cythonize
+    from distutils.core import Distribution, Extension
+    from distutils.command.build_ext import build_ext
+
+    pyx_file = os.path.join(build_dir, module_name + '.pyx')
+    with open(pyx_file, 'w') as f:
+        f.write(module_code)
+
+    dist = Distribution()
+    # Ignore any setup.cfg in the current directory, as Cython.inline does
+    config_files = dist.find_config_files()
+    try:
+        config_files.remove('setup.cfg')
+    except ValueError:
+        pass
+    dist.parse_config_files(config_files)
+    build_extension = build_ext(dist)
+    build_extension.finalize_options()
+    build_extension.extensions = cythonize(
+        [Extension(name=module_name, sources=[pyx_file])],
+        compiler_directives=compiler_directives,
+        quiet=True
+    )
+    build_extension.build_temp = build_dir
+    build_extension.build_lib = build_dir
+    build_extension.run()
+
+
+def _get_kernels(code_eqs, jac_eqs, num_species, num_odes, integrator_name,
+                 compiler, compiler_directives, jac_sparsity=None):
+    """ Build the RHS and (if jac_eqs is set) Jacobian functions """
     rhs = _get_rhs(compiler, code_eqs, ydot=np.zeros(num_species),
                    compiler_directives=compiler_directives)
 
     jac_fn = None
     if jac_eqs:
-        jac_eqs = _get_rhs(compiler, jac_eqs,
-                           jac=np.zeros((num_odes, num_species)),
-                           compiler_directives=compiler_directives)
+        if integrator_name in _SOLVE_IVP_METHODS:
+            jac = np.zeros(jac_sparsity.nnz)
+        else:
+            jac = np.zeros((num_odes, num_species))
+        jac_fn = _get_rhs(compiler, jac_eqs, jac=jac,
+                          compiler_directives=compiler_directives)
+    return rhs, jac_fn
+
+
+def _integrate(rhs, jac_fn, num_species, initials, tspan, param_values,
+               integrator_name, integrator_opts, jac_sparsity=None):
+    """ Integrate a single simulation using functions from _get_kernels """
+    # Compiled kernels require contiguous float64 parameter arrays
+    param_values = np.ascontiguousarray(param_values, dtype=float)
+
+    if integrator_name in _SOLVE_IVP_METHODS:
+        return _solve_ivp(rhs, jac_fn, initials, tspan, param_values,
+                          integrator_name, integrator_opts, jac_sparsity)
 
     # LSODA
     if integrator_name == 'lsoda':
@@ -679,7 +1375,7 @@ def _integrator_process(code_eqs, jac_eqs, num_species, num_odes, initials,
 
     # Set parameter vectors for RHS func and Jacobian
     integrator.set_f_params(param_values)
-    if jac_eqs:
+    if jac_fn is not None:
         integrator.set_jac_params(param_values)
 
     trajectory = np.ndarray((len(tspan), num_species))
@@ -694,6 +1390,385 @@ def _integrator_process(code_eqs, jac_eqs, num_species, num_odes, initials,
     return trajectory
 
 
+def _solve_ivp(rhs, jac_fn, y0, tspan, param_values, integrator_name,
+               integrator_opts, jac_sparsity):
+    """
+    Integrate using scipy.integrate.solve_ivp with a sparse Jacobian
+
+    If ``jac_fn`` is supplied, it must return the Jacobian's data array in
+    the CSC order of ``jac_sparsity``; otherwise, ``jac_sparsity`` is used
+    to reduce the number of RHS evaluations for finite differences.
+    """
+    def fun(t, y):
+        # Copy, because the RHS kernel reuses its output array and solve_ivp
+        # keeps previous evaluations
+        return np.array(rhs(t, y, param_values), dtype=float)
+
+    jac = None
+    if jac_fn is not None:
+        def jac(t, y):
+            return scipy.sparse.csc_matrix(
+                (np.array(jac_fn(t, y, param_values), dtype=float),
+                 jac_sparsity.indices, jac_sparsity.indptr),
+                shape=jac_sparsity.shape
+            )
+
+    sol = scipy.integrate.solve_ivp(
+        fun,
+        (tspan[0], tspan[-1]),
+        y0,
+        method=_SOLVE_IVP_METHODS[integrator_name],
+        t_eval=tspan,
+        jac=jac,
+        jac_sparsity=jac_sparsity if jac is None else None,
+        **integrator_opts
+    )
+    trajectory = np.full((len(tspan), len(y0)), np.nan)
+    trajectory[:sol.y.shape[1]] = sol.y.T
+    return trajectory
+
+
+# Integrator options for a banded Jacobian (lower, upper bandwidth)
+_BANDED_JACOBIAN_OPTIONS = {
+    'lsoda': ('ml', 'mu'),
+    'vode': ('lband', 'uband'),
+    'zvode': ('lband', 'uband'),
+}
+
+
+def _batch_integrator_process(code_eqs, num_species, initials, tspan,
+                              param_values, integrator_name, compiler,
+                              integrator_opts, compiler_directives,
+                              jac_sparsity=None):
+    """ Integrate a batch of simulations as one stacked ODE system """
+    n_batch = len(initials)
+    y0 = np.ascontiguousarray(initials, dtype=float).ravel()
+    param_values = np.ascontiguousarray(param_values, dtype=float)
+    rhs = _get_rhs(compiler, code_eqs, ydot=np.zeros((n_batch, num_species)),
+                   compiler_directives=compiler_directives, batch=True)
+
+    # Simulations are independent, so the stacked Jacobian is block
+    # diagonal; tell implicit integrators to treat it as banded
+    integrator_opts = dict(integrator_opts)
+    if integrator_name in _BANDED_JACOBIAN_OPTIONS:
+        for opt in _BANDED_JACOBIAN_OPTIONS[integrator_name]:
+            integrator_opts.setdefault(opt, max(num_species - 1, 0))
+
+    if integrator_name in _SOLVE_IVP_METHODS:
+        trajectory = _solve_ivp(
+            rhs, None, y0, tspan, param_values, integrator_name,
+            integrator_opts,
+            scipy.sparse.block_diag([jac_sparsity] * n_batch, format='csc')
+        )
+    elif integrator_name == 'lsoda':
+        trajectory = scipy.integrate.odeint(
+            rhs,
+            y0,
+            tspan,
+            args=(param_values, ),
+            tfirst=True,
+            **integrator_opts
+        )
+    else:
+        integrator = scipy.integrate.ode(rhs)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('error', 'No integrator name match')
+            integrator.set_integrator(integrator_name, **integrator_opts)
+        integrator.set_initial_value(y0, tspan[0])
+        integrator.set_f_params(param_values)
+
+        trajectory = np.ndarray((len(tspan), len(y0)))
+        trajectory[0] = y0
+        i = 1
+        while integrator.successful() and integrator.t < tspan[-1]:
+            trajectory[i] = integrator.integrate(tspan[i])
+            i += 1
+        if integrator.t < tspan[-1]:
+            trajectory[i:, :] = 'nan'
+
+    return trajectory.reshape(
+        (len(tspan), n_batch, num_species)).transpose(1, 0, 2)
+
+
+# Target duration of each chunk of simulations sent to a worker, in seconds
+_CHUNK_DURATION = 0.05
+
+
+class _ChunkScheduler(object):
+    """
+    Choose ranges of simulations to submit as parallel tasks
+
+    Until the cost of a simulation has been measured, chunks contain one
+    simulation. After that, chunks are sized to take about
+    ``_CHUNK_DURATION`` seconds, which amortises per-task overhead, but
+    contain at most 1/(2 * n_workers) of the remaining simulations, so that
+    chunks shrink towards the end of the run and the workers finish at
+    about the same time (guided self-scheduling). Batched runs use chunks
+    of exactly one batch.
+    """
+    def __init__(self, n_sims, n_workers, batch_size=None):
+        self.n_sims = n_sims
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.next_sim = 0
+        self.sims_timed = 0
+        self.time_taken = 0.0
+
+    def next_chunk(self):
+        """ The (start, stop) of the next chunk, or None if finished """
+        remaining = self.n_sims - self.next_sim
+        if remaining <= 0:
+            return None
+        if self.batch_size is not None:
+            size = self.batch_size
+        elif not self.sims_timed:
+            size = 1
+        else:
+            cost = self.time_taken / self.sims_timed
+            size = int(_CHUNK_DURATION / cost) if cost > 0 else remaining
+            size = max(1, min(size, int(np.ceil(
+                remaining / (2.0 * self.n_workers)))))
+        start = self.next_sim
+        self.next_sim = min(start + size, self.n_sims)
+        return start, self.next_sim
+
+    def record(self, n_sims, elapsed):
+        """ Record the time taken by a completed chunk """
+        self.sims_timed += n_sims
+        self.time_taken += elapsed
+
+
+def _shared_output(shape):
+    """
+    Create an array in shared memory, which workers can open by filename
+
+    The array is backed by a file in /dev/shm (i.e. in memory) where
+    available, or the system temporary directory otherwise.
+
+    Returns
+    -------
+    The array, and the (filename, shape) tuple with which workers open it
+    (see _open_shared)
+    """
+    shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, filename = tempfile.mkstemp(prefix='pysb-', dir=shm_dir)
+    os.close(fd)
+    if not np.prod(shape):
+        # Empty files can't be mapped
+        return np.empty(shape), (filename, shape)
+    out = np.memmap(filename, dtype=float, mode='w+', shape=shape)
+    return out, (filename, shape)
+
+
+def _release_shared_output(out, filename):
+    """ Remove a shared array's file, returning the data as an ndarray """
+    if os.name == 'nt':
+        # Files can't be removed on Windows while mapped, so copy the data
+        data = np.array(out)
+        out._mmap.close()
+        os.remove(filename)
+        return data
+    # Elsewhere, the mapping (and data) persists after removal
+    os.remove(filename)
+    return np.asarray(out)
+
+
+def _remove_shared_file(filename):
+    """ Remove a shared array's file, if no process still has it mapped """
+    try:
+        os.remove(filename)
+    except OSError:
+        # Windows can't remove files which workers have mapped
+        pass
+
+
+def _simulate(kernel_args, kernels, initials, param_values, tspan,
+              batch_size=None):
+    """
+    Run simulations, returning their trajectories
+
+    Parameters
+    ----------
+    kernel_args: tuple
+        Model equations and integrator settings (see
+        ScipyOdeSimulator._run_simulations)
+    kernels: dict
+        Cache for unbatched kernels, which are built by the first call for
+        a model and reused by later ones
+    initials, param_values: numpy.ndarray
+        Initial conditions and parameter values of the simulations
+    tspan: numpy.ndarray
+        Output time points
+    batch_size: int, optional
+        If set, the simulations are integrated as one batch
+    """
+    (code_eqs, jac_eqs, num_species, num_odes, integrator_name, compiler,
+     integrator_opts, compiler_directives, jac_sparsity) = kernel_args
+    if batch_size is not None:
+        return _batch_integrator_process(
+            code_eqs, num_species, initials, tspan, param_values,
+            integrator_name, compiler=compiler,
+            integrator_opts=integrator_opts,
+            compiler_directives=compiler_directives,
+            jac_sparsity=jac_sparsity)
+    if 'rhs' not in kernels:
+        kernels['rhs'], kernels['jac'] = _get_kernels(
+            code_eqs, jac_eqs, num_species, num_odes, integrator_name,
+            compiler, compiler_directives, jac_sparsity)
+    trajectories = np.empty((len(initials), len(tspan), num_species))
+    for n in range(len(initials)):
+        trajectories[n] = _integrate(
+            kernels['rhs'], kernels['jac'], num_species, initials[n], tspan,
+            param_values[n], integrator_name, integrator_opts, jac_sparsity)
+    return trajectories
+
+
+# State of the simulator's worker processes (see _init_worker)
+_worker_state = {}
+
+
+def _init_worker(kernel_args, run_prefix):
+    """
+    Initialise one of a simulator's worker processes
+
+    Called once per worker process, with the model's equations and
+    integrator settings. Kernels are built by the first task the worker
+    runs (not here, since errors in pool initialisers are not reported).
+    Each run's inputs are described by the file ``<run_prefix><run>.pkl``.
+    """
+    _worker_state.clear()
+    _worker_state.update(kernel_args=kernel_args, run_prefix=run_prefix,
+                         kernels={}, run=None)
+
+
+def _open_shared(shared, mode):
+    """ Open a shared array from the (filename, shape) of _shared_output """
+    filename, shape = shared
+    if not np.prod(shape):
+        return np.empty(shape)
+    return np.memmap(filename, dtype=float, mode=mode, shape=shape)
+
+
+def _run_worker_chunk(run, start, stop):
+    """
+    Run simulations start:stop of a run in a simulator's worker process
+
+    Initial conditions and parameter values are read from, and
+    trajectories written to, the run's shared arrays, which are opened by
+    the first chunk of each run the worker receives.
+
+    Returns
+    -------
+    tuple
+        (start, stop, time taken, trajectories), where trajectories is None
+        if written to the run's shared output array
+    """
+    started = time.time()
+    state = _worker_state
+    if state['run'] != run:
+        with open('{}{}.pkl'.format(state['run_prefix'], run), 'rb') as f:
+            shared_inputs, shared_out, tspan, batch_size = pickle.load(f)
+        state.update(
+            run=run, tspan=tspan, batch_size=batch_size,
+            initials=_open_shared(shared_inputs[0], 'r'),
+            param_values=_open_shared(shared_inputs[1], 'r'),
+            out=None if shared_out is None else _open_shared(shared_out,
+                                                             'r+')
+        )
+    trajectories = _simulate(
+        state['kernel_args'], state['kernels'], state['initials'][start:stop],
+        state['param_values'][start:stop], state['tspan'],
+        state['batch_size'])
+    if state['out'] is not None:
+        state['out'][start:stop] = trajectories
+        trajectories = None
+    return start, stop, time.time() - started, trajectories
+
+
+# Kernels for the most recently simulated model on each thread of an
+# executor (see _simulate_chunk). The kernels' output arrays are reused
+# between calls, so each thread needs its own.
+_chunk_kernels = threading.local()
+
+
+def _simulate_chunk(kernel_key, kernel_args, start, initials, param_values,
+                    tspan, batch_size=None):
+    """
+    Run a chunk of simulations on an executor
+
+    Workers keep the kernels of the most recently simulated model, so
+    these are only sent with a chunk when the worker reports it doesn't
+    have them.
+
+    Parameters
+    ----------
+    kernel_key: str
+        Identifies the model's equations and integrator settings
+    kernel_args: tuple or None
+        Model equations and integrator settings (see
+        ScipyOdeSimulator._run_simulations), or None to use those cached
+        under kernel_key
+    start: int
+        Index of the chunk's first simulation within the run
+    initials, param_values: numpy.ndarray
+        Initial conditions and parameter values for the chunk
+    tspan: numpy.ndarray
+        Output time points
+    batch_size: int, optional
+        If set, the chunk is integrated as one batch
+
+    Returns
+    -------
+    tuple
+        (start, stop, time taken, trajectories), or (start, stop, None,
+        None) if kernel_args is None and the worker doesn't have the
+        kernels for kernel_key
+    """
+    stop = start + len(initials)
+    if getattr(_chunk_kernels, 'key', None) != kernel_key:
+        if kernel_args is None:
+            return start, stop, None, None
+        _chunk_kernels.key = kernel_key
+        _chunk_kernels.kernel_args = kernel_args
+        _chunk_kernels.kernels = {}
+    started = time.time()
+    trajectories = _simulate(_chunk_kernels.kernel_args,
+                             _chunk_kernels.kernels, initials, param_values,
+                             tspan, batch_size)
+    return start, stop, time.time() - started, trajectories
+
+
+class _Lambdified(object):
+    """
+    Function of sympy expressions, from :func:`sympy.lambdify`
+
+    Unlike lambdified functions, instances can be pickled (e.g. to send
+    to worker processes), and are rebuilt on first use after unpickling.
+    Model components are replaced with plain symbols of the same name, so
+    the model isn't pickled with the expressions.
+    """
+    def __init__(self, symbols, exprs, modules=None):
+        subs = {s: sympy.Symbol(s.name) for s in symbols}
+        self.symbols = [subs[s] for s in symbols]
+        if isinstance(exprs, sympy.MatrixBase):
+            self.exprs = exprs.xreplace(subs)
+        else:
+            self.exprs = [sympy.sympify(e).xreplace(subs) for e in exprs]
+        self.modules = modules
+        self._fn = None
+
+    def __call__(self, *args):
+        if self._fn is None:
+            self._fn = sympy.lambdify(self.symbols, self.exprs,
+                                      self.modules)
+        return self._fn(*args)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fn'] = None
+        return state
+
+
 class SerialExecutor(Executor):
     """ Execute tasks in serial (immediately on submission) """
     def submit(self, fn, *args, **kwargs):
@@ -0,0 +1,727 @@
+from pysb.simulator.base import Simulator, SimulationResult, SimulatorException
+from pysb.simulator.scipyode import _load_cython_module, _IDENTIFIER_RE
+from pysb.bng import generate_equations
+import itertools
+import numpy as np
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+import sympy
+from sympy.printing.lambdarepr import lambdarepr
+try:
+    import Cython
+except ImportError:
+    Cython = None
+
+
+class SsaSimulator(Simulator):
+    """
+    In-process stochastic simulation using Gillespie's direct method
+
+    Simulates the reaction network generated for the model
+    (``model.reactions`` and ``model.stoichiometry_matrix``) with compiled
+    code, without external programs or intermediate files. Reaction
+    propensities are compiled into a Cython module, which is cached on
+    disk (see :mod:`pysb.cache`), along with the simulation loop.
+
+    After each reaction event, only the propensities which depend on the
+    species it changed are recomputed, using a reaction dependency graph.
+    Approximate adaptive tau-leaping and hybrid (Langevin/SSA) methods are
+    also available for models with fast reactions between high copy number
+    species; see :func:`run`.
+
+    .. warning::
+        The interface for this class is considered experimental and may
+        change without warning as PySB is updated.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model to simulate.
+    tspan : vector-like, optional
+        Time values at which to record the state of the system. The first
+        and last values define the time range.
+    initials : vector-like or dict, optional
+        Values to use for the initial condition of all species. Ordering is
+        determined by the order of model.species. If not specified, initial
+        conditions will be taken from model.initials (with initial condition
+        parameter values taken from `param_values` if specified). Values
+        are rounded to the nearest integer.
+    param_values : vector-like or dict, optional
+        Values to use for every parameter in the model. Ordering is
+        determined by the order of model.parameters.
+        If passed as a dictionary, keys must be parameter names.
+        If not specified, parameter values will be taken directly from
+        model.parameters.
+    verbose : bool or int, optional (default: False)
+        Sets the verbosity level of the logger. See the logging levels and
+        constants from Python's logging module for interpretation of integer
+        values. False is equal to the PySB default level (currently WARNING),
+        True is equal to DEBUG.
+    **kwargs : dict
+        Extra keyword arguments, including:
+
+        * ``cleanup``: Boolean, `cleanup` argument used for
+          :func:`pysb.bng.generate_equations` call
+        * ``cython_directives``: A dictionary of Cython compiler directives.
+          Defaults to :attr:`default_cython_directives`.
+
+    Notes
+    -----
+    As in BioNetGen, the propensity of a reaction with ``n`` copies of a
+    reactant species ``S`` uses the falling factorial
+    ``S*(S-1)*...*(S-n+1)`` in place of the ``S**n`` term of the reaction's
+    (ODE) rate.
+
+    Requires Cython and NumPy 1.17 or later.
+
+    Examples
+    --------
+    Simulate a model and display the results for an observable:
+
+    >>> from pysb.examples.robertson import model
+    >>> import numpy as np
+    >>> sim = SsaSimulator(model, tspan=np.linspace(0, 10, 5))
+
+    Here we supply a "seed" to the random number generator for deterministic
+    results, but for most purposes it is recommended to leave this blank.
+
+    >>> simulation_result = sim.run(n_runs=2, seed=123456)
+    >>> print(simulation_result.observables[0]['A_total']) \
+        #doctest: +SKIP
+    [1.  0.  0.  0.  0.]
+
+    For further information on retrieving trajectories (species,
+    observables, expressions over time) from the ``simulation_result``
+    object returned by :func:`run`, see the examples under the
+    :class:`SimulationResult` class.
+    """
+    _supports = {'multi_initials': True, 'multi_param_values': True}
+
+    default_cython_directives = {
+        'boundscheck': False,
+        'wraparound': False,
+        'nonecheck': False,
+        'initializedcheck': False,
+        'cdivision': True
+    }
+
+    def __init__(self, model, tspan=None, initials=None, param_values=None,
+                 verbose=False, **kwargs):
+        super(SsaSimulator, self).__init__(model,
+                                           tspan=tspan,
+                                           initials=initials,
+                                           param_values=param_values,
+                                           verbose=verbose,
+                                           **kwargs)
+        self.cleanup = kwargs.pop('cleanup', True)
+        self._compiler_directives = kwargs.pop(
+            'cython_directives', self.default_cython_directives)
+        if kwargs:
+            raise ValueError('Unknown keyword argument(s): {}'.format(
+                ', '.join(kwargs.keys())
+            ))
+        if Cython is None:
+            raise ImportError('Cython library is not installed')
+        if not hasattr(np.random, 'SeedSequence'):
+            # Per-simulation random streams need SeedSequence.spawn
+            raise ImportError('SsaSimulator requires NumPy >= 1.17')
+        generate_equations(self._model, cleanup=self.cleanup,
+                           verbose=self.verbose)
+
+        propensities, species_deps = self._propensities()
+        self._code = _propensity_code(propensities, self._model)
+
+        # Species changed by each reaction, in CSC format
+        stoich = self._model.stoichiometry_matrix.tocsc()
+        stoich.sort_indices()
+        self._stoich = (stoich.indptr.astype(np.intc),
+                        stoich.indices.astype(np.intc),
+                        stoich.data.astype(float))
+
+        # Dependency graph: reactions whose propensities may change when
+        # each reaction fires
+        n_reactions = len(propensities)
+        rows = [j for j, deps in enumerate(species_deps) for _ in deps]
+        cols = [sp for deps in species_deps for sp in deps]
+        rate_deps = scipy.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(n_reactions, len(self._model.species))
+        )
+        dep_graph = (abs(stoich.T).astype(float) * rate_deps.T).tocsr() != 0
+        dep_graph.sort_indices()
+        self._dep_graph = (dep_graph.indptr.astype(np.intc),
+                           dep_graph.indices.astype(np.intc))
+
+        # Highest order of the reactions consuming each species, and the
+        # most copies of the species needed by a reaction of that order,
+        # for tau-leaping step size selection
+        hor = np.zeros(len(self._model.species), dtype=np.intc)
+        hor_copies = np.zeros(len(self._model.species), dtype=np.intc)
+        for rxn in self._model.reactions:
+            order = len(rxn['reactants'])
+            for sp in set(rxn['reactants']):
+                copies = rxn['reactants'].count(sp)
+                if (order, copies) > (hor[sp], hor_copies[sp]):
+                    hor[sp] = order
+                    hor_copies[sp] = copies
+        self._reactant_orders = (hor, hor_copies)
+
+    def _propensities(self):
+        """
+        Propensity of each reaction, and the species it depends on
+
+        Expressions and observables in the rates are expanded in terms of
+        species and parameters.
+        """
+        expand = {}
+        for expr in itertools.chain(self._model.expressions,
+                                    self._model._derived_expressions):
+            expand[expr] = expr.expand_expr(expand_observables=True)
+        for obs in self._model.observables:
+            expand[obs] = obs.expand_obs()
+        propensities = []
+        species_deps = []
+        for rxn in self._model.reactions:
+            rate = rxn['rate']
+            falling = {}
+            for term in rate.atoms(sympy.Pow):
+                base, exp = term.args
+                if _species_index(base) is not None and exp.is_Integer \
+                        and exp > 1:
+                    falling[term] = sympy.Mul(*[base - i for i in range(exp)])
+            rate = rate.xreplace(falling).xreplace(expand)
+            propensities.append(rate)
+            species_deps.append(sorted(
+                idx for idx in (_species_index(sym)
+                                for sym in rate.free_symbols)
+                if idx is not None))
+        return propensities, species_deps
+
+    def run(self, tspan=None, initials=None, param_values=None, n_runs=1,
+            seed=None, method='direct', num_processors=1, epsilon=0.03,
+            threshold=10, langevin_threshold=100, save_to=None):
+        """
+        Run a simulation and returns the result (trajectories)
+
+        Parameters
+        ----------
+        tspan
+        initials
+        param_values
+            See parameter definitions in :class:`SsaSimulator`.
+        n_runs : int
+            The number of simulation runs per parameter set. The total
+            number of simulations is therefore n_runs * max(len(initials),
+            len(param_values))
+        seed : int or None
+            A random number seed. Set to any integer value for deterministic
+            behavior. Each simulation draws from its own independent random
+            number stream, spawned from this seed with
+            :class:`numpy.random.SeedSequence`, so results do not depend on
+            ``num_processors``.
+        method : str
+            Simulation algorithm, one of:
+
+            * ``direct`` (default): Gillespie's direct method.
+            * ``sorting``: the sorting direct method, which moves each
+              reaction that fires one place towards the start of the search
+              order. This speeds up the selection of the next reaction in
+              large networks where a few reactions fire most of the time.
+            * ``tau_leaping``: adaptive tau-leaping [Cao2006]_. At every
+              step, reactions are partitioned into critical reactions, which
+              could exhaust one of their reactants within ``threshold``
+              firings and are simulated exactly, and the remaining reactions,
+              which fire a Poisson-distributed number of times per leap. The
+              leap size bounds the relative change in propensities by
+              ``epsilon``. When the leap would be too short to pay off,
+              exact SSA steps are taken instead.
+            * ``hybrid``: as ``tau_leaping``, but non-critical reactions
+              expected to fire at least ``langevin_threshold`` times in a
+              leap are treated as continuous, using the chemical Langevin
+              equation. Species changed by these fast reactions take
+              non-integer values.
+
+            The approximate methods trade accuracy for speed in models where
+            fast reactions between high copy number species dominate.
+        num_processors : int
+            Number of processes to use (default: 1). Simulations, across
+            both parameter sets and repeats, are distributed over a pool of
+            worker processes in chunks.
+        epsilon : float
+            Error control parameter for the ``tau_leaping`` and ``hybrid``
+            methods (default: 0.03)
+        threshold : int
+            Number of firings below which a reaction is critical, for the
+            ``tau_leaping`` and ``hybrid`` methods (default: 10)
+        langevin_threshold : float
+            Expected number of firings in a leap above which a reaction is
+            treated as continuous, for the ``hybrid`` method (default: 100)
+        save_to : str or SimulationResultWriter, optional
+            If set, trajectories are written to this HDF5 file as each
+            parameter set completes, instead of being kept in memory, and a
+            :class:`LazySimulationResult` is returned. See
+            :class:`SimulationResultWriter`.
+
+        Returns
+        -------
+        A :class:`SimulationResult` object, or a
+        :class:`LazySimulationResult` if ``save_to`` is set
+
+        References
+        ----------
+        .. [Cao2006] Cao Y, Gillespie DT, Petzold LR (2006). Efficient step
+           size selection for the tau-leaping simulation method. J Chem Phys
+           124, 044109.
+        """
+        super(SsaSimulator, self).run(tspan=tspan,
+                                      initials=initials,
+                                      param_values=param_values,
+                                      _run_kwargs=locals())
+        if method in ('direct', 'sorting'):
+            kernel = ('simulate', self._stoich + self._dep_graph +
+                      (method == 'sorting', ))
+        elif method in ('tau_leaping', 'hybrid'):
+            kernel = ('simulate_tau_leaping', self._stoich +
+                      self._reactant_orders + (
+                          float(epsilon), float(threshold),
+                          float(langevin_threshold) if method == 'hybrid'
+                          else np.inf))
+        else:
+            raise SsaSimulatorException('Unknown method: {}'.format(method))
+        self._logger.info('Running SSA with {:d} parameter sets, {:d} '
+                          'repeats ({:d} simulations total)'.format(
+                              len(self.initials), n_runs,
+                              len(self.initials) * n_runs))
+
+        tspan = np.ascontiguousarray(self.tspan, dtype=float)
+        ssa_args = (self._code, self._compiler_directives, tspan) + kernel
+        # One random number stream per simulation, in simulation order
+        seeds = iter(np.random.SeedSequence(seed).spawn(
+            len(self.initials) * n_runs))
+        sims = [(np.round(np.asarray(initials, dtype=float)),
+                 np.ascontiguousarray(param_values, dtype=float), next(seeds))
+                for initials, param_values in zip(self.initials,
+                                                  self.param_values)
+                for _ in range(n_runs)]
+
+        writer = None
+        if save_to is not None:
+            writer = self._result_writer(save_to, len(tspan),
+                                         simulations_per_param_set=n_runs)
+        trajectories = []
+        executor = None
+        try:
+            # Build the module (if it is not cached) before any workers
+            # need it
+            _load_cython_module(self._code, self._compiler_directives,
+                                self._logger)
+            if num_processors == 1:
+                chunks = [_simulate_chunk(ssa_args, sims)]
+            else:
+                self._logger.debug('Multi-processor (parallel) mode using '
+                                   '{} processes'.format(num_processors))
+                chunk_size = max(1, -(-len(sims) // (4 * num_processors)))
+                executor = ProcessPoolExecutor(num_processors)
+                chunks = [executor.submit(_simulate_chunk, ssa_args,
+                                          sims[i:i + chunk_size])
+                          for i in range(0, len(sims), chunk_size)]
+                chunks = (chunk.result() for chunk in chunks)
+            done = 0
+            for chunk in chunks:
+                trajectories.extend(chunk)
+                if writer is not None:
+                    # Write all parameter sets completed so far
+                    n_done = len(trajectories) // n_runs * n_runs
+                    if n_done:
+                        writer.append(np.array([tspan] * n_done),
+                                      trajectories[:n_done])
+                        del trajectories[:n_done]
+                done += len(chunk)
+                self._logger.debug('{} of {} simulations complete'.format(
+                    done, len(sims)))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if writer is not None:
+                writer.close()
+        self._logger.info('All simulation(s) complete')
+        if writer is not None:
+            return writer.result()
+        tout = np.array([tspan] * len(trajectories))
+        return SimulationResult(self, tout, trajectories,
+                                simulations_per_param_set=n_runs)
+
+
+class SsaSimulatorException(SimulatorException):
+    pass
+
+
+def _simulate_chunk(ssa_args, sims):
+    """
+    Run a list of simulations, usually in a worker process
+
+    Parameters
+    ----------
+    ssa_args : tuple
+        Module source, compiler directives, time points, name of the
+        module's simulation function, and that function's method-specific
+        arguments (network arrays and options)
+    sims : list
+        Tuples of (initials, param_values, numpy.random.SeedSequence)
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Species trajectories
+    """
+    code, compiler_directives, tspan, func_name, args = ssa_args
+    simulate = getattr(_load_cython_module(code, compiler_directives),
+                       func_name)
+    trajectories = []
+    for initials, param_values, seed_seq in sims:
+        out = np.empty((len(tspan), len(initials)))
+        simulate(*((initials, param_values, tspan) + args +
+                   (np.random.default_rng(seed_seq), out)))
+        trajectories.append(out)
+    return trajectories
+
+
+def _species_index(sym):
+    """Index of a species symbol ``__s<i>``, or None for other terms"""
+    name = getattr(sym, 'name', '')
+    if name.startswith('__s') and name[3:].isdigit():
+        return int(name[3:])
+    return None
+
+
+def _propensity_code(propensities, model):
+    """
+    Cython source for the SSA module of a reaction network
+
+    The module's ``_propensity`` function evaluates the propensity of one
+    reaction, selected by index from an ``if``/``elif`` chain (compiled to
+    a C ``switch``), and ``simulate`` runs one trajectory.
+    """
+    names = {p.name: 'p[%d]' % i for i, p in enumerate(itertools.chain(
+        model.parameters, model._derived_parameters))}
+
+    def _substitute(match):
+        name = match.group(0)
+        idx = _species_index(sympy.Symbol(name))
+        if idx is not None:
+            return 'x[%d]' % idx
+        return names.get(name, name)
+
+    lines = []
+    for j, propensity in enumerate(propensities):
+        lines.append('%s j == %d:' % ('if' if j == 0 else 'elif', j))
+        lines.append('    return %s' % _IDENTIFIER_RE.sub(
+            _substitute, lambdarepr(propensity)))
+    code = '\n'.join('    ' + line for line in lines)
+    return _SSA_MODULE_TEMPLATE.format(
+        imports='import math' if 'math.' in code else '',
+        propensities=code
+    )
+
+
+_SSA_MODULE_TEMPLATE = """\
+import numpy as np
+from libc.math cimport log, sqrt, exp, floor, fabs, lgamma, INFINITY
+{imports}
+
+cdef enum:
+    RANDOM_BUFFER_SIZE = 8192
+    # Reaction events between recomputations of the total propensity from
+    # scratch, which bounds the accumulated rounding error
+    RESUM_INTERVAL = 1000
+
+
+cdef double _propensity(Py_ssize_t j, double[::1] x, const double[::1] p):
+{propensities}
+    return 0.0
+
+
+cdef class _Random:
+    # Buffered uniform random numbers in (0, 1] from a numpy Generator
+    cdef object random_state
+    cdef double[::1] buffer
+    cdef Py_ssize_t pos
+
+    def __init__(self, random_state):
+        self.random_state = random_state
+        self.pos = RANDOM_BUFFER_SIZE
+
+    cdef double uniform(self):
+        if self.pos == RANDOM_BUFFER_SIZE:
+            self.buffer = 1.0 - self.random_state.random(RANDOM_BUFFER_SIZE)
+            self.pos = 0
+        self.pos += 1
+        return self.buffer[self.pos - 1]
+
+    cdef double normal(self):
+        # Marsaglia polar method
+        cdef double u1, u2, r2
+        while True:
+            u1 = 2.0 * self.uniform() - 1.0
+            u2 = 2.0 * self.uniform() - 1.0
+            r2 = u1 * u1 + u2 * u2
+            if 0.0 < r2 < 1.0:
+                return u1 * sqrt(-2.0 * log(r2) / r2)
+
+    cdef double poisson(self, double lam):
+        cdef double enlam, prod, n, slam, loglam, a, b, invalpha, vr, u, v, us
+        if lam < 10.0:
+            # Multiplication method
+            enlam = exp(-lam)
+            prod = self.uniform()
+            n = 0.0
+            while prod > enlam:
+                prod *= self.uniform()
+                n += 1.0
+            return n
+        # Transformed rejection with squeeze (PTRS), Hormann (1993)
+        slam = sqrt(lam)
+        loglam = log(lam)
+        b = 0.931 + 2.53 * slam
+        a = -0.059 + 0.02483 * b
+        invalpha = 1.1239 + 1.1328 / (b - 3.4)
+        vr = 0.9277 - 3.6224 / (b - 2.0)
+        while True:
+            u = self.uniform() - 0.5
+            v = self.uniform()
+            us = 0.5 - fabs(u)
+            n = floor((2.0 * a / us + b) * u + lam + 0.43)
+            if us >= 0.07 and v <= vr:
+                return n
+            if n < 0.0 or (us < 0.013 and v > us):
+                continue
+            if (log(v) + log(invalpha) - log(a / (us * us) + b) <=
+                    -lam + n * loglam - lgamma(n + 1.0)):
+                return n
+
+
+def simulate(const double[::1] x0, const double[::1] p,
+             const double[::1] tspan, const int[::1] stoich_ptr,
+             const int[::1] stoich_idx, const double[::1] stoich_val,
+             const int[::1] dep_ptr, const int[::1] dep_idx, bint sorting,
+             random_state, double[:, ::1] out):
+    cdef Py_ssize_t n_reactions = stoich_ptr.shape[0] - 1
+    cdef Py_ssize_t n_times = tspan.shape[0]
+    cdef double[::1] x = np.array(x0)
+    cdef double[::1] a = np.empty(n_reactions)
+    cdef Py_ssize_t[::1] order = np.arange(n_reactions, dtype=np.intp)
+    cdef _Random rand = _Random(random_state)
+    cdef Py_ssize_t i, j, k, m, tmp
+    cdef Py_ssize_t n_steps = 0
+    cdef double a0 = 0.0, t = tspan[0], tau, target, acc, new_a
+
+    for j in range(n_reactions):
+        a[j] = max(_propensity(j, x, p), 0.0)
+        a0 += a[j]
+    out[0, :] = x
+    k = 1
+    while k < n_times:
+        if a0 <= 0.0:
+            break
+        tau = -log(rand.uniform()) / a0
+        target = rand.uniform() * a0
+
+        # Select the reaction to fire
+        acc = 0.0
+        for m in range(n_reactions):
+            acc += a[order[m]]
+            if acc >= target and a[order[m]] > 0.0:
+                break
+        else:
+            # Rounding error in the running total: recompute it and draw
+            # again (no time has elapsed)
+            a0 = 0.0
+            for j in range(n_reactions):
+                a0 += a[j]
+            continue
+
+        # The state is unchanged up to the time of the reaction
+        t += tau
+        while k < n_times and tspan[k] < t:
+            out[k, :] = x
+            k += 1
+        if k == n_times:
+            break
+        j = order[m]
+        if sorting and m > 0:
+            tmp = order[m - 1]
+            order[m - 1] = j
+            order[m] = tmp
+
+        # Fire the reaction and update the affected propensities
+        for i in range(stoich_ptr[j], stoich_ptr[j + 1]):
+            x[stoich_idx[i]] += stoich_val[i]
+        for i in range(dep_ptr[j], dep_ptr[j + 1]):
+            m = dep_idx[i]
+            new_a = max(_propensity(m, x, p), 0.0)
+            a0 += new_a - a[m]
+            a[m] = new_a
+        n_steps += 1
+        if n_steps % RESUM_INTERVAL == 0:
+            a0 = 0.0
+            for j in range(n_reactions):
+                a0 += a[j]
+    while k < n_times:
+        out[k, :] = x
+        k += 1
+
+
+cdef inline void _fire(Py_ssize_t j, double n, double[::1] x,
+                       const int[::1] stoich_ptr, const int[::1] stoich_idx,
+                       const double[::1] stoich_val):
+    cdef Py_ssize_t i
+    for i in range(stoich_ptr[j], stoich_ptr[j + 1]):
+        x[stoich_idx[i]] += n * stoich_val[i]
+
+
+def simulate_tau_leaping(const double[::1] x0, const double[::1] p,
+                         const double[::1] tspan, const int[::1] stoich_ptr,
+                         const int[::1] stoich_idx,
+                         const double[::1] stoich_val, const int[::1] hor,
+                         const int[::1] hor_copies, double epsilon,
+                         double threshold, double langevin_threshold,
+                         random_state, double[:, ::1] out):
+    cdef Py_ssize_t n_reactions = stoich_ptr.shape[0] - 1
+    cdef Py_ssize_t n_species = x0.shape[0]
+    cdef Py_ssize_t n_times = tspan.shape[0]
+    cdef double[::1] x = np.array(x0)
+    cdef double[::1] x_prev = np.empty(n_species)
+    cdef double[::1] a = np.empty(n_reactions)
+    cdef unsigned char[::1] critical = np.empty(n_reactions, dtype=np.uint8)
+    cdef double[::1] mu = np.empty(n_species)
+    cdef double[::1] sigma2 = np.empty(n_species)
+    cdef _Random rand = _Random(random_state)
+    cdef Py_ssize_t i, j, k, s, fired
+    cdef double t = tspan[0], a0, ac0, tau, tau1, tau2, target, acc
+    cdef double xi, g, bound, lam
+    cdef bint capped, leaped
+
+    out[0, :] = x
+    k = 1
+    while k < n_times:
+        # Propensities, and the critical reactions, which could exhaust one
+        # of their reactants within threshold firings
+        a0 = 0.0
+        ac0 = 0.0
+        for j in range(n_reactions):
+            a[j] = max(_propensity(j, x, p), 0.0)
+            a0 += a[j]
+            critical[j] = 0
+            if a[j] > 0.0:
+                for i in range(stoich_ptr[j], stoich_ptr[j + 1]):
+                    if (stoich_val[i] < 0.0 and
+                            x[stoich_idx[i]] < -stoich_val[i] * threshold):
+                        critical[j] = 1
+                        ac0 += a[j]
+                        break
+        if a0 <= 0.0:
+            break
+
+        # Leap size bounding the relative change in each reactant species
+        # under the non-critical reactions (Cao, Gillespie & Petzold, 2006)
+        for s in range(n_species):
+            mu[s] = 0.0
+            sigma2[s] = 0.0
+        for j in range(n_reactions):
+            if a[j] > 0.0 and not critical[j]:
+                for i in range(stoich_ptr[j], stoich_ptr[j + 1]):
+                    mu[stoich_idx[i]] += stoich_val[i] * a[j]
+                    sigma2[stoich_idx[i]] += (stoich_val[i] *
+                                              stoich_val[i] * a[j])
+        tau1 = INFINITY
+        for s in range(n_species):
+            if hor[s] == 0 or (mu[s] == 0.0 and sigma2[s] == 0.0):
+                continue
+            xi = x[s]
+            g = hor[s]
+            if hor_copies[s] > 1 and xi > 2.0:
+                if hor[s] == 2:
+                    g = 2.0 + 1.0 / (xi - 1.0)
+                elif hor_copies[s] == 2:
+                    g = 1.5 * (2.0 + 1.0 / (xi - 1.0))
+                else:
+                    g = 3.0 + 1.0 / (xi - 1.0) + 2.0 / (xi - 2.0)
+            bound = max(epsilon * xi / g, 1.0)
+            if mu[s] != 0.0:
+                tau1 = min(tau1, bound / fabs(mu[s]))
+            tau1 = min(tau1, bound * bound / sigma2[s])
+
+        leaped = False
+        while tau1 >= 10.0 / a0:
+            # Leap: non-critical reactions fire a Poisson (or, if fast
+            # enough, normally) distributed number of times, and at most one
+            # critical reaction fires
+            tau2 = -log(rand.uniform()) / ac0 if ac0 > 0.0 else INFINITY
+            tau = min(tau1, tau2)
+            capped = tau >= tspan[k] - t
+            if capped:
+                tau = tspan[k] - t
+            x_prev[:] = x
+            for j in range(n_reactions):
+                if a[j] > 0.0 and not critical[j]:
+                    lam = a[j] * tau
+                    if lam >= langevin_threshold:
+                        _fire(j, lam + sqrt(lam) * rand.normal(), x,
+                              stoich_ptr, stoich_idx, stoich_val)
+                    else:
+                        _fire(j, rand.poisson(lam), x, stoich_ptr,
+                              stoich_idx, stoich_val)
+            if not capped and tau2 <= tau1:
+                target = rand.uniform() * ac0
+                acc = 0.0
+                fired = -1
+                for j in range(n_reactions):
+                    if critical[j] and a[j] > 0.0:
+                        # If rounding leaves the total short of the target,
+                        # the last critical reaction fires
+                        fired = j
+                        acc += a[j]
+                        if acc >= target:
+                            break
+                _fire(fired, 1.0, x, stoich_ptr, stoich_idx, stoich_val)
+            for s in range(n_species):
+                if x[s] < 0.0:
+                    break
+            else:
+                leaped = True
+                break
+            # A population went negative: retry with a shorter leap
+            x[:] = x_prev
+            tau1 /= 2.0
+
+        if leaped:
+            if capped:
+                t = tspan[k]
+                out[k, :] = x
+                k += 1
+            else:
+                t += tau
+            continue
+
+        # Leaping would not pay off: take an exact SSA step
+        tau = -log(rand.uniform()) / a0
+        target = rand.uniform() * a0
+        acc = 0.0
+        fired = -1
+        for j in range(n_reactions):
+            if a[j] > 0.0:
+                fired = j
+                acc += a[j]
+                if acc >= target:
+                    break
+        t += tau
+        while k < n_times and tspan[k] < t:
+            out[k, :] = x
+            k += 1
+        if k == n_times:
+            break
+        _fire(fired, 1.0, x, stoich_ptr, stoich_idx, stoich_val)
+    while k < n_times:
+        out[k, :] = x
+        k += 1
+"""
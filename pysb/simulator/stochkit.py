@@ -110,7 +110,7 @@ class StochKitSimulator(Simulator):
     def _run_stochkit(self, t=20, t_length=100, number_of_trajectories=1,
                       seed=None, algorithm='ssa', method=None,
                       num_processors=1, stats=False, epsilon=None,
-                      threshold=None):
+                      threshold=None, writer=None):
 
         extra_args = '-p {:d}'.format(num_processors)
 
@@ -197,8 +197,8 @@ class StochKitSimulator(Simulator):
 
             traj_dir = os.path.join(prefix_outdir, 'trajectories')
             try:
-                trajectories.extend([np.loadtxt(os.path.join(
-                    traj_dir, f)) for f in sorted(os.listdir(traj_dir))])
+                pset_trajectories = [np.loadtxt(os.path.join(
+                    traj_dir, f)) for f in sorted(os.listdir(traj_dir))]
             except Exception as e:
                 raise StochKitSimulatorException(
                     "Error reading StochKit trajectories: {}".format(e),
@@ -206,13 +206,21 @@ class StochKitSimulator(Simulator):
                     stderr=stderr
                 )
 
-            if len(trajectories) == 0 or len(stderr) != 0:
+            if len(pset_trajectories) == 0 or len(stderr) != 0:
                 raise StochKitSimulatorException(
                     "Solver execution failed: {}".format(e),
                     stdout=stdout,
                     stderr=stderr
                 )
 
+            if writer is not None:
+                # Write each parameter set's trajectories as they complete
+                pset_trajectories = np.array(pset_trajectories)
+                writer.append(pset_trajectories[:, :, 0] + self.tspan[0],
+                              pset_trajectories[:, :, 1:])
+            else:
+                trajectories.extend(pset_trajectories)
+
             self._logger.debug("StochKit STDOUT:\n{0}".format(stdout))
 
         # Return data
@@ -221,7 +229,7 @@ class StochKitSimulator(Simulator):
     def run(self, tspan=None, initials=None, param_values=None, n_runs=1,
             algorithm='ssa', output_dir=None,
             num_processors=1, seed=None, method=None, stats=False,
-            epsilon=None, threshold=None):
+            epsilon=None, threshold=None, save_to=None):
         """
         Run a simulation and returns the result (trajectories)
 
@@ -260,10 +268,16 @@ class StochKitSimulator(Simulator):
             Tolerance parameter for tau-leaping algorithm
         threshold : int or None
             Threshold parameter for tau-leaping algorithm
+        save_to : str or SimulationResultWriter, optional
+            If set, trajectories are written to this HDF5 file as each
+            parameter set completes, instead of being kept in memory, and a
+            :class:`LazySimulationResult` is returned. See
+            :class:`SimulationResultWriter`.
 
         Returns
         -------
-        A :class:`SimulationResult` object
+        A :class:`SimulationResult` object, or a
+        :class:`LazySimulationResult` if ``save_to`` is set
         """
         super(StochKitSimulator, self).run(tspan=tspan,
                                            initials=initials,
@@ -290,6 +304,10 @@ class StochKitSimulator(Simulator):
                 'spaced starting at t=0'
             )
 
+        writer = None
+        if save_to is not None:
+            writer = self._result_writer(save_to, t_length,
+                                         simulations_per_param_set=n_runs)
         try:
             trajectories = self._run_stochkit(t=t_range,
                                               number_of_trajectories=n_runs,
@@ -300,14 +318,20 @@ class StochKitSimulator(Simulator):
                                               num_processors=num_processors,
                                               stats=stats,
                                               epsilon=epsilon,
-                                              threshold=threshold)
+                                              threshold=threshold,
+                                              writer=writer)
         finally:
+            if writer is not None:
+                writer.close()
             if self.cleanup:
                 try:
                     shutil.rmtree(self._outdir)
                 except OSError:
                     pass
 
+        if writer is not None:
+            return writer.result()
+
         # set output time points
         trajectories_array = np.array(trajectories)
         self.tout = trajectories_array[:, :, 0] + self.tspan[0]
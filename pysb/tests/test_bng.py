@@ -8,6 +8,11 @@ from nose.tools import assert_raises_regexp
 from pysb.generator.bng import BngPrinter
 import sympy
 import math
+import shutil
+import tempfile
+import pysb.bng
+import pysb.cache
+import numpy as np
 
 
 @with_model
@@ -58,6 +63,50 @@ def test_sequential_simulations():
         ok_(yfull2.size == 51)
 
 
+@with_model
+def test_read_simulation_results():
+    Monomer('A')
+    Parameter('A_0', 100)
+    Initial(A(), A_0)
+    Parameter('k', 1)
+    Rule('degrade', A() >> None, k)
+    Observable('A_total', A())
+    with BngFileInterface(model) as bng:
+        bng.action('generate_network')
+        for i in range(2):
+            bng.action('simulate', method='ssa', t_end=5, n_steps=50,
+                       prefix='sim%d' % i)
+        bng.execute()
+        base_filenames = [os.path.join(bng.base_directory, 'sim%d' % i)
+                          for i in range(2)]
+        results = BngFileInterface.read_simulation_results_multi(
+            base_filenames)
+        eq_(results[0].dtype.names, ('time', '__s0', 'A_total'))
+        for base_filename, yfull in zip(base_filenames, results):
+            # Matches numpy.loadtxt
+            cdat = np.loadtxt(base_filename + '.cdat', skiprows=1)
+            ok_(np.array_equal(yfull['time'], cdat[:, 0]))
+            ok_(np.array_equal(yfull['__s0'], cdat[:, 1]))
+            ok_(np.array_equal(yfull['A_total'], cdat[:, 1]))
+        # Reading in parallel gives the same results
+        results_parallel = BngFileInterface.read_simulation_results_multi(
+            base_filenames, num_processors=2)
+        for yfull, yfull_parallel in zip(results, results_parallel):
+            ok_(np.array_equal(yfull, yfull_parallel))
+
+
+def test_read_bng_data_file_ragged_rows():
+    # A short row followed by a long one has the right number of values
+    # overall, but must not be reshaped into misaligned data
+    with tempfile.NamedTemporaryFile('w', suffix='.gdat',
+                                     delete=False) as f:
+        f.write('# time A_total\n0 1\n1\n2 3 4\n')
+    try:
+        assert_raises(ValueError, pysb.bng._read_bng_data_file, f.name)
+    finally:
+        os.remove(f.name)
+
+
 @with_model
 def test_compartment_species_equivalence():
     Parameter('p', 1)
@@ -102,7 +151,14 @@ def test_bidirectional_rules():
     ok_(len(model.reactions_bidirectional) == 1)
     ok_(len(model.reactions_bidirectional[0]['rule']) == 3)
     ok_(model.reactions_bidirectional[0]['reversible'])
-    #TODO Check that 'rate' has 4 terms
+    s0, s1 = sympy.symbols('__s0 __s1')
+    rxn = model.reactions_bidirectional[0]
+    ok_(rxn['reactants'] == (0, ) and rxn['products'] == (1, ))
+    ok_(rxn['rate'] == k1 * s0 - k2 * s1 - k3 * s1 - k4 * s1)
+    # Reaction dicts are built on first access, then reused
+    ok_(model.reactions[-1] is model.reactions[3])
+    ok_(sum(r['rate'] for r in model.reactions[1:]) ==
+        k2 * s1 + k3 * s1 + k4 * s1)
 
 
 @with_model
@@ -329,3 +385,82 @@ def test_parse_bngl_expression_and_or_equals():
     assert parse_bngl_expr('x and y') == sympy.And(x, y)
     assert parse_bngl_expr('x or y') == sympy.Or(x, y)
     assert parse_bngl_expr('x == y') == sympy.Eq(x, y)
+
+
+@with_model
+def test_network_cache():
+    Monomer('A', ['b'])
+    Monomer('B', ['a'])
+    Parameter('k', 1)
+    Rule('bind', A(b=None) + B(a=None) | A(b=1) % B(a=1), k, k)
+    Initial(A(b=None), Parameter('A_0', 10))
+    Initial(B(a=None), Parameter('B_0', 10))
+    Observable('AB', A(b=1) % B(a=1))
+    cache_dir = tempfile.mkdtemp()
+    pysb.cache.set_cache_dir(cache_dir)
+    try:
+        generate_equations(model)
+        reactions = list(model.reactions)
+        odes = list(model.odes)
+        entries = os.listdir(pysb.cache.get_cache_dir('network'))
+        eq_(len(entries), 1)
+
+        # A cache hit does not run BioNetGen
+        model.reset_equations()
+        generate_network = pysb.bng.generate_network
+        pysb.bng.generate_network = None
+        try:
+            generate_equations(model)
+        finally:
+            pysb.bng.generate_network = generate_network
+        eq_(list(model.reactions), reactions)
+        eq_(list(model.odes), odes)
+        eq_(model.observables['AB'].species, [2])
+
+        # Parameter values are part of the key
+        model.reset_equations()
+        k.value = 2
+        generate_equations(model)
+        eq_(list(model.reactions), reactions)
+        eq_(len(os.listdir(pysb.cache.get_cache_dir('network'))), 2)
+
+        # Network generation arguments are part of the key
+        model.reset_equations()
+        generate_equations(model, max_iter=1)
+        eq_(len(os.listdir(pysb.cache.get_cache_dir('network'))), 3)
+    finally:
+        pysb.cache.set_cache_dir(None)
+        shutil.rmtree(cache_dir)
+
+
+@with_model
+def test_network_cache_compartment_volume():
+    # BioNetGen works volume ratios into the rates in the .net file, so a
+    # change of compartment size must not reuse the cached network
+    Parameter('Vec', 1)
+    Parameter('Vcell', 1)
+    Compartment('EC', None, 3, Vec)
+    Compartment('PM', EC, 2, Vcell)
+    Monomer('L', ['r'])
+    Monomer('R', ['l'])
+    Parameter('kf', 1)
+    Rule('bind', L(r=None) ** EC + R(l=None) ** PM >>
+         L(r=1) ** EC % R(l=1) ** PM, kf)
+    Initial(L(r=None) ** EC, Parameter('L_0', 10))
+    Initial(R(l=None) ** PM, Parameter('R_0', 10))
+    cache_dir = tempfile.mkdtemp()
+    pysb.cache.set_cache_dir(cache_dir)
+    try:
+        generate_equations(model)
+        rates = [rxn['rate'] for rxn in model.reactions]
+        model.reset_equations()
+        Vec.value = 5
+        generate_equations(model)
+        new_rates = [rxn['rate'] for rxn in model.reactions]
+        ok_(rates != new_rates)
+        model.reset_equations()
+        generate_equations(model, cache=False)
+        eq_([rxn['rate'] for rxn in model.reactions], new_rates)
+    finally:
+        pysb.cache.set_cache_dir(None)
+        shutil.rmtree(cache_dir)
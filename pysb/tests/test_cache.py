@@ -0,0 +1,54 @@
+import os
+import time
+import shutil
+import tempfile
+import pysb.cache
+
+
+class TestCache(object):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pysb.cache.set_cache_dir(self.cache_dir)
+
+    def tearDown(self):
+        pysb.cache.set_cache_dir(None)
+        shutil.rmtree(self.cache_dir)
+
+    def _add_entry(self, key, size):
+        build_dir = pysb.cache.build_dir('test')
+        with open(os.path.join(build_dir, 'data'), 'wb') as f:
+            f.write(b'\0' * size)
+        return pysb.cache.publish('test', key, build_dir)
+
+    def test_publish_lookup(self):
+        key = pysb.cache.cache_key('a', 1)
+        assert pysb.cache.lookup('test', key) is None
+        path = self._add_entry(key, 10)
+        assert pysb.cache.lookup('test', key) == path
+        assert os.listdir(pysb.cache.get_cache_dir('test')) == [key]
+
+    def test_publish_existing(self):
+        path = self._add_entry('a', 10)
+        assert self._add_entry('a', 20) == path
+        assert os.path.getsize(os.path.join(path, 'data')) == 10
+
+    def test_evict_lru(self):
+        pysb.cache.set_max_size(25)
+        try:
+            self._add_entry('a', 10)
+            self._add_entry('b', 10)
+            # Mark 'a' as least recently used
+            old_time = time.time() - 100
+            os.utime(os.path.join(pysb.cache.get_cache_dir('test'), 'a'),
+                     (old_time, old_time))
+            pysb.cache.lookup('test', 'b')
+            self._add_entry('c', 10)
+            assert pysb.cache.lookup('test', 'a') is None
+            assert pysb.cache.lookup('test', 'b') is not None
+            assert pysb.cache.lookup('test', 'c') is not None
+        finally:
+            pysb.cache.set_max_size(None)
+
+    def test_cache_key(self):
+        assert pysb.cache.cache_key('a', 1) == pysb.cache.cache_key('a', 1)
+        assert pysb.cache.cache_key('a', 1) != pysb.cache.cache_key('a', 2)
@@ -3,6 +3,7 @@ from pysb.core import *
 from functools import partial
 from nose.tools import assert_raises
 import operator
+import sympy
 import unittest
 
 
@@ -320,6 +321,45 @@ def test_complex_pattern_equivalence_compartments():
     _check_pattern_equivalence((cp0, cp1))
 
 
+@with_model
+def test_complex_pattern_equivalence_symmetric():
+    """Ensure CP equivalence distinguishes symmetric complexes."""
+    Monomer('A', ['l', 'r'])
+
+    def ring(size, offset=0):
+        return [A(l=offset + i + 1, r=offset + (i + 1) % size + 1)
+                for i in range(size)]
+
+    cp0 = ComplexPattern(ring(6), None)
+    cp1 = ComplexPattern(ring(6)[3:] + ring(6)[:3], None)
+    cp2 = ComplexPattern(ring(3) + ring(3, offset=3), None)
+    _check_pattern_equivalence((cp0, cp1))
+    _check_pattern_equivalence((cp0, cp2), False)
+    eq_(cp0.canonical_key(), cp1.canonical_key())
+
+
+@with_model
+def test_canonical_key_bond_syntax():
+    Monomer('A', ['b', 'c', 's'], {'s': ['u', 'p']})
+    # Keys use BioNetGen syntax: !+ for ANY (or a dangling bond), !? for WILD
+    eq_(as_complex_pattern(A(b=ANY, c=WILD, s=('p', ANY))).canonical_key(),
+        'A(b!+,c!?,s~p!+)')
+    eq_(as_complex_pattern(A(b=1, s='u')).canonical_key(), 'A(b!+,s~u)')
+
+
+@with_model
+def test_get_species_index():
+    Monomer('A', ['b', 's'], {'s': ['u', 'p']})
+    model.species = [as_complex_pattern(A(b=None, s='u')),
+                     A(b=1, s='u') % A(b=1, s='p')]
+    eq_(model.get_species_index(A(b=2, s='p') % A(b=2, s='u')), 1)
+    eq_(model.get_species_index(A(b=None, s='p')), None)
+    model.species.append(as_complex_pattern(A(b=None, s='p')))
+    eq_(model.get_species_index(A(b=None, s='p')), 2)
+    model.reset_equations()
+    eq_(model.get_species_index(A(b=None, s='u')), None)
+
+
 @with_model
 def test_reaction_pattern_match_complex_pattern_ordering():
     """Ensure CP equivalence is insensitive to MP order."""
@@ -463,6 +503,25 @@ def test_multi_bonds():
     assert a_pat.is_concrete()
 
 
+@with_model
+def test_pattern_cache():
+    from pysb.core import _PatternCache
+    Monomer('A', ['a'])
+    cache = _PatternCache(maxsize=2)
+    cps = [as_complex_pattern(A(a=None)) for _ in range(3)]
+    graphs = [cache.get(cp, 'graph', ComplexPattern._build_graph)
+              for cp in cps]
+    # Least recently used entry is evicted
+    eq_(len(cache), 2)
+    assert cache.get(cps[2], 'graph', ComplexPattern._build_graph) is \
+        graphs[2]
+    assert cache.get(cps[0], 'graph', ComplexPattern._build_graph) is not \
+        graphs[0]
+    # Entries are dropped with their pattern
+    del cps[:]
+    eq_(len(cache), 0)
+
+
 @with_model
 def test_duplicate_sites():
     Monomer('A', ['a', 'a'])
@@ -556,3 +615,39 @@ def test_update_initial_condition():
 
 def test_model_not_defined():
     assert_raises(ModelNotDefinedError, Monomer, 'A')
+
+
+@with_model
+def test_reaction_network():
+    Monomer('A')
+    Monomer('B')
+    Parameter('kf', 1.0)
+    Parameter('kr', 2.0)
+    model.species = [as_complex_pattern(A()), as_complex_pattern(B())]
+    network = ReactionNetwork()
+    network.add_reaction((0, 0), (1, ), [kf, 0.5], ('dimerize', ), (False, ))
+    network.add_reaction((1, ), (0, 0), [kr], ('dimerize', ), (True, ))
+    network.finalize()
+    model.reaction_network = network
+    assert model.reaction_network is network
+    assert len(model.reactions) == 2
+    assert len(model.reactions_bidirectional) == 1
+
+    s0, s1 = sympy.symbols('__s0 __s1')
+    assert model.reactions[0] == {
+        'reactants': (0, 0), 'products': (1, ),
+        'rate': 0.5 * kf * s0 ** 2, 'rule': ('dimerize', ),
+        'reverse': (False, )}
+    assert model.reactions[-1]['rate'] == kr * s1
+    assert model.reactions_bidirectional[0] == {
+        'reactants': (0, 0), 'products': (1, ),
+        'rate': 0.5 * kf * s0 ** 2 - kr * s1, 'rule': ('dimerize', ),
+        'reversible': True}
+
+    sm = model.stoichiometry_matrix
+    # Stoichiometry matches that calculated from the reaction dicts
+    model.reactions = list(model.reactions)
+    model._stoichiometry_matrix = None
+    assert model.reaction_network is None
+    assert (sm != model.stoichiometry_matrix).nnz == 0
+    assert sm.toarray().tolist() == [[-2, 2], [1, -1]]
@@ -0,0 +1,140 @@
+from pysb.testing import *
+from pysb import *
+from pysb.core import ComponentSet
+import pysb.bng
+from pysb.netgen import generate_equations
+from pysb.examples import bax_pore, bax_pore_sequential, \
+    bngwiki_egfr_simple, bngwiki_enzymatic_cycle_mm, earm_1_0, kinase_cascade
+
+
+def _network(model):
+    reactions = [(rxn['reactants'], rxn['products'], rxn['rate'],
+                  rxn['rule'], rxn['reverse']) for rxn in model.reactions]
+    observables = [(list(obs.species), list(obs.coefficients))
+                   for obs in model.observables]
+    return list(model.species), reactions, observables
+
+
+def check_network_matches_bng(model):
+    model.reset_equations()
+    generate_equations(model)
+    species, reactions, observables = _network(model)
+    model.reset_equations()
+    pysb.bng.generate_equations(model, cache=False)
+    bng_species, bng_reactions, bng_observables = _network(model)
+
+    eq_(len(species), len(bng_species))
+    for sp, bng_sp in zip(species, bng_species):
+        ok_(sp.is_equivalent_to(bng_sp), '%s != %s' % (sp, bng_sp))
+    eq_(reactions, bng_reactions)
+    eq_(observables, bng_observables)
+
+
+def test_network_matches_bng():
+    for model in (bax_pore.model, bax_pore_sequential.model,
+                  bngwiki_egfr_simple.model,
+                  bngwiki_enzymatic_cycle_mm.model, earm_1_0.model,
+                  kinase_cascade.model):
+        yield check_network_matches_bng, model
+
+
+@with_model
+def test_statistical_factors():
+    Monomer('A', ['b', 's'], {'s': ['u', 'p']})
+    Parameter('kf', 1)
+    Parameter('kr', 1)
+    Parameter('kp', 1)
+    Rule('dimerize', A(b=None) + A(b=None) | A(b=1) % A(b=1), kf, kr)
+    Rule('phosphorylate', A(b=1, s='u') % A(b=1) >> A(b=1, s='p') % A(b=1),
+         kp)
+    Initial(A(b=None, s='u'), Parameter('A_0', 100))
+    Observable('A_dimer', A(b=1) % A(b=1))
+    generate_equations(model)
+
+    eq_(len(model.species), 5)
+    rates = {(rxn['reactants'], rxn['products']): rxn['rate']
+             for rxn in model.reactions}
+    eq_(len(rates), 8)
+    # Homodimerization is halved, phosphorylation of a symmetric dimer
+    # happens at either molecule
+    eq_(str(rates[(0, 0), (1,)]), '0.5*__s0**2*kf')
+    eq_(str(rates[(1,), (0, 0)]), '__s1*kr')
+    eq_(str(rates[(1,), (2,)]), '2.0*__s1*kp')
+    eq_(str(rates[(2,), (4,)]), '__s2*kp')
+    eq_(str(rates[(0, 3), (2,)]), '__s0*__s3*kf')
+    eq_(model.observables['A_dimer'].species, [1, 2, 4])
+
+
+@with_model
+def test_max_agg():
+    Monomer('A', ['l', 'r'])
+    Rule('polymerize', A(r=None) + A(l=None) >> A(r=1) % A(l=1),
+         Parameter('kf', 1))
+    Initial(A(l=None, r=None), Parameter('A_0', 100))
+    generate_equations(model, max_agg=3)
+    eq_([len(sp.monomer_patterns) for sp in model.species], [1, 2, 3])
+    model.reset_equations()
+    generate_equations(model, max_iter=1)
+    eq_(len(model.species), 2)
+
+
+@with_model
+def test_compartments_unsupported():
+    Compartment('cell')
+    Monomer('A')
+    Initial(A() ** cell, Parameter('A_0', 1))
+    assert_raises(NotImplementedError, generate_equations, model)
+
+
+def _network_keys(model):
+    keys = [sp.canonical_key() for sp in model.species]
+    reactions = sorted((tuple(keys[sp] for sp in rxn['reactants']),
+                        tuple(keys[sp] for sp in rxn['products']),
+                        rxn['rule']) for rxn in model.reactions)
+    return set(keys), reactions
+
+
+@with_model
+def test_incremental():
+    Monomer('A', ['b', 's'], {'s': ['u', 'p']})
+    Monomer('B', ['a'])
+    Parameter('kf', 1)
+    Parameter('kr', 1)
+    Parameter('kp', 1)
+    Rule('bind', A(b=None) + B(a=None) | A(b=1) % B(a=1), kf, kr)
+    Rule('phosphorylate', A(b=1, s='u') % B(a=1) >> A(b=1, s='p') % B(a=1),
+         kp)
+    Initial(A(b=None, s='u'), Parameter('A_0', 100))
+    Initial(B(a=None), Parameter('B_0', 100))
+    Observable('A_p', A(s='p'))
+    generate_equations(model)
+    species = list(model.species)
+    full = _network_keys(model)
+
+    # Parameter changes reuse the network
+    kp.value = 2
+    model.reset_equations()
+    generate_equations(model)
+    eq_(len(model.species), len(species))
+    ok_(all(sp is old_sp for sp, old_sp in zip(model.species, species)))
+
+    # Removing a rule drops its reactions and unreachable species
+    rules = list(model.rules)
+    model.rules = ComponentSet(rules[:1])
+    model.reset_equations()
+    generate_equations(model)
+    reduced = _network_keys(model)
+    eq_(len(model.species), 3)
+    eq_(model.observables['A_p'].species, [])
+    model.reset_equations()
+    generate_equations(model, incremental=False)
+    eq_(_network_keys(model), reduced)
+
+    # Adding a rule extends the network, keeping species indexes
+    model.rules = ComponentSet(rules)
+    model.reset_equations()
+    generate_equations(model)
+    eq_(_network_keys(model), full)
+    eq_([sp.canonical_key() for sp in model.species[:3]],
+        [sp.canonical_key() for sp in species[:3]])
+    eq_(len(model.observables['A_p'].species), 2)
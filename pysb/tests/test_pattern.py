@@ -1,10 +1,13 @@
-from pysb.pattern import SpeciesPatternMatcher, match_complex_pattern
+from pysb.pattern import SpeciesPatternMatcher, match_complex_pattern, \
+    _match_graphs, _node_match, _PatternGraph
 from pysb.examples import robertson, bax_pore, bax_pore_sequential, \
     earm_1_3, kinase_cascade, bngwiki_egfr_simple
 from pysb.bng import generate_equations
 from nose.tools import assert_raises
 from pysb import as_complex_pattern, as_reaction_pattern, ANY, WILD, \
-    Monomer
+    Monomer, MultiState
+from pysb.testing import with_model
+import networkx as nx
 import collections
 
 
@@ -40,6 +43,104 @@ def test_wildcards():
     # B() should not match A(b=WILD)
     assert not match_complex_pattern(b_mon, a_wild)
 
+    # A WILD bond must not prevent a match with an unbound site
+    a_mon = Monomer('A2', ['s', 't'], {'s': ['u', 'p'], 't': ['x', 'y']},
+                    _export=False)
+    assert match_complex_pattern(as_complex_pattern(a_mon(s=('p', WILD),
+                                                          t='x')),
+                                 as_complex_pattern(a_mon(s='p', t='x')))
+
+
+def test_any_bond():
+    a_mon = Monomer('A', ['s', 't'], {'s': ['u', 'p']}, _export=False)
+    monomer = as_complex_pattern(a_mon(s='u', t=None))
+    dimer = as_complex_pattern(a_mon(s='u', t=1) % a_mon(s='u', t=1))
+
+    # ANY requires a bond, even at a site with a state
+    assert not match_complex_pattern(as_complex_pattern(a_mon(s=ANY)),
+                                     monomer)
+    assert match_complex_pattern(as_complex_pattern(a_mon(t=ANY)), dimer)
+    assert match_complex_pattern(a_mon(t=ANY) % a_mon(t=ANY), dimer)
+    assert match_complex_pattern(a_mon(t=ANY) % a_mon(t=ANY), dimer,
+                                 count=True) == 2
+
+
+def check_compiled_pattern_matching(model, pattern):
+    """Check SpeciesPatternMatcher agrees with networkx graph matching"""
+    spm = SpeciesPatternMatcher(model)
+    cp = as_complex_pattern(pattern)
+    expected = collections.OrderedDict()
+    for idx, sp in enumerate(model.species):
+        count = _match_graphs(cp, sp, exact=False, count=True)
+        if count:
+            expected[idx] = count
+    assert dict(spm.match(pattern, index=True, counts=True)) == expected
+    assert sorted(spm.match(pattern, index=True)) == list(expected)
+
+
+def test_compiled_pattern_matching():
+    model = bngwiki_egfr_simple.model
+    generate_equations(model)
+    EGFR = model.monomers['EGFR']
+    Grb2 = model.monomers['Grb2']
+    for pattern in (EGFR(), EGFR(Y1068=('P', WILD)), EGFR(Y1068=('P', ANY)),
+                    EGFR(CR1=1) % EGFR(CR1=1),
+                    EGFR(CR1=ANY, Y1068=('P', 1)) % Grb2(SH2=1, SH3=None),
+                    EGFR(L=ANY) % EGFR(L=None)):
+        yield check_compiled_pattern_matching, model, pattern
+
+    model = bax_pore.model
+    generate_equations(model)
+    BAX = model.monomers['BAX']
+    for pattern in (BAX(t1=WILD, t2=ANY), BAX(t1=1) % BAX(t2=1),
+                    BAX(t1=1, t2=2) % BAX(t1=2, t2=1)):
+        yield check_compiled_pattern_matching, model, pattern
+
+
+@with_model
+def test_pattern_graph_to_networkx():
+    Monomer('A', ['s', 's', 't'], {'s': ['u', 'p']})
+    Monomer('B', ['a'])
+    for pattern in (A(), B(a=None), A(s=MultiState(('u', 1), 'p'), t=None) %
+                    B(a=1), A(t=ANY) % A(s=MultiState(('p', WILD), 'u')),
+                    A(t=[1, 2]) % B(a=1) % B(a=2), A(t=3)):
+        cp = as_complex_pattern(pattern)
+        assert nx.is_isomorphic(_PatternGraph(cp).to_networkx(),
+                                cp._as_graph(), node_match=_node_match)
+
+
+def test_match_patterns():
+    model = bngwiki_egfr_simple.model
+    generate_equations(model)
+    spm = SpeciesPatternMatcher(model)
+    EGFR = model.monomers['EGFR']
+    Grb2 = model.monomers['Grb2']
+    patterns = [EGFR(), Grb2(SH2=ANY), EGFR(Y1068=('P', WILD)), Grb2,
+                EGFR(CR1=1) % EGFR(CR1=1), EGFR()]
+    for counts in (False, True):
+        # match_patterns lists species in species list order
+        expected = [sorted(spm.match(pattern, index=True,
+                                     counts=counts).items() if counts else
+                           spm.match(pattern, index=True))
+                    for pattern in patterns]
+        for num_processors in (1, 2):
+            matches = spm.match_patterns(patterns, index=True, counts=counts,
+                                         num_processors=num_processors)
+            if counts:
+                matches = [list(match.items()) for match in matches]
+            assert matches == expected
+
+
+def test_match_observables():
+    for model in (bax_pore.model, earm_1_3.model):
+        generate_equations(model)
+        spm = SpeciesPatternMatcher(model)
+        observable_matches = spm.match_observables()
+        assert list(observable_matches) == list(model.observables)
+        for obs, (species, coefficients) in observable_matches.items():
+            assert species == obs.species
+            assert coefficients == obs.coefficients
+
 
 def check_all_species_generated(model):
     """Check the lists of rules and triggering species match BNG"""
@@ -1,5 +1,6 @@
 from pysb.simulator import ScipyOdeSimulator, BngSimulator
-from pysb.simulator.base import SimulationResult
+from pysb.simulator.base import SimulationResult, SimulationResultWriter, \
+    LazySimulationResult
 from pysb.examples import tyson_oscillator, robertson, \
     expression_observables, earm_1_3, bax_pore_sequential, bax_pore, \
     bngwiki_egfr_simple
@@ -97,6 +98,79 @@ class TestSimulationResultEarm13(object):
         assert isinstance(self.simres.observable(m.cSmac()), pd.Series)
 
 
+def test_simres_observables_expressions_multi():
+    """ Observables and expressions across simulations and param sets """
+    model = expression_observables.model
+    tspan1 = np.linspace(0, 40, 10)
+    tspan2 = np.linspace(0, 40, 5)
+    sim = ScipyOdeSimulator(model)
+    trajectories = [sim.run(tspan=tspan1).species,
+                    sim.run(tspan=tspan2).species]
+    sim.param_values = {'c1_scaling': [1.0, 3.0]}
+    simres = SimulationResult(sim, [tspan1, tspan2], trajectories)
+    nbd = model.expressions['NBD_signal'].expand_expr()
+    for n, (c1_scaling, traj) in enumerate(zip([1.0, 3.0], trajectories)):
+        obs = simres.observables[n]
+        for o in model.observables:
+            assert np.allclose(obs[o.name], (traj[:, o.species] *
+                                             o.coefficients).sum(axis=1))
+        expected = [float(nbd.subs(dict(
+            [(o, obs[o.name][t]) for o in model.observables] +
+            [(p, p.value) for p in model.parameters if p.name !=
+             'c1_scaling'] + [(model.parameters['c1_scaling'], c1_scaling)]
+        ))) for t in range(len(traj))]
+        assert np.allclose(simres.expressions[n]['NBD_signal'], expected)
+
+
+def test_simres_columnar():
+    """ Columnar storage gives the same results as per-simulation arrays """
+    model = expression_observables.model
+    tspan1 = np.linspace(0, 40, 10)
+    tspan2 = np.linspace(0, 40, 5)
+    sim = ScipyOdeSimulator(model)
+    trajectories = [sim.run(tspan=tspan1).species,
+                    sim.run(tspan=tspan2).species]
+    sim.param_values = {'c1_scaling': [1.0, 3.0]}
+    simres = SimulationResult(sim, [tspan1, tspan2], trajectories)
+    sim.param_values = {'c1_scaling': [1.0, 3.0]}
+    simres_col = SimulationResult(sim, [tspan1, tspan2], trajectories,
+                                  columnar=True)
+
+    for n in range(2):
+        assert np.allclose(simres.species[n], simres_col.species[n])
+        for name in simres.all[n].dtype.names:
+            assert np.allclose(simres.all[n][name], simres_col.all[n][name])
+        assert np.allclose(simres.observables[n]['Bax_c0'],
+                           simres_col.observables[n]['Bax_c0'])
+        assert np.allclose(simres.expressions[n]['NBD_signal'],
+                           simres_col.expressions[n]['NBD_signal'])
+    assert simres.dataframe.equals(simres_col.dataframe)
+
+    # All accessors are views of the same array
+    data = simres_col._data
+    assert data.shape == (len(tspan1) + len(tspan2), 7)
+    assert np.shares_memory(simres_col.species[1], data)
+    assert np.shares_memory(simres_col.observables[1], data)
+    assert np.shares_memory(simres_col.dataframe.values, data)
+
+
+def test_model_snapshot_shared():
+    model = copy.deepcopy(robertson.model)
+    sim = ScipyOdeSimulator(model, tspan=np.linspace(0, 40, 10))
+    res1 = sim.run()
+    res2 = sim.run(param_values={'k1': 0.02})
+    # Run overrides don't modify the model, so the snapshot is shared
+    assert res1._model is res2._model
+    assert res1._model is not model
+
+    # Modifying the model invalidates the snapshot
+    model.parameters['k1'].value = 0.03
+    res3 = sim.run()
+    assert res3._model is not res1._model
+    assert res3._model.parameters['k1'].value == 0.03
+    assert res1._model.parameters['k1'].value == 0.04
+
+
 def test_save_load():
     tspan = np.linspace(0, 100, 101)
     # Make a copy of model so other tests etc. don't see the changed name.
@@ -190,6 +264,60 @@ def test_save_load():
     _check_resultsets_equal(nfres2, nfres2_load)
 
 
+def test_save_to():
+    tspan = np.linspace(0, 40, 10)
+    sim = ScipyOdeSimulator(robertson.model, tspan=tspan)
+    param_values = {'k1': [0.01, 0.02, 0.03, 0.04, 0.05]}
+    simres = sim.run(param_values=param_values)
+
+    with tempfile.NamedTemporaryFile() as tf:
+        # Cannot have two file handles on Windows
+        tf.close()
+
+        lazy_res = sim.run(param_values=param_values, save_to=tf.name)
+        assert isinstance(lazy_res, LazySimulationResult)
+        assert lazy_res.nsims == 5
+        assert np.allclose(lazy_res.param_values, simres.param_values)
+        assert np.allclose(lazy_res[-1].species, simres.species[-1])
+        assert np.allclose(lazy_res[1::2].species, simres.species[1::2])
+        assert np.allclose(lazy_res[1::2].param_values,
+                           simres.param_values[1::2])
+        assert_raises(IndexError, lazy_res.__getitem__, 5)
+
+        # Streamed files can also be loaded in full
+        simres_load = SimulationResult.load(tf.name)
+        assert np.allclose(simres_load.species, simres.species)
+        assert np.allclose(simres_load.observables[2]['A_total'],
+                           simres.observables[2]['A_total'])
+
+        # Batched simulations are written a batch at a time
+        lazy_res = sim.run(param_values=param_values, batch_size=2,
+                           save_to=SimulationResultWriter(
+                               tf.name, dataset_name='batch', append=True))
+        assert np.allclose(lazy_res[:].species, simres.species, rtol=1e-4)
+
+
+def test_save_to_read_during_run():
+    sim = ScipyOdeSimulator(robertson.model, tspan=np.linspace(0, 40, 10))
+    sim.param_values = {'k1': [0.01, 0.02]}
+    species = sim.run().species
+    sim.param_values = {'k1': [0.01, 0.02]}
+
+    with tempfile.NamedTemporaryFile() as tf:
+        tf.close()
+
+        writer = SimulationResultWriter(tf.name, swmr=True)
+        writer.start(sim, n_times=10)
+        writer.append(sim.tspan, species[0])
+        lazy_res = writer.result()
+        assert lazy_res.nsims == 1
+        assert np.allclose(lazy_res[0].species, species[0])
+        writer.append(sim.tspan, species[1])
+        assert lazy_res.nsims == 2
+        writer.close()
+        assert np.allclose(lazy_res[:].species, species)
+
+
 def _check_resultsets_equal(res1, res2):
     try:
         assert np.allclose(res1.species, res2.species)
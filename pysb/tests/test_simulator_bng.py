@@ -53,6 +53,12 @@ class TestBngSimulator(object):
         # Check initials are getting correctly reset on each simulation
         assert np.allclose(x.species[-1][0, :], x.species[0][0, :])
 
+    def test_parallel_read(self):
+        x = self.sim.run(n_runs=4, seed=_BNG_SEED)
+        x2 = self.sim.run(n_runs=4, seed=_BNG_SEED, num_processors=2)
+        for sp, sp2 in zip(x.species, x2.species):
+            assert np.array_equal(sp, sp2)
+
     def test_change_parameters(self):
         x = self.sim.run(n_runs=10, param_values={'ksynthA': 200},
                          initials={self.model.species[0]: 100})
@@ -224,3 +230,27 @@ def test_set_initials_by_params():
     traj = bng_sim.run(param_values=param_values)
     assert np.allclose(traj.initials, [0, 1, 1])
     assert np.allclose(traj.dataframe.loc[0][0:3], [0, 1, 1])
+
+
+def test_network_reuse():
+    model = robertson.model
+    tspan = np.linspace(0, 10, 11)
+    sim = BngSimulator(model, tspan=tspan)
+    res1 = sim.run(method='ode')
+    network = model.reaction_network
+    # Later runs simulate the saved network file, so the network is not
+    # generated or parsed again
+    res2 = sim.run(method='ode', param_values={'k1': 0.08})
+    assert model.reaction_network is network
+    res3 = BngSimulator(model, tspan=tspan).run(method='ode',
+                                                param_values={'k1': 0.08})
+    assert np.allclose(res2.species, res3.species)
+    assert not np.allclose(res1.species, res2.species)
+    # Initial conditions are set on the reused network
+    res4 = sim.run(method='ode', initials={model.species[0]: 2})
+    assert np.allclose(res4.species[0, 0], 2)
+    # A new network is generated after the model's equations are reset
+    model.reset_equations()
+    res5 = sim.run(method='ode')
+    assert model.reaction_network is not network
+    assert np.allclose(res1.species, res5.species)
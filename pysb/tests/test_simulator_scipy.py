@@ -1,12 +1,20 @@
 from pysb.testing import *
 import sys
+import os
 import copy
+import shutil
+import tempfile
 import numpy as np
+import sympy
 from pysb import Monomer, Parameter, Initial, Observable, Rule, Expression
 from pysb.simulator import ScipyOdeSimulator
+from pysb.simulator.scipyode import _ChunkScheduler
+import pysb.cache
 from pysb.examples import robertson, earm_1_0
 import unittest
+import mock
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 
 class TestScipySimulatorBase(object):
@@ -194,12 +202,68 @@ class TestScipyOdeCompilerTests(TestScipySimulatorBase):
         assert simres.species.shape[0] == self.args['tspan'].shape[0]
         assert np.allclose(self.python_res.dataframe, simres.dataframe)
 
+    def test_cython_parallel_codegen(self):
+        sim = ScipyOdeSimulator(compiler='cython', **self.args)
+        sim2 = ScipyOdeSimulator(compiler='cython', codegen_num_processors=2,
+                                 **self.args)
+        assert sim2._code_eqs == sim._code_eqs
+        assert np.allclose(self.python_res.dataframe, sim2.run().dataframe)
+
+    def test_cython_kernel_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            pysb.cache.set_cache_dir(cache_dir)
+            # Use non-default directives so the kernels are not already
+            # loaded in this process by another test
+            directives = dict(ScipyOdeSimulator.default_cython_directives,
+                              cdivision=True)
+            ScipyOdeSimulator(compiler='cython',
+                              cython_directives=directives, **self.args)
+            # RHS and Jacobian kernels
+            kernel_dirs = os.listdir(pysb.cache.get_cache_dir('cython'))
+            assert len(kernel_dirs) == 2
+            # A second simulator reuses the compiled kernels
+            sim2 = ScipyOdeSimulator(compiler='cython',
+                                     cython_directives=directives,
+                                     **self.args)
+            assert os.listdir(pysb.cache.get_cache_dir('cython')) == \
+                kernel_dirs
+            assert np.allclose(self.python_res.dataframe,
+                               sim2.run().dataframe)
+        finally:
+            pysb.cache.set_cache_dir(None)
+            shutil.rmtree(cache_dir)
+
     def test_theano(self):
         sim = ScipyOdeSimulator(compiler='theano', **self.args)
         simres = sim.run()
         assert simres.species.shape[0] == self.args['tspan'].shape[0]
         assert np.allclose(self.python_res.dataframe, simres.dataframe)
 
+    def test_solve_ivp(self):
+        for compiler in ('python', 'cython'):
+            for integrator in ('bdf', 'radau'):
+                for use_analytic_jacobian in (True, False):
+                    yield (self._check_solve_ivp, compiler, integrator,
+                           use_analytic_jacobian)
+
+    def _check_solve_ivp(self, compiler, integrator, use_analytic_jacobian):
+        args = dict(self.args, integrator=integrator, compiler=compiler,
+                    use_analytic_jacobian=use_analytic_jacobian)
+        simres = ScipyOdeSimulator(**args).run()
+        assert np.allclose(self.python_res.species, simres.species,
+                           rtol=1e-4)
+
+    def test_jacobian_sparsity(self):
+        sparsity = self.python_sim._jac_sparsity
+        species = [sympy.Symbol('__s%d' % i)
+                   for i in range(len(self.model.species))]
+        dense_jac = sympy.Matrix(self.model.odes).jacobian(species)
+        assert sparsity.shape == dense_jac.shape
+        for i in range(dense_jac.shape[0]):
+            for j in range(dense_jac.shape[1]):
+                assert sparsity[i, j] == (dense_jac[i, j] != 0)
+
     @unittest.skipIf(sys.version_info.major >= 3, 'weave not available for '
                                                   'Python 3')
     def test_weave(self):
@@ -359,7 +423,7 @@ class TestScipySimulatorMultiple(TestScipySimulatorBase):
     @unittest.skipIf(sys.version_info.major < 3,
                      'Parallel execution requires Python >= 3.3')
     def test_parallel(self):
-        for integrator in ('vode', 'lsoda'):
+        for integrator in ('vode', 'lsoda', 'bdf'):
             for use_analytic_jacobian in (True, False):
                 yield self._check_parallel, integrator, use_analytic_jacobian
 
@@ -375,6 +439,95 @@ class TestScipySimulatorMultiple(TestScipySimulatorBase):
         res = sim.run(initials=initials, num_processors=2)
         assert np.allclose(res.species, base_res.species)
 
+    @unittest.skipIf(sys.version_info.major < 3,
+                     'Parallel execution requires Python >= 3.3')
+    def test_persistent_pool(self):
+        initials = [[10, 20, 30], [50, 60, 70], [1, 2, 3]]
+        sim = ScipyOdeSimulator(self.model, self.sim.tspan)
+        base_res = sim.run(initials=initials)
+        res = sim.run(initials=initials, num_processors=2)
+        executor = sim._executor
+        assert executor is not None
+        res2 = sim.run(initials=initials[::-1], num_processors=2)
+        assert sim._executor is executor
+        assert np.allclose(res.species, base_res.species)
+        assert np.allclose(res2.species, base_res.species[::-1])
+        sim.close()
+        assert sim._executor is None
+
+    @unittest.skipIf(sys.version_info.major < 3,
+                     'Parallel execution requires Python >= 3.3')
+    def test_parallel_python(self):
+        initials = [[10, 20, 30], [50, 60, 70], [1, 2, 3]]
+        sim = ScipyOdeSimulator(self.model, self.sim.tspan,
+                                compiler='python',
+                                use_analytic_jacobian=True)
+        base_res = sim.run(initials=initials)
+        res = sim.run(initials=initials, num_processors=2)
+        sim.close()
+        assert np.allclose(res.species, base_res.species)
+
+    def test_executor(self):
+        initials = [[10, 20, 30], [50, 60, 70], [1, 2, 3]]
+        sim = ScipyOdeSimulator(self.model, self.sim.tspan,
+                                integrator='lsoda')
+        base_res = sim.run(initials=initials)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Work in flight is sized from the executor's workers, rather
+            # than num_processors
+            with mock.patch('pysb.simulator.scipyode._ChunkScheduler',
+                            wraps=_ChunkScheduler) as scheduler:
+                res = sim.run(initials=initials, executor=executor)
+        scheduler.assert_called_once_with(3, 4, None)
+        assert sim._executor is None
+        assert np.allclose(res.species, base_res.species)
+
+    def test_batch(self):
+        for compiler in ('python', 'cython'):
+            for integrator in ('vode', 'lsoda', 'dopri5', 'bdf'):
+                yield self._check_batch, compiler, integrator
+
+    def _check_batch(self, compiler, integrator):
+        initials = [[10, 20, 30], [50, 60, 70], [1, 2, 3]]
+        param_values = [[100, 100, 100, 0, 0],
+                        [50, 100, 100, 0, 0],
+                        [100, 10, 1, 0, 0]]
+        sim = ScipyOdeSimulator(self.model, self.sim.tspan,
+                                integrator=integrator, compiler=compiler)
+        base_res = sim.run(initials=initials, param_values=param_values)
+        res = sim.run(initials=initials, param_values=param_values,
+                      batch_size=2)
+        assert res.nsims == 3
+        assert np.allclose(res.species, base_res.species, rtol=1e-4)
+        if sys.version_info.major >= 3:
+            res = sim.run(initials=initials, param_values=param_values,
+                          batch_size=2, num_processors=2)
+            assert np.allclose(res.species, base_res.species, rtol=1e-4)
+
+
+def test_chunk_scheduler():
+    scheduler = _ChunkScheduler(n_sims=100, n_workers=2)
+    # One simulation per chunk until costs have been measured
+    assert scheduler.next_chunk() == (0, 1)
+    assert scheduler.next_chunk() == (1, 2)
+    scheduler.record(1, 0.001)
+    # Chunk size is limited to a quarter of the remaining simulations
+    assert scheduler.next_chunk() == (2, 27)
+    scheduler.record(1, 0.1)
+    # Expensive simulations give small chunks
+    assert scheduler.next_chunk() == (27, 28)
+    chunks = []
+    while True:
+        chunk = scheduler.next_chunk()
+        if chunk is None:
+            break
+        chunks.append(chunk)
+    assert chunks[-1][1] == 100
+
+    scheduler = _ChunkScheduler(n_sims=5, n_workers=2, batch_size=2)
+    assert [scheduler.next_chunk() for _ in range(4)] == \
+        [(0, 2), (2, 4), (4, 5), None]
+
 
 @with_model
 def test_integrate_with_expression():
@@ -0,0 +1,123 @@
+from pysb.testing import *
+from pysb import Monomer, Parameter, Initial, Observable, Rule
+from pysb.simulator.ssa import SsaSimulator, SsaSimulatorException
+from pysb.examples import robertson, earm_1_0, expression_observables
+from pysb.core import as_complex_pattern
+import numpy as np
+import mock
+
+_SSA_SEED = 123
+
+
+@raises(ValueError)
+def test_ssa_invalid_init_kwarg():
+    SsaSimulator(robertson.model, tspan=range(100), spam='eggs')
+
+
+@raises(ImportError)
+def test_ssa_old_numpy():
+    with mock.patch('pysb.simulator.ssa.np.random', spec=[]):
+        SsaSimulator(robertson.model, tspan=range(10))
+
+
+@raises(SsaSimulatorException)
+def test_ssa_invalid_method():
+    SsaSimulator(robertson.model, tspan=range(10)).run(method='eggs')
+
+
+def test_ssa_earm():
+    tspan = np.linspace(0, 1000, 10)
+    sim = SsaSimulator(earm_1_0.model, tspan=tspan)
+    for method in ('direct', 'sorting'):
+        simres = sim.run(n_runs=2, seed=_SSA_SEED, method=method)
+        assert simres.species[0].shape == (len(tspan),
+                                           len(earm_1_0.model.species))
+        # Copy numbers are whole numbers
+        assert np.all(simres.species[0] == np.round(simres.species[0]))
+
+
+def test_ssa_seed():
+    sim = SsaSimulator(robertson.model, tspan=np.linspace(0, 10, 5))
+    res1 = sim.run(n_runs=3, seed=_SSA_SEED)
+    res2 = sim.run(n_runs=3, seed=_SSA_SEED)
+    for sp1, sp2 in zip(res1.species, res2.species):
+        assert np.array_equal(sp1, sp2)
+
+
+def test_ssa_multi_initials():
+    model = earm_1_0.model
+    tspan = np.linspace(0, 1000, 10)
+    sim = SsaSimulator(model, tspan=tspan)
+    unbound_L = model.monomers['L'](b=None)
+    simres = sim.run(initials={unbound_L: [3000, 1500]},
+                     n_runs=2, seed=_SSA_SEED)
+    df = simres.dataframe
+
+    unbound_L_index = model.get_species_index(as_complex_pattern(unbound_L))
+
+    # Check we have two repeats of each initial
+    assert np.allclose(df.loc[(slice(None), 0), '__s%d' % unbound_L_index],
+                       [3000, 3000, 1500, 1500])
+
+
+def test_ssa_expressions():
+    sim = SsaSimulator(expression_observables.model,
+                       tspan=np.linspace(0, 100, 5))
+    sim.run(n_runs=2, seed=_SSA_SEED)
+
+
+@with_model
+def test_ssa_birth_death():
+    Monomer('A')
+    Parameter('k_syn', 100)
+    Parameter('k_deg', 1)
+    Rule('synthesis', None >> A(), k_syn)
+    Rule('degradation', A() >> None, k_deg)
+    Observable('A_total', A())
+
+    # The stationary distribution is Poisson with mean k_syn / k_deg
+    sim = SsaSimulator(model, tspan=np.linspace(0, 1000, 1001))
+    for method in ('direct', 'tau_leaping', 'hybrid'):
+        a_total = sim.run(seed=_SSA_SEED,
+                          method=method).observables['A_total'][100:]
+        assert abs(np.mean(a_total) - 100) < 5
+        assert abs(np.var(a_total) - 100) < 25
+
+
+def test_ssa_tau_leaping_earm():
+    tspan = np.linspace(0, 1000, 10)
+    sim = SsaSimulator(earm_1_0.model, tspan=tspan)
+    for method in ('tau_leaping', 'hybrid'):
+        simres = sim.run(n_runs=2, seed=_SSA_SEED, method=method)
+        assert np.all(simres.species[0] >= 0)
+        if method == 'tau_leaping':
+            # Tau leaping only moves whole numbers of molecules
+            assert np.all(simres.species[0] == np.round(simres.species[0]))
+
+
+@with_model
+def test_ssa_dimerization_propensity():
+    Monomer('A', ['b'])
+    Parameter('kf', 1)
+    Rule('dimerize', A(b=None) + A(b=None) >> A(b=1) % A(b=1), kf)
+    Initial(A(b=None), Parameter('A_0', 3))
+    Observable('A_free', A(b=None))
+
+    # With three copies of A, one dimer forms; the remaining monomer
+    # cannot react with itself
+    sim = SsaSimulator(model, tspan=np.linspace(0, 1000, 3))
+    assert sim.run(seed=_SSA_SEED).observables['A_free'][-1] == 1
+
+
+def test_ssa_parallel_reproducible():
+    sim = SsaSimulator(robertson.model, tspan=np.linspace(0, 10, 5))
+    param_values = np.tile(sim.param_values[0], (3, 1))
+    res1 = sim.run(param_values=param_values, n_runs=4, seed=_SSA_SEED)
+    res2 = sim.run(param_values=param_values, n_runs=4, seed=_SSA_SEED,
+                   num_processors=2)
+    assert len(res2.species) == 12
+    for sp1, sp2 in zip(res1.species, res2.species):
+        assert np.array_equal(sp1, sp2)
+    # Each simulation has its own random number stream
+    assert not all(np.array_equal(res1.species[0], sp)
+                   for sp in res1.species[1:])
@@ -25,7 +25,7 @@ def main():
                     'pysb.testing', 'pysb.tests'],
           scripts=['scripts/pysb_export'],
           # We should really specify some minimum versions here.
-          install_requires=['numpy', 'scipy>=1.1', 'sympy', 'networkx',
+          install_requires=['numpy', 'scipy>=1.1', 'sympy', 'networkx>=2.4',
                             'futures; python_version == "2.7"'],
           setup_requires=['nose'],
           tests_require=['coverage', 'pygraphviz', 'matplotlib', 'pexpect',